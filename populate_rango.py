@@ -4,7 +4,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tango_django_project.settings')
 
 import django
 django.setup()
-from rango.models import Category, Page
+from rango.loader import load_records
+from rango.models import Page
 
 
 def populate():
@@ -38,52 +39,29 @@ def populate():
          "url": "http://flask.pocoo.org"}
     ]
 
-    cats = {"Python": {"pages": python_pages},
-            "Django": {"pages": django_pages},
-            "Other Frameworks": {"pages": other_pages}}
+    cats = {"Python": {"pages": python_pages, "views": 128, "likes": 64},
+            "Django": {"pages": django_pages, "views": 64, "likes": 32},
+            "Other Frameworks": {"pages": other_pages, "views": 32, "likes": 16}}
 
     # If you want to add more categories or pages, add them to the dictionaries above
-    # The code below goes through the cats dictionary, then adds each category and then adds all the associated pages
-    #  for that category
+    # The code below turns the cats dictionary into one record per category and one per page, and hands them to the
+    #  bulk loader (the same one behind `python manage.py load_rango`), which adds or updates them in a few queries
     # If you are using Python 2.x then use cats.iteritems()
     # If you are using Python 3.x, then use cats.items()
     # See http://docs.quantifiedcode.com/python-anti-patterns/readability/ for more info about how to iterate over a
     # dictionary properly
 
+    records = []
     for cat, cat_data in cats.iteritems():
-        user_category = add_cat(cat)
+        records.append({"category": cat, "views": cat_data["views"], "likes": cat_data["likes"]})
         for user_page in cat_data["pages"]:
-            add_page(user_category, user_page["title"], user_page["url"], 15)
+            records.append({"category": cat, "title": user_page["title"], "url": user_page["url"], "views": 15})
 
-    # Print out the categories and their pages we have added
-    for category in Category.objects.all():
-        for page in Page.objects.filter(category=category):
-            print "{0} - {1}".format(str(category), str(page))
-
-
-def add_cat(category_name):
-    category = Category.objects.get_or_create(name=category_name)[0]
-
-    if category_name == 'Django':
-        category.views = 64
-        category.likes = 32
-    elif category_name == 'Python':
-        category.views = 128
-        category.likes = 64
-    elif category_name == 'Other Frameworks':
-        category.views = 32
-        category.likes = 16
+    load_records(records)
 
-    category.save()
-    return category
-
-
-def add_page(category_obj, page_title, page_url, page_views=0):
-    page = Page.objects.get_or_create(category=category_obj, title=page_title)[0]
-    page.url = page_url
-    page.views = page_views
-    page.save()
-    return page
+    # Print out the categories and their pages we have added
+    for page in Page.objects.select_related('category').order_by('category', 'id'):
+        print "{0} - {1}".format(str(page.category), str(page))
 
 
 if __name__ == '__main__':
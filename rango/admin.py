@@ -1,13 +1,21 @@
 from django.contrib import admin
 
-from rango.models import Category, Page, UserProfile
+from rango.models import Category, CategorySlugHistory, DailyVisitors, LinkCheck, Page, UserProfile
 
 
-class CategoryAdmin(admin.ModelAdmin):
-    def page_count(self, obj):
-        return obj.page_set.count()
+class CategorySlugHistoryInline(admin.TabularInline):
+    # Old slugs that redirect to the category
+    model = CategorySlugHistory
+    readonly_fields = ['renamed_at']
+    extra = 0
+
 
-    list_display = ['name', 'page_count', 'views', 'likes']
+class CategoryAdmin(admin.ModelAdmin):
+    # page_count is a stored column, so the changelist needs no per-row COUNT query and can be sorted by it
+    list_display = ['name', 'parent', 'depth', 'page_count', 'views', 'likes']
+    list_select_related = ['parent']
+    # A drop-down of every category doesn't scale to thousands of them
+    raw_id_fields = ['parent']
 
     """
     We have a problem with slug field being user editable and not pre-populated.
@@ -24,17 +32,62 @@ class CategoryAdmin(admin.ModelAdmin):
     category name
     """
     prepopulated_fields = {'slug': ('name', )}
+    inlines = [CategorySlugHistoryInline]
+
+
+class LinkStatusFilter(admin.SimpleListFilter):
+    """
+    Filter pages on the outcome of the latest check of their URL (see the check_links command).
+    """
+    title = 'link status'
+    parameter_name = 'link'
+
+    def lookups(self, request, model_admin):
+        return [('ok', 'Working'), ('broken', 'Broken'), ('unchecked', 'Not checked yet')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'ok':
+            return queryset.filter(link_check__ok=True)
+        if self.value() == 'broken':
+            return queryset.filter(link_check__ok=False)
+        if self.value() == 'unchecked':
+            return queryset.filter(link_check__isnull=True)
+        return queryset
 
 
 class PageAdmin(admin.ModelAdmin):
     def page_url(self, obj):
         return obj.url
 
+    def link_status(self, obj):
+        try:
+            link_check = obj.link_check
+        except LinkCheck.DoesNotExist:
+            return '-'
+        if link_check.ok:
+            return link_check.status
+        return link_check.status or link_check.error
+
     page_url.short_description = 'URL'
-    list_display = ['title', 'category', 'page_url', 'views']
-    list_filter = ['category']
+    list_display = ['title', 'category', 'page_url', 'views', 'link_status']
+    list_filter = [LinkStatusFilter, 'category']
+    list_select_related = ['category', 'link_check']
+
+
+class LinkCheckAdmin(admin.ModelAdmin):
+    list_display = ['page', 'ok', 'status', 'latency', 'final_url', 'title', 'error', 'checked_at']
+    list_filter = ['ok', 'status']
+    list_select_related = ['page']
+    ordering = ['-checked_at']
+
+
+class DailyVisitorsAdmin(admin.ModelAdmin):
+    list_display = ['date', 'visitors']
+    date_hierarchy = 'date'
 
 
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Page, PageAdmin)
-admin.site.register(UserProfile)
\ No newline at end of file
+admin.site.register(UserProfile)
+admin.site.register(DailyVisitors, DailyVisitorsAdmin)
+admin.site.register(LinkCheck, LinkCheckAdmin)
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Read-only JSON API, mounted under /rango/api/.
+
+Every response carries an ETag made of the version stamps (see rango/versions.py) of the data it shows. The signal
+receivers in rango/signals.py bump those stamps when categories or pages are saved, and when their counters are
+flushed. A client polling with If-None-Match therefore gets a 304 for the cost of a single cache lookup until
+something actually changed.
+
+Rows are read with .values(), so no model instances are built, and a ?fields= parameter narrows them further, e.g.
+/rango/api/categories/?fields=name,slug. The category list is streamed, however long it gets.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition, require_safe
+
+from rango.db_router import replica_reads
+from rango.leaderboard import top_pages
+from rango.models import Category, Page
+from rango.pagination import paginate_pages
+from rango.versions import bump_versions, get_versions
+
+# Bumped when every API response is stale, e.g. because categories were added, renamed or removed
+ALL_API = 'api'
+CATEGORIES_API = 'api:categories'
+TOP_PAGES_API = 'api:pages'
+CATEGORY_API = 'api:category:{category_name_slug}'
+
+CATEGORY_FIELDS = ('id', 'name', 'slug', 'views', 'likes', 'page_count')
+PAGE_FIELDS = ('id', 'title', 'url', 'views')
+
+# Rows of the category list read from the database at a time while streaming it
+STREAM_CHUNK_SIZE = 500
+
+
+def bump_api_versions(category_slugs=(), everything=False):
+    """
+    Change the ETags of the category list, the top pages and the given categories, or of every API response.
+    """
+    if everything:
+        bump_versions([ALL_API])
+    else:
+        categories = [CATEGORY_API.format(category_name_slug=slug) for slug in category_slugs if slug]
+        bump_versions([CATEGORIES_API, TOP_PAGES_API] + categories)
+
+
+def versions_etag(*groups):
+    def etag(request, **kwargs):
+        return '.'.join(get_versions([ALL_API] + [group.format(**kwargs) for group in groups]))
+    return etag
+
+
+def get_fields(request, available):
+    """
+    The fields listed in ?fields= that the endpoint knows about, in the endpoint's order; all of them by default.
+    """
+    requested = set(request.GET.get('fields', '').split(','))
+    return [field for field in available if field in requested] or list(available)
+
+
+def project(row, fields):
+    return dict((field, row[field]) for field in fields)
+
+
+def stream_json_list(rows):
+    yield '['
+    for number, row in enumerate(rows):
+        yield (',\n' if number else '') + json.dumps(row, cls=DjangoJSONEncoder)
+    yield ']'
+
+
+def stream_categories(fields):
+    # The rows are only read once the response is being sent, after the view has returned
+    with replica_reads():
+        last_id = 0
+        while True:
+            chunk = list(Category.objects.filter(id__gt=last_id).order_by('id').values(*(set(fields) | {'id'}))
+                         [:STREAM_CHUNK_SIZE])
+            for row in chunk:
+                yield project(row, fields)
+            if len(chunk) < STREAM_CHUNK_SIZE:
+                return
+            last_id = chunk[-1]['id']
+
+
+@require_safe
+@condition(etag_func=versions_etag(CATEGORIES_API))
+def category_list(request):
+    fields = get_fields(request, CATEGORY_FIELDS)
+    return StreamingHttpResponse(stream_json_list(stream_categories(fields)), content_type='application/json')
+
+
+@require_safe
+@condition(etag_func=versions_etag(CATEGORY_API))
+@replica_reads()
+def category_detail(request, category_name_slug):
+    """
+    A category and one batch of its pages, most viewed first. Follow "next" for the batch after it.
+    """
+    category = Category.objects.filter(slug=category_name_slug).values(*CATEGORY_FIELDS).first()
+    if category is None:
+        return JsonResponse({'error': 'No such category.'}, status=404)
+
+    page_fields = get_fields(request, PAGE_FIELDS)
+    pages, next_cursor = paginate_pages(Page.objects.filter(category=category['id']).values(*PAGE_FIELDS),
+                                        request.GET.get('after'))
+
+    next_url = None
+    if next_cursor is not None:
+        query = request.GET.copy()
+        query['after'] = next_cursor
+        next_url = '%s?%s' % (request.path, query.urlencode())
+
+    return JsonResponse({'category': project(category, get_fields(request, CATEGORY_FIELDS)),
+                         'pages': [project(page, page_fields) for page in pages],
+                         'next': next_url})
+
+
+@require_safe
+@condition(etag_func=versions_etag(TOP_PAGES_API))
+def top_page_list(request):
+    fields = get_fields(request, PAGE_FIELDS + ('category_id',))
+    return JsonResponse({'pages': [project(page, fields) for page in top_pages()]})
@@ -1,7 +1,16 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.core.checks import register
 
 
 class RangoConfig(AppConfig):
     name = 'rango'
+
+    def ready(self):
+        # Importing the module connects the signal receivers that keep the caches in step with the models
+        import rango.signals  # noqa
+
+        # The system checks refusing sessions and users cached per process (see rango/checks.py)
+        from rango.checks import check_session_cache
+        register(check_session_cache)
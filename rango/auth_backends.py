@@ -0,0 +1,47 @@
+"""
+Authentication backend loading the logged-in user from the cache.
+
+Django loads the User of an authenticated request from the database (once per request, see
+django.contrib.auth.middleware). CachedModelBackend keeps the user, along with its UserProfile - fetched with the same
+query through select_related - in the SESSION_CACHE_ALIAS cache for RANGO_USER_CACHE_TIMEOUT seconds. The signal
+receivers in rango/signals.py drop the entry whenever the User or UserProfile is saved or deleted.
+
+That cache has to be shared by every process (e.g. memcached or redis): with a cache of its own, each process would
+keep serving the user it cached after another process deactivated them or changed their password. The checks in
+rango/checks.py refuse to start with a per-process cache.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+from rango.profiling import record_cache_lookup
+
+USER_KEY = 'rango:user:%s'
+
+
+def get_user_cache():
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def forget_user(user_id):
+    get_user_cache().delete(USER_KEY % user_id)
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        cache = get_user_cache()
+        key = USER_KEY % user_id
+        user = cache.get(key)
+        record_cache_lookup(user is not None)
+        if user is not None:
+            return user
+
+        user_model = get_user_model()
+        try:
+            user = user_model._default_manager.select_related('userprofile').get(pk=user_id)
+        except user_model.DoesNotExist:
+            return None
+
+        cache.set(key, user, getattr(settings, 'RANGO_USER_CACHE_TIMEOUT', 300))
+        return user
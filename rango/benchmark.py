@@ -0,0 +1,240 @@
+"""
+Benchmarks for the rango views.
+
+A synthetic dataset is loaded into a throwaway test database, then every scenario is driven through Django's test
+client (one request at a time, with query counts), and the anonymous GET scenarios additionally through a pool of
+threads calling the WSGI application directly. Finally, index.html and category.html are rendered on their own with
+and without the cached template loader and fragment caching. Results are plain dicts, ready to be dumped as JSON and
+diffed across commits. Run it with `python manage.py rango_bench`.
+"""
+import threading
+import time
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from rango.counters import flush_counters
+from rango.leaderboard import top_categories, top_pages
+from rango.loader import load_records
+from rango.models import Category, Page
+from rango.pagination import paginate_pages
+from rango.slugs import resolve_category
+
+BENCH_USERNAME = 'rango-bench'
+BENCH_PASSWORD = 'rango-bench'
+
+
+def synthetic_records(categories, pages):
+    for c in range(categories):
+        yield {'category': 'Bench Category %d' % c, 'views': c, 'likes': (c * 7919) % 1000}
+    for p in range(pages):
+        yield {'category': 'Bench Category %d' % (p % categories),
+               'title': 'Bench page %d' % p,
+               'url': 'http://bench.example.com/%d/' % p,
+               'views': (p * 104729) % 10000}
+
+
+def seed(categories, pages, batch_size=500):
+    """
+    Load the synthetic dataset and create the benchmark user. Loading is idempotent and the user is only created once,
+    so this also works on a database kept from a previous run (rango_bench --keepdb).
+    """
+    stats = load_records(synthetic_records(categories, pages), batch_size=batch_size)
+    if not User.objects.filter(username=BENCH_USERNAME).exists():
+        User.objects.create_superuser(BENCH_USERNAME, 'bench@example.com', BENCH_PASSWORD)
+    return {'categories': categories, 'pages': pages, 'seconds': stats.elapsed, 'rows_per_sec': stats.rows_per_second}
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+
+    def at(p):
+        return values[max(int(round(p / 100.0 * len(values))) - 1, 0)]
+    return {'p50': at(50), 'p95': at(95), 'p99': at(99), 'max': values[-1]}
+
+
+def summarise(latencies, elapsed, query_counts=None, errors=0):
+    summary = {'requests': len(latencies),
+               'errors': errors,
+               'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+               'latency_ms': percentiles([latency * 1000 for latency in latencies])}
+    if query_counts is not None:
+        summary['queries'] = {'mean': float(sum(query_counts)) / len(query_counts) if query_counts else 0.0,
+                              'max': max(query_counts) if query_counts else 0}
+    return summary
+
+
+def scenarios(slugs):
+    """
+    (name, authenticated, method, path factory, data factory) for every scenario; the factories take the request
+    number so that requests rotate over the categories and POSTs create distinct rows.
+    """
+    def category_path(i):
+        return '/rango/category/%s/' % slugs[i % len(slugs)]
+
+    def add_page_path(i):
+        return '/rango/category/%s/add_page/' % slugs[i % len(slugs)]
+
+    return [
+        ('index (anonymous)', False, 'get', lambda i: '/rango/', None),
+        ('index (logged in)', True, 'get', lambda i: '/rango/', None),
+        ('about (anonymous)', False, 'get', lambda i: '/rango/about/', None),
+        ('about (logged in)', True, 'get', lambda i: '/rango/about/', None),
+        ('show_category (anonymous)', False, 'get', category_path, None),
+        ('show_category (logged in)', True, 'get', category_path, None),
+        ('add_category', True, 'post', lambda i: '/rango/add_category/',
+         lambda i: {'name': 'Bench new category %d' % i, 'views': 0, 'likes': 0}),
+        ('add_page', True, 'post', add_page_path,
+         lambda i: {'title': 'Bench new page %d' % i, 'url': 'http://bench.example.com/new/%d/' % i, 'views': 0}),
+    ]
+
+
+def run_client_scenarios(requests, slugs):
+    anonymous = Client()
+    logged_in = Client()
+    logged_in.login(username=BENCH_USERNAME, password=BENCH_PASSWORD)
+
+    results = {}
+    for name, authenticated, method, path, data in scenarios(slugs):
+        client = logged_in if authenticated else anonymous
+        latencies = []
+        query_counts = []
+        errors = 0
+
+        started = time.time()
+        for i in range(requests):
+            kwargs = {'data': data(i)} if data else {}
+            with CaptureQueriesContext(connection) as queries:
+                request_started = time.time()
+                response = getattr(client, method)(path(i), **kwargs)
+                latencies.append(time.time() - request_started)
+            query_counts.append(len(queries))
+            if response.status_code >= 400:
+                errors += 1
+
+        results[name] = summarise(latencies, time.time() - started, query_counts, errors)
+    return results
+
+
+def run_wsgi_scenarios(requests, concurrency, slugs):
+    from tango_django_project.wsgi import application
+
+    def environ_for(path):
+        environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET', 'HTTP_HOST': 'localhost'}
+        setup_testing_defaults(environ)
+        return environ
+
+    def call(path, latencies, errors, lock):
+        status = []
+        request_started = time.time()
+        body = application(environ_for(path), lambda s, headers, exc_info=None: status.append(s))
+        try:
+            for chunk in body:
+                pass
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        with lock:
+            latencies.append(time.time() - request_started)
+            if not status[0].startswith(('2', '3')):
+                errors.append(status[0])
+
+    results = {}
+    for name, authenticated, method, path, data in scenarios(slugs):
+        if authenticated or method != 'get':
+            continue
+
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        counter = iter(range(requests))
+
+        def worker():
+            for i in counter:
+                call(path(i), latencies, errors, lock)
+            connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        started = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        results[name] = summarise(latencies, time.time() - started, errors=len(errors))
+        results[name]['concurrency'] = concurrency
+    return results
+
+
+def template_settings(cached_loader, cache_fragments):
+    """
+    Settings switching the cached template loader and base.html's fragment caching on or off.
+    """
+    loaders = ['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader']
+    if cached_loader:
+        loaders = [('django.template.loaders.cached.Loader', loaders)]
+
+    engine = dict(settings.TEMPLATES[0], APP_DIRS=False)
+    engine['OPTIONS'] = dict(engine['OPTIONS'], loaders=loaders)
+    # A fragment cached for no time at all is rendered afresh every time
+    return override_settings(TEMPLATES=[engine], RANGO_FRAGMENT_CACHE_TIMEOUT=300 if cache_fragments else 0)
+
+
+def run_template_scenarios(requests, slugs):
+    request = RequestFactory().get('/rango/')
+    request.user = User.objects.get(username=BENCH_USERNAME)
+
+    category = resolve_category(slugs[0])
+    pages, next_cursor = paginate_pages(Page.objects.filter(category=category.id))
+    templates = [
+        ('index.html', {'categories': top_categories(), 'pages': top_pages()}),
+        ('category.html', {'category': category, 'pages': pages, 'next_cursor': next_cursor, 'is_first_batch': True}),
+    ]
+    configurations = [
+        ('uncached loader', False, False),
+        ('cached loader', True, False),
+        ('cached loader + fragments', True, True),
+    ]
+
+    results = {}
+    for template, context in templates:
+        for configuration, cached_loader, cache_fragments in configurations:
+            with template_settings(cached_loader, cache_fragments):
+                # One render to warm up whatever is cached
+                render_to_string('rango/' + template, context, request=request)
+
+                latencies = []
+                started = time.time()
+                for i in range(requests):
+                    render_started = time.time()
+                    render_to_string('rango/' + template, context, request=request)
+                    latencies.append(time.time() - render_started)
+
+            results['%s (%s)' % (template, configuration)] = summarise(latencies, time.time() - started)
+    return results
+
+
+# The POST scenarios all come from one user, who would otherwise be rate limited (see rango/ratelimit.py) well before
+# the end of a run
+@override_settings(RANGO_RATE_LIMITS={})
+def run(categories, pages, requests, concurrency):
+    """
+    Seed the current (test) database and run every benchmark. Returns the report as a dict.
+    """
+    cache.clear()
+    report = {'dataset': seed(categories, pages)}
+    slugs = list(Category.objects.order_by('id').values_list('slug', flat=True))
+
+    report['test_client'] = run_client_scenarios(requests, slugs)
+    report['wsgi'] = run_wsgi_scenarios(requests, concurrency, slugs)
+    report['templates'] = run_template_scenarios(requests, slugs)
+    flush_counters()
+    return report
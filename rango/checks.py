@@ -0,0 +1,35 @@
+"""
+System checks run by manage.py (runserver, migrate, check, ...) before anything else, registered by RangoConfig.
+"""
+from django.conf import settings
+from django.core.checks import Error
+
+# Cache backends whose entries only live inside the process that wrote them
+PER_PROCESS_CACHES = ('django.core.cache.backends.locmem.LocMemCache', )
+
+CACHED_SESSION_ENGINES = ('django.contrib.sessions.backends.cache', 'django.contrib.sessions.backends.cached_db')
+
+
+def session_cache_is_per_process():
+    backend = settings.CACHES.get(settings.SESSION_CACHE_ALIAS, {}).get('BACKEND')
+    return backend in PER_PROCESS_CACHES
+
+
+def check_session_cache(app_configs, **kwargs):
+    """
+    Sessions and users cached per process outlive a logout, deactivation or password change made through another
+    process, so they are only allowed in a cache every process shares.
+    """
+    if not session_cache_is_per_process():
+        return []
+
+    hint = ("Point SESSION_CACHE_ALIAS at a cache shared by every process, such as memcached or redis, or keep the "
+            "default database sessions and authentication backend.")
+    errors = []
+    if settings.SESSION_ENGINE in CACHED_SESSION_ENGINES:
+        errors.append(Error("%s keeps sessions in the '%s' cache, which is local to each process." % (
+            settings.SESSION_ENGINE, settings.SESSION_CACHE_ALIAS), hint=hint, id='rango.E001'))
+    if 'rango.auth_backends.CachedModelBackend' in settings.AUTHENTICATION_BACKENDS:
+        errors.append(Error("CachedModelBackend keeps users in the '%s' cache, which is local to each process." %
+                            settings.SESSION_CACHE_ALIAS, hint=hint, id='rango.E002'))
+    return errors
@@ -0,0 +1,17 @@
+"""
+Splitting long lists of ids into chunks that fit in a single statement.
+
+SQLite refuses statements with more than 999 parameters, so every query filtering on a list of ids (pk__in=...) or
+inserting many rows at once takes them CHUNK_SIZE at a time, which leaves room for the other parameters of the
+statement. Statements taking several parameters per id pass a smaller size.
+"""
+CHUNK_SIZE = 500
+
+
+def chunked(items, size=CHUNK_SIZE):
+    """
+    Yield successive lists of at most size items of items, which may be any iterable.
+    """
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from rango.sidebar import get_sidebar_version
+
+
+def fragment_cache(request):
+    """
+    What base.html keys and times its cached fragments with. The sidebar version is only looked up if a template
+    actually renders the sidebar.
+    """
+    return {'fragment_cache_timeout': getattr(settings, 'RANGO_FRAGMENT_CACHE_TIMEOUT', 300),
+            'sidebar_version': SimpleLazyObject(get_sidebar_version)}
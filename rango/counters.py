@@ -0,0 +1,174 @@
+"""
+Write-coalesced view and like counters.
+
+Increments are collected in memory per process and written out in batches of F() expression UPDATEs, one query per
+(model, field, increment) group, so counting a view costs a dictionary update instead of a database write and
+concurrent writers never overwrite each other's counts.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.dispatch import Signal
+from django.utils import timezone
+
+from rango.chunks import chunked
+from rango.models import Category, DailyVisitors, Page
+from rango.trending import record_activity
+
+logger = logging.getLogger(__name__)
+
+# Sent after a flush was written, with the dict of (model, field, lookup, key) -> amount that went out
+counters_flushed = Signal(providing_args=['increments'])
+
+# Counters kept in rows of their own, which are created on the first increment rather than up front
+CREATE_MISSING_ROWS = (DailyVisitors, )
+
+# update() bypasses auto_now, so the counter UPDATEs of these models set their modified timestamp themselves
+TIMESTAMPED_MODELS = (Category, Page)
+
+
+class CounterBuffer(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._increments = 0
+        self._last_flush = time.time()
+
+    def add(self, model, field, key, amount=1, lookup='pk'):
+        """
+        Add amount to field of the row whose lookup column (the primary key unless told otherwise) equals key.
+        """
+        if lookup == 'pk':
+            key = int(key)
+
+        with self._lock:
+            self._pending[(model, field, lookup, key)] += amount
+            self._increments += 1
+            due = (self._increments >= getattr(settings, 'RANGO_COUNTER_FLUSH_THRESHOLD', 500) or
+                   time.time() - self._last_flush >= getattr(settings, 'RANGO_COUNTER_FLUSH_INTERVAL', 10))
+
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Write every pending increment to the database.
+        If the write fails, the increments are put back so that they go out with the next flush instead of being lost.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._increments = 0
+            self._last_flush = time.time()
+
+        if not pending:
+            return
+
+        try:
+            write_increments(pending)
+        except Exception:
+            logger.exception("Could not flush %d counter increments, keeping them for the next flush", len(pending))
+            with self._lock:
+                for key, amount in pending.items():
+                    self._pending[key] += amount
+            return
+
+        counters_flushed.send(sender=self.__class__, increments=pending)
+
+
+def write_increments(pending):
+    """
+    pending maps (model, field, lookup, key) to the amount to add.
+    Rows that received the same increment are updated together, so a busy page and a quiet one share one UPDATE.
+    """
+    groups = defaultdict(list)
+    for (model, field, lookup, key), amount in pending.items():
+        if amount:
+            groups[(model, field, lookup, amount)].append(key)
+
+    now = timezone.now()
+    with transaction.atomic():
+        for (model, field, lookup, amount), keys in groups.items():
+            changes = {field: F(field) + amount}
+            if model in TIMESTAMPED_MODELS:
+                changes['modified'] = now
+            for chunk in chunked(keys):
+                if model in CREATE_MISSING_ROWS:
+                    create_missing_rows(model, lookup, chunk)
+                model.objects.filter(**{lookup + '__in': chunk}).update(**changes)
+
+        # The same increments, by the hour, for the trending rankings
+        record_activity(pending)
+
+
+def create_missing_rows(model, lookup, keys):
+    existing = set(model.objects.filter(**{lookup + '__in': keys}).values_list(lookup, flat=True))
+    missing = [model(**{lookup: key}) for key in keys if key not in existing]
+    if not missing:
+        return
+
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create(missing)
+    except IntegrityError:
+        # Another process created the same rows first; the UPDATE that follows counts into theirs
+        pass
+
+
+_buffer = CounterBuffer()
+
+# Don't drop whatever is still buffered when the process shuts down
+atexit.register(_buffer.flush)
+
+
+def track_page_view(page_id):
+    _buffer.add(Page, 'views', page_id)
+
+
+def track_category_view(category_slug):
+    # Counted by slug so that it can be recorded straight from the URL, even when the page comes from the cache
+    _buffer.add(Category, 'views', category_slug, lookup='slug')
+
+
+def like_category(category_id):
+    _buffer.add(Category, 'likes', category_id)
+
+
+def record_unique_visitor(day):
+    _buffer.add(DailyVisitors, 'visitors', day, lookup='date')
+
+
+def flush_counters():
+    _buffer.flush()
+
+
+def recount_category_pages(category_ids=None):
+    """
+    Recompute Category.page_count from the Page table, for the given categories or for all of them.
+    This is one grouped COUNT query plus one UPDATE per distinct count for every chunk of categories.
+    """
+    if category_ids is None:
+        recount_pages_of(Category.objects.all(), Page.objects.all())
+        return
+
+    for chunk in chunked(category_ids):
+        recount_pages_of(Category.objects.filter(pk__in=chunk), Page.objects.filter(category__in=chunk))
+
+
+def recount_pages_of(categories, pages):
+    by_count = defaultdict(list)
+    for category_id, page_count in pages.values_list('category').annotate(n=Count('id')).order_by():
+        by_count[page_count].append(category_id)
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Categories without any page don't show up in the grouped query at all
+        categories.update(page_count=0, modified=now)
+        for page_count, pks in by_count.items():
+            for chunk in chunked(pks):
+                Category.objects.filter(pk__in=chunk).update(page_count=page_count, modified=now)
@@ -0,0 +1,120 @@
+"""
+Routing of read-only queries to database replicas.
+
+Reads go to the primary ('default') database unless they are made inside a replica_reads() block, which the read-only
+views (index, show_category) and the category sidebar tag use. Within such a block, reads go to one of the aliases
+listed in RANGO_READ_REPLICAS, picked at random, except when the current request is pinned to the primary:
+
+- once the request itself has written anything, so it reads back its own writes
+- for RANGO_REPLICA_PIN_SECONDS after the client made a write (see ReplicaPinningMiddleware), so that e.g. the
+  category page shown right after adding a page lists it, even if the replicas haven't caught up yet
+
+Writes always go to the primary, and migrations only run there.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.utils.decorators import ContextDecorator
+
+PIN_COOKIE_NAME = 'rango_primary'
+
+_state = threading.local()
+
+
+def get_replicas():
+    return getattr(settings, 'RANGO_READ_REPLICAS', [])
+
+
+def get_pin_seconds():
+    return getattr(settings, 'RANGO_REPLICA_PIN_SECONDS', 5)
+
+
+def get_health_check_idle_seconds():
+    return getattr(settings, 'RANGO_DB_HEALTH_CHECK_IDLE', 30)
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False) or getattr(_state, 'wrote', False)
+
+
+def reset_state(pinned=False):
+    _state.pinned = pinned
+    _state.wrote = False
+
+
+class replica_reads(ContextDecorator):
+    """
+    Send the reads made inside the block (or decorated function) to a replica, when not pinned to the primary.
+    """
+
+    def __enter__(self):
+        self.previous = getattr(_state, 'use_replicas', False)
+        _state.use_replicas = True
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _state.use_replicas = self.previous
+
+
+class ReadReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if replicas and getattr(_state, 'use_replicas', False) and not is_pinned():
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in get_replicas()
+
+
+class ReplicaPinningMiddleware(object):
+    """
+    Pin the requests of a client that just wrote to the database to the primary, through a short-lived cookie.
+    Only unsafe (e.g. POST) requests set the cookie, so the writes made while serving a GET - buffered counters,
+    sessions - don't take readers off the replicas.
+    """
+
+    def process_request(self, request):
+        reset_state(pinned=PIN_COOKIE_NAME in request.COOKIES)
+
+    def process_response(self, request, response):
+        if getattr(_state, 'wrote', False) and request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(PIN_COOKIE_NAME, '1', max_age=get_pin_seconds(), httponly=True)
+        reset_state()
+        return response
+
+
+def mark_checked(connection):
+    connection.rango_checked_at = time.time()
+
+
+def check_connections():
+    """
+    Close the persistent connections (see CONN_MAX_AGE) the database server has dropped in the meantime, so that
+    the next query opens a new one rather than failing.
+
+    Only the connections that haven't been opened or checked for RANGO_DB_HEALTH_CHECK_IDLE seconds are pinged. The
+    ping keeps the server from dropping them as idle, so each connection costs at most one ping every that many
+    seconds, and the requests in between - those served from the cache included - none at all.
+    """
+    now = time.time()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        if now - getattr(connection, 'rango_checked_at', 0) <= get_health_check_idle_seconds():
+            continue
+
+        if connection.is_usable():
+            mark_checked(connection)
+        else:
+            connection.close()
@@ -0,0 +1,157 @@
+"""
+Streaming exports of categories and pages, for analytics.
+
+An export is produced as an iterator of byte strings, CSV or JSON Lines, optionally gzipped, so that the export_rango
+command and the staff-only /rango/_export/ endpoint can write it out as it is read, whatever the size of the tables:
+
+- rows are read with .values_list(), so no model instances are built, RANGO_EXPORT_CHUNK_SIZE at a time, each chunk
+  starting after the last id of the previous one (keyset pagination), so memory stays flat on every database backend
+- each chunk of rows is encoded, and compressed when asked to, into a single string before being handed on
+
+Exports can be incremental. Every category and page records when it last changed, counters included, in its modified
+field; an export covers the rows modified after the `since` watermark, up to its `until` watermark, which is the next
+export's `since`, so that consecutive exports cover every change once. `until` lags RANGO_EXPORT_GRACE seconds behind
+the moment the export starts: modified is set when a row is written, but the row only becomes visible once its
+transaction commits, and a change committed after an export that had already gone past its modified time would never
+be exported.
+"""
+import csv
+import json
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import six, timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes
+
+from rango.models import Category, Page
+
+# name -> (model, exported fields); the first field has to be the primary key, which the rows are paginated by
+EXPORTS = {
+    'categories': (Category, ('id', 'name', 'slug', 'parent_id', 'views', 'likes', 'page_count', 'modified')),
+    'pages': (Page, ('id', 'category_id', 'title', 'url', 'views', 'modified')),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def get_chunk_size():
+    return getattr(settings, 'RANGO_EXPORT_CHUNK_SIZE', 1000)
+
+
+def get_grace():
+    return getattr(settings, 'RANGO_EXPORT_GRACE', 60)
+
+
+def export_until(now=None):
+    """
+    The `until` watermark of an export starting now, leaving out the rows whose transactions may not have committed yet.
+    """
+    return (now or timezone.now()) - timedelta(seconds=get_grace())
+
+
+def parse_watermark(value):
+    """
+    The datetime of an ISO 8601 watermark such as 2016-05-01T12:00:00+00:00; naive ones are taken to be in UTC.
+    Raises ValueError when value isn't one.
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError('"%s" is not an ISO 8601 date and time.' % value)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, timezone.utc)
+    return moment
+
+
+def export_chunks(name, since=None, until=None, chunk_size=None):
+    """
+    The rows of the named export modified after since and up to until, as lists of value tuples, in id order.
+    """
+    model, fields = EXPORTS[name]
+    chunk_size = chunk_size or get_chunk_size()
+
+    # Read from the primary: a lagging replica would leave out rows the watermark says were exported
+    rows = model.objects.all()
+    if since is not None:
+        rows = rows.filter(modified__gt=since)
+    if until is not None:
+        rows = rows.filter(modified__lte=until)
+
+    last_id = 0
+    while True:
+        chunk = list(rows.filter(id__gt=last_id).order_by('id').values_list(*fields)[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
+
+
+class LineBuffer(object):
+    """
+    Hands back whatever is written to it, so that csv.writer formats lines without storing them anywhere.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    if six.PY2 and isinstance(value, six.text_type):
+        # The Python 2 csv module only writes byte strings
+        return value.encode('utf-8')
+    return value
+
+
+def encode_csv(fields, chunks):
+    writer = csv.writer(LineBuffer())
+    yield force_bytes(writer.writerow(fields))
+    for chunk in chunks:
+        yield b''.join(force_bytes(writer.writerow([csv_value(value) for value in row])) for row in chunk)
+
+
+def encode_jsonl(fields, chunks):
+    for chunk in chunks:
+        yield b''.join(force_bytes(json.dumps(OrderedDict(zip(fields, row)), cls=DjangoJSONEncoder)) + b'\n'
+                       for row in chunk)
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'jsonl': encode_jsonl,
+}
+
+
+def gzip_stream(strings):
+    # 16 + MAX_WBITS makes zlib write a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for string in strings:
+        compressed = compressor.compress(string)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export(name, file_format, since=None, until=None, compress=False, chunk_size=None):
+    """
+    Stream the named export ('categories' or 'pages') in file_format ('csv' or 'jsonl'), gzipped when compress is set.
+    The rows are only read as the returned iterator is consumed.
+    """
+    fields = EXPORTS[name][1]
+    strings = ENCODERS[file_format](fields, export_chunks(name, since, until, chunk_size))
+    return gzip_stream(strings) if compress else strings
+
+
+def export_filename(name, file_format, compress=False, until=None):
+    until = until or timezone.now()
+    return 'rango-%s-%s.%s%s' % (name, until.strftime('%Y%m%dT%H%M%SZ'), file_format, '.gz' if compress else '')
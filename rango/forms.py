@@ -1,7 +1,9 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.models import User
 
 from rango.models import Category, Page, UserProfile
+from rango.urlcanon import url_hash
 from constants import FieldConstants
 
 
@@ -10,12 +12,15 @@ class CategoryForm(forms.ModelForm):
     views = forms.IntegerField(widget=forms.HiddenInput(), initial=0)
     likes = forms.IntegerField(widget=forms.HiddenInput(), initial=0)
     slug = forms.CharField(widget=forms.HiddenInput(), required=False)
+    # Set from ?parent=<slug> when adding a subcategory
+    parent = forms.ModelChoiceField(queryset=Category.objects.all(), to_field_name='slug', required=False,
+                                    widget=forms.HiddenInput())
 
     # An inline class to provide additional information on the form.
     class Meta:
         # Provide an association between the ModelForm and a model
         model = Category
-        fields = ('name',)
+        fields = ('name', 'parent')
 
 
 class PageForm(forms.ModelForm):
@@ -24,20 +29,28 @@ class PageForm(forms.ModelForm):
     url = forms.URLField(help_text="Please enter the URL for the page")
     views = forms.IntegerField(widget=forms.HiddenInput(), initial=0)
 
+    def __init__(self, *args, **kwargs):
+        # Forms validated in a batch leave the duplicate check to check_duplicate_urls(), which does it in one query
+        self.check_duplicates = kwargs.pop('check_duplicates', True)
+        super(PageForm, self).__init__(*args, **kwargs)
+
     def clean(self):
         """
         Always end the clean() method by returning the reference to cleaned_data dictionary
         Otherwise the changes won't be applied
         :return: cleaned_data dictionary
         """
-        cleaned_data = self.cleaned_data
+        cleaned_data = super(PageForm, self).clean()
         url = cleaned_data.get('url')
-        # If URL is not empty and doesn't start with 'http://', then prepend 'http://'
-        if url and not url.startswith('http://'):
+        # If URL is not empty and has no scheme, then prepend 'http://'
+        if url and not url.startswith(('http://', 'https://')):
             url = 'http://' + url
             cleaned_data['url'] = url
 
-            return cleaned_data
+        if url and self.check_duplicates:
+            check_duplicate_urls([self])
+
+        return cleaned_data
 
     class Meta:
         # Provide an association between the ModelForm and a model
@@ -53,6 +66,48 @@ class PageForm(forms.ModelForm):
         # fields = ('title', 'url', 'views', )
 
 
+def check_duplicate_urls(page_forms):
+    """
+    Flag the URL of every cleaned PageForm that points to the same place as an existing page, or as one of the forms
+    before it, with a single query whatever the number of forms. Returns whether none was flagged.
+    """
+    hashes = []
+    for form in page_forms:
+        url = form.cleaned_data.get('url')
+        if url:
+            hashes.append((form, url_hash(url)))
+    if not hashes:
+        return True
+
+    existing = dict(Page.objects.filter(canonical_url_hash__in=set(digest for form, digest in hashes))
+                    .values_list('canonical_url_hash', 'category__name'))
+    seen = set()
+    for form, digest in hashes:
+        if digest in existing:
+            form.add_error('url', "This page has already been added to the %s category." % existing[digest])
+        elif digest in seen:
+            form.add_error('url', "This page is already listed above.")
+        seen.add(digest)
+
+    return not existing and len(seen) == len(hashes)
+
+
+class BasePageFormSet(forms.BaseFormSet):
+    def get_form_kwargs(self, index):
+        kwargs = super(BasePageFormSet, self).get_form_kwargs(index)
+        kwargs['check_duplicates'] = False
+        return kwargs
+
+    def clean(self):
+        super(BasePageFormSet, self).clean()
+        check_duplicate_urls([form for form in self.forms if form.is_valid()])
+
+
+# Several pages added to a category in one go, see the add_pages view
+PageFormSet = forms.formset_factory(PageForm, formset=BasePageFormSet, extra=10,
+                                    max_num=getattr(settings, 'RANGO_BULK_ADD_MAX_PAGES', 100), validate_max=True)
+
+
 class UserForm(forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput())
 
@@ -0,0 +1,59 @@
+"""
+Queries over the category tree (see rango/paths.py for how it is stored).
+
+The totals of a subtree - how many categories and pages it holds, and how often its categories were viewed - take one
+range query over Category, the pages being counted by the stored page_count. They are cached per category, keyed by
+the tree version, which the signal receivers in rango/signals.py bump when categories or pages are added, moved or
+removed. View counts change all the time, so they may lag by up to RANGO_SUBTREE_CACHE_TIMEOUT seconds.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from rango.models import Category
+from rango.paths import ancestor_paths, subtree_filter
+from rango.profiling import record_cache_lookup
+from rango.versions import bump_versions, get_versions
+
+TOTALS_KEY = 'rango:subtree:%s:%s'
+TREE_VERSION = 'tree'
+
+
+def get_cache_timeout():
+    return getattr(settings, 'RANGO_SUBTREE_CACHE_TIMEOUT', 300)
+
+
+def subtree_totals(category):
+    """
+    Dict with the number of categories, pages and category views in the subtree of category (anything with an id and
+    a path, e.g. a CategoryRef), the category itself included.
+    """
+    key = TOTALS_KEY % (get_versions([TREE_VERSION])[0], category.id)
+    totals = cache.get(key)
+    record_cache_lookup(totals is not None)
+
+    if totals is None:
+        totals = Category.objects.filter(**subtree_filter(category.path)).aggregate(
+            categories=Count('id'), pages=Sum('page_count'), views=Sum('views'))
+        totals = dict((name, value or 0) for name, value in totals.items())
+        cache.set(key, totals, get_cache_timeout())
+
+    return totals
+
+
+def invalidate_subtree_totals():
+    bump_versions([TREE_VERSION])
+
+
+def ancestor_slugs(path):
+    """
+    The slugs of the ancestors of the category at path, with one indexed lookup - none for a root category.
+    """
+    paths = ancestor_paths(path)
+    if not paths:
+        return []
+    return list(Category.objects.filter(path__in=paths).values_list('slug', flat=True))
+
+
+def subtree_slugs(path):
+    return list(Category.objects.filter(**subtree_filter(path)).values_list('slug', flat=True))
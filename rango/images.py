@@ -0,0 +1,152 @@
+"""
+Processing of uploaded profile pictures.
+
+Once a UserProfile with a new picture has been saved, the picture is handed to a small pool of worker threads, so the
+upload request doesn't wait for it. A worker:
+
+- re-encodes the original without its metadata (EXIF, GPS position, embedded thumbnails, ...), after applying the
+  EXIF orientation
+- renders a downsized variant for every entry of RANGO_PROFILE_IMAGE_VARIANTS, as WebP when Pillow supports it
+- stores every file under a name derived from a hash of its content, so the files never change once written and can
+  be served with far-future cache headers
+- records the variants on the profile, where the profile_image template filter picks them up
+"""
+import hashlib
+import io
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils.six.moves import queue
+from PIL import Image, ImageOps, features
+
+from rango.auth_backends import forget_user
+from rango.models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIRECTORY = 'profile_images/variants'
+
+
+def get_variant_sizes():
+    return getattr(settings, 'RANGO_PROFILE_IMAGE_VARIANTS', {'thumb': 64, 'small': 160, 'medium': 480})
+
+
+def encode(image, image_format):
+    output = io.BytesIO()
+    if image_format == 'JPEG':
+        image.convert('RGB').save(output, 'JPEG', quality=85, optimize=True, progressive=True)
+    elif image_format == 'WEBP':
+        image.save(output, 'WEBP', quality=80, method=4)
+    else:
+        image.save(output, 'PNG', optimize=True)
+    return output.getvalue()
+
+
+def store(directory, data, extension):
+    """
+    Save data under a name made from its hash and return that name. Identical content maps to the same file, which
+    is only written once.
+    """
+    name = '%s/%s.%s' % (directory, hashlib.sha1(data).hexdigest()[:20], extension)
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    return name
+
+
+def process_picture(name):
+    """
+    Strip and re-store the picture saved under name and render its variants.
+    Returns the name of the cleaned original and a dict of variant name to file name.
+    """
+    with default_storage.open(name) as picture:
+        image = Image.open(picture)
+        image.load()
+
+    if hasattr(ImageOps, 'exif_transpose'):
+        image = ImageOps.exif_transpose(image)
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    # Copying the pixels into a new image leaves every piece of metadata behind
+    clean = Image.new('RGBA' if has_alpha else 'RGB', image.size)
+    clean.paste(image.convert(clean.mode))
+
+    original_format = 'PNG' if has_alpha else 'JPEG'
+    original = store('profile_images', encode(clean, original_format), original_format.lower().replace('jpeg', 'jpg'))
+
+    variant_format = 'WEBP' if features.check('webp') else original_format
+    variants = {}
+    for variant, size in get_variant_sizes().items():
+        resized = clean.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        variants[variant] = store(VARIANTS_DIRECTORY, encode(resized, variant_format),
+                                  variant_format.lower().replace('jpeg', 'jpg'))
+
+    return original, variants
+
+
+def process_profile(profile_id):
+    profile = UserProfile.objects.filter(pk=profile_id).first()
+    if profile is None or not profile.picture:
+        return
+
+    uploaded = profile.picture.name
+    original, variants = process_picture(uploaded)
+
+    # Only record the result if the user hasn't uploaded yet another picture in the meantime
+    updated = UserProfile.objects.filter(pk=profile_id, picture=uploaded).update(
+        picture=original, picture_variants=json.dumps(variants))
+
+    if updated:
+        # update() doesn't send post_save, so drop the profile cached along with the user here
+        forget_user(profile.user_id)
+
+    if updated and uploaded != original:
+        # The cleaned copy replaces the raw upload, metadata and all
+        default_storage.delete(uploaded)
+
+
+class ImagePipeline(object):
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def submit(self, profile_id):
+        self._start_workers()
+        self._queue.put(profile_id)
+
+    def _start_workers(self):
+        with self._lock:
+            if self._workers:
+                return
+            for number in range(getattr(settings, 'RANGO_IMAGE_WORKERS', 2)):
+                worker = threading.Thread(target=self._work, name='rango-images-%d' % number)
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            profile_id = self._queue.get()
+            close_old_connections()
+            try:
+                process_profile(profile_id)
+            except Exception:
+                logger.exception("Could not process the picture of profile %s", profile_id)
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+    def join(self):
+        """
+        Wait until every submitted picture has been processed.
+        """
+        self._queue.join()
+
+
+pipeline = ImagePipeline()
@@ -0,0 +1,109 @@
+"""
+Precomputed top-N leaderboards of the index page: categories by likes and pages by views.
+
+Each leaderboard is a short list of dicts kept in the cache. It is built with one indexed ORDER BY ... LIMIT query the
+first time it is needed, and from then on kept current by merging in the rows whose counters were just flushed (see
+rango/counters.py): counters only ever go up, so a row can only enter the top N by being one of those rows.
+Anything else that could reorder a leaderboard - pages being edited, moved or deleted, bulk loads - simply drops it so
+that it is rebuilt on the next read. `python manage.py rebuild_leaderboards` rebuilds them all, to reconcile
+increments that raced between processes.
+
+With a cache local to each process, those merges, drops and rebuilds only reach the process that made them, so the
+leaderboards are also rebuilt once they are RANGO_LEADERBOARD_TIMEOUT seconds old, which bounds how stale another
+process's copy can get.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from rango.models import Category, Page
+
+CATEGORIES_KEY = 'rango:leaderboard:categories'
+PAGES_KEY = 'rango:leaderboard:pages'
+
+CATEGORY_FIELDS = ('id', 'name', 'slug', 'likes')
+PAGE_FIELDS = ('id', 'title', 'url', 'views', 'category_id')
+
+
+def get_leaderboard_size():
+    return getattr(settings, 'RANGO_LEADERBOARD_SIZE', 5)
+
+
+def get_leaderboard_timeout():
+    return getattr(settings, 'RANGO_LEADERBOARD_TIMEOUT', 60)
+
+
+def by_likes(category):
+    return -category['likes'], category['id']
+
+
+def by_views(page):
+    return -page['views'], page['id']
+
+
+def query_top_categories():
+    return list(Category.objects.order_by('-likes', 'id').values(*CATEGORY_FIELDS)[:get_leaderboard_size()])
+
+
+def query_top_pages():
+    return list(Page.objects.order_by('-views', 'id').values(*PAGE_FIELDS)[:get_leaderboard_size()])
+
+
+def cached_leaderboard(key, build):
+    leaderboard = cache.get(key)
+    if leaderboard is None:
+        leaderboard = build()
+        cache.set(key, leaderboard, get_leaderboard_timeout())
+    return leaderboard
+
+
+def top_categories():
+    """
+    The most liked categories, as dicts with their id, name, slug and likes.
+    """
+    return cached_leaderboard(CATEGORIES_KEY, query_top_categories)
+
+
+def top_pages():
+    """
+    The most viewed pages, as dicts with their id, title, url, views and category_id.
+    """
+    return cached_leaderboard(PAGES_KEY, query_top_pages)
+
+
+def merge(key, rows, sort_key):
+    """
+    Merge freshly read rows into the cached leaderboard under key, if there is one.
+    """
+    leaderboard = cache.get(key)
+    if leaderboard is None:
+        # Nothing cached - the next read builds it from the database anyway
+        return
+
+    entries = dict((entry['id'], entry) for entry in leaderboard)
+    entries.update((row['id'], row) for row in rows)
+    cache.set(key, sorted(entries.values(), key=sort_key)[:get_leaderboard_size()], get_leaderboard_timeout())
+
+
+def update_categories(category_ids):
+    merge(CATEGORIES_KEY, Category.objects.filter(pk__in=list(category_ids)).values(*CATEGORY_FIELDS), by_likes)
+
+
+def update_pages(page_ids):
+    """
+    Merge the given pages into the leaderboard. Returns the ids of their categories.
+    """
+    rows = list(Page.objects.filter(pk__in=list(page_ids)).values(*PAGE_FIELDS))
+    merge(PAGES_KEY, rows, by_views)
+    return list(set(row['category_id'] for row in rows))
+
+
+def invalidate_categories():
+    cache.delete(CATEGORIES_KEY)
+
+
+def invalidate_pages():
+    cache.delete(PAGES_KEY)
+
+
+def rebuild_leaderboards():
+    cache.set_many({CATEGORIES_KEY: query_top_categories(), PAGES_KEY: query_top_pages()}, get_leaderboard_timeout())
@@ -0,0 +1,224 @@
+"""
+Checking of the URLs pages point to.
+
+Checking a URL means waiting on a remote server, so it is never done while saving a page. Instead, the check_links
+command (meant to be run periodically, e.g. from cron) picks the pages whose URL hasn't been checked recently, and
+fetches every distinct URL from a bounded pool of worker threads, following redirects and reading the page title.
+The workers don't touch the database: the results are collected by the calling thread and written in batches, one
+LinkCheck row per page.
+"""
+import re
+import socket
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.six.moves import queue
+from django.utils.six.moves.urllib.error import HTTPError, URLError
+from django.utils.six.moves.urllib.parse import urlsplit
+from django.utils.six.moves.urllib.request import HTTPRedirectHandler, Request, build_opener
+
+from constants import FieldConstants
+from rango.models import LinkCheck, Page
+
+try:
+    from html import unescape
+except ImportError:
+    from HTMLParser import HTMLParser
+    unescape = HTMLParser().unescape
+
+USER_AGENT = 'Rango link checker'
+
+# Anything else (file:, ftp:, ...) would have the checker read from places other than the web
+ALLOWED_SCHEMES = ('http', 'https')
+
+# The title is looked for at the top of the document only
+MAX_READ_BYTES = 64 * 1024
+
+TITLE_PATTERN = re.compile(br'<title[^>]*>(.*?)</title', re.IGNORECASE | re.DOTALL)
+CHARSET_PATTERN = re.compile(r'charset=["\']?([\w.:-]+)', re.IGNORECASE)
+
+LinkResult = namedtuple('LinkResult', ['ok', 'status', 'latency', 'final_url', 'title', 'error'])
+
+
+def get_concurrency():
+    return getattr(settings, 'RANGO_LINK_CHECK_CONCURRENCY', 10)
+
+
+def get_timeout():
+    return getattr(settings, 'RANGO_LINK_CHECK_TIMEOUT', 10)
+
+
+def get_max_age():
+    return getattr(settings, 'RANGO_LINK_CHECK_MAX_AGE', 24 * 60 * 60)
+
+
+def get_batch_size():
+    return getattr(settings, 'RANGO_LINK_CHECK_BATCH_SIZE', 200)
+
+
+def read_title(content, content_type):
+    match = TITLE_PATTERN.search(content)
+    if not match:
+        return ''
+
+    charset = CHARSET_PATTERN.search(content_type or '')
+    try:
+        title = match.group(1).decode(charset.group(1) if charset else 'utf-8', 'replace')
+    except LookupError:
+        title = match.group(1).decode('utf-8', 'replace')
+
+    return ' '.join(unescape(title).split())[:FieldConstants.title_max_length]
+
+
+class WebRedirectHandler(HTTPRedirectHandler):
+    """
+    Follows redirects to http and https URLs only.
+    """
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if urlsplit(newurl).scheme.lower() not in ALLOWED_SCHEMES:
+            raise HTTPError(newurl, code, "Redirected to a URL that isn't http or https", headers, fp)
+        return HTTPRedirectHandler.redirect_request(self, req, fp, code, msg, headers, newurl)
+
+
+def check_url(url, timeout=None):
+    """
+    Fetch url, following redirects, and return a LinkResult. Never raises for network or HTTP errors, which are
+    recorded in the result instead. URLs other than http and https ones are never fetched.
+    """
+    started = time.time()
+    if urlsplit(url).scheme.lower() not in ALLOWED_SCHEMES:
+        return LinkResult(False, None, 0, '', '', "Only http and https URLs are checked")
+
+    request = Request(url, headers={'User-Agent': USER_AGENT})
+    try:
+        response = build_opener(WebRedirectHandler).open(request, timeout=timeout or get_timeout())
+    except HTTPError as error:
+        return LinkResult(False, error.code, elapsed_since(started), error.geturl() or url, '', str(error.reason))
+    except (URLError, socket.error, ValueError) as error:
+        reason = getattr(error, 'reason', error)
+        return LinkResult(False, None, elapsed_since(started), '', '', str(reason)[:255])
+
+    try:
+        content_type = response.info().get('Content-Type', '')
+        content = response.read(MAX_READ_BYTES) if 'html' in content_type else b''
+    except (socket.error, ValueError) as error:
+        return LinkResult(False, response.getcode(), elapsed_since(started), response.geturl(), '', str(error)[:255])
+    finally:
+        response.close()
+
+    status = response.getcode()
+    return LinkResult(200 <= status < 300, status, elapsed_since(started), response.geturl(),
+                      read_title(content, content_type), '')
+
+
+def elapsed_since(started):
+    return int((time.time() - started) * 1000)
+
+
+def check_urls(urls, concurrency=None, timeout=None):
+    """
+    Check every URL of urls from a pool of concurrency threads, yielding (url, LinkResult) pairs as the checks
+    complete.
+    """
+    urls = list(urls)
+    pending = queue.Queue()
+    results = queue.Queue()
+    for url in urls:
+        pending.put(url)
+
+    def work():
+        while True:
+            try:
+                url = pending.get_nowait()
+            except queue.Empty:
+                return
+            results.put((url, check_url(url, timeout)))
+
+    workers = [threading.Thread(target=work, name='rango-links-%d' % number)
+               for number in range(min(concurrency or get_concurrency(), len(urls)))]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    for _ in urls:
+        yield results.get()
+
+
+def pages_due(max_age=None):
+    """
+    Pages whose URL has never been checked, or not within the last max_age seconds.
+    """
+    cutoff = timezone.now() - timedelta(seconds=get_max_age() if max_age is None else max_age)
+    return Page.objects.filter(Q(link_check__isnull=True) | Q(link_check__checked_at__lt=cutoff))
+
+
+def save_results(page_results):
+    """
+    Record a list of (page id, LinkResult) pairs, replacing any earlier result for those pages.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        LinkCheck.objects.filter(page_id__in=[page_id for page_id, _ in page_results]).delete()
+        LinkCheck.objects.bulk_create([
+            LinkCheck(page_id=page_id, checked_at=now, **result._asdict()) for page_id, result in page_results
+        ])
+
+
+def url_batches(pages, size):
+    """
+    Yield ordered dicts of URL -> ids of the pages pointing to it, for size pages at a time. They are read in (url, id)
+    order with one keyset query per batch, so that pages sharing a URL come together and only one batch is held in
+    memory.
+    """
+    pages = pages.order_by('url', 'id')
+    last = None
+    while True:
+        batch_pages = pages
+        if last is not None:
+            batch_pages = pages.filter(Q(url__gt=last[0]) | Q(url=last[0], id__gt=last[1]))
+        rows = list(batch_pages.values_list('url', 'id')[:size])
+        if not rows:
+            return
+
+        batch = OrderedDict()
+        for url, page_id in rows:
+            batch.setdefault(url, []).append(page_id)
+        yield batch
+        last = rows[-1]
+
+
+def check_pages(pages=None, concurrency=None, timeout=None, batch_size=None):
+    """
+    Check the URLs of pages (by default, all the pages due a check) and record the results, batch_size pages at a
+    time. Pages sharing a URL are checked once. Returns the number of pages checked and how many of them are broken.
+    """
+    if pages is None:
+        pages = pages_due()
+
+    checked = broken = 0
+    # The pages of a URL may straddle two batches; the last URL checked is remembered so that it isn't fetched twice
+    previous = None
+
+    for pages_by_url in url_batches(pages, batch_size or get_batch_size()):
+        batch = []
+        known = dict([previous]) if previous and previous[0] in pages_by_url else {}
+        urls = [url for url in pages_by_url if url not in known]
+        for url, result in chain(list(known.items()), check_urls(urls, concurrency, timeout)):
+            batch.extend((page_id, result) for page_id in pages_by_url[url])
+            checked += len(pages_by_url[url])
+            broken += 0 if result.ok else len(pages_by_url[url])
+            known[url] = result
+
+        save_results(batch)
+        last_url = next(reversed(pages_by_url))
+        previous = (last_url, known[last_url])
+
+    return checked, broken
@@ -0,0 +1,261 @@
+"""
+Bulk, idempotent loading of categories and pages.
+
+Records are plain dicts, streamed in from JSON Lines or CSV by the load_rango management command:
+
+    {"category": "Python", "views": 128, "likes": 64}
+    {"category": "Python", "title": "Python Tutorial", "url": "http://docs.python.org/2/tutorial/", "views": 15}
+
+A record without a title describes the category itself; one with a title is a page of that category. As with the
+original population script, a category is identified by its name and a page by its category and title, so loading the
+same file twice updates the existing rows instead of adding new ones.
+
+Each batch of records is written inside one transaction with a handful of queries: one lookup and one bulk_create for
+the categories, two lookups and one bulk_create for the pages, and an UPDATE per existing row that actually changed.
+"""
+import time
+
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+from django.template.defaultfilters import slugify
+from django.utils import six, timezone
+from django.utils.encoding import force_text
+
+from constants import FieldConstants
+from rango.chunks import CHUNK_SIZE, chunked
+from rango.models import Category, Page
+from rango.paths import path_segment
+from rango.signals import pages_bulk_changed
+from rango.urlcanon import url_hash
+
+# Every batch is looked up with name__in, see rango/chunks.py
+DEFAULT_BATCH_SIZE = CHUNK_SIZE
+
+# Pages are looked up with both category__in and title__in, which take up to one parameter each per page
+PAGE_LOOKUP_CHUNK_SIZE = CHUNK_SIZE // 2
+
+# The paths of new categories are set with a CASE taking two parameters per category, plus one per id in pk__in
+PATH_UPDATE_CHUNK_SIZE = CHUNK_SIZE // 3
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+class LoadStats(object):
+    def __init__(self):
+        self.rows = 0
+        self.categories_created = 0
+        self.pages_created = 0
+        self.pages_updated = 0
+        self.started = time.time()
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def load_records(records, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Load an iterable of records, batch_size at a time. progress, if given, is called with the LoadStats after each
+    batch. Returns the final LoadStats.
+    Raises InvalidRecord on the first record clean_record() refuses, once the batches before it are written.
+    """
+    stats = LoadStats()
+    changed_category_ids = set()
+
+    try:
+        batch = []
+        for record in records:
+            # Checked as soon as it comes in, so that the caller still knows where the record came from
+            batch.append(clean_record(record))
+            if len(batch) >= batch_size:
+                changed_category_ids.update(load_batch(batch, stats))
+                batch = []
+                if progress:
+                    progress(stats)
+
+        if batch:
+            changed_category_ids.update(load_batch(batch, stats))
+            if progress:
+                progress(stats)
+    finally:
+        # bulk_create() and update() bypass the model signals, so let the receivers catch up in one go - on the
+        # batches written before an invalid record too
+        pages_bulk_changed.send(sender=Page, category_ids=changed_category_ids)
+
+    return stats
+
+
+def clean_record(record):
+    """
+    Return a record with its names and title as stripped text and its counters as ints, leaving out the counters
+    that aren't given. Raises InvalidRecord when it has no category, or a value that can't be loaded.
+    """
+    if not isinstance(record, dict):
+        raise InvalidRecord("Expected an object with a category, not %r." % (record, ))
+
+    cleaned = {'category': clean_text(record, 'category', FieldConstants.name_max_length)}
+    if not cleaned['category']:
+        raise InvalidRecord("The category is missing.")
+
+    title = clean_text(record, 'title', FieldConstants.title_max_length)
+    if title:
+        cleaned.update(title=title, url=clean_text(record, 'url'), views=clean_count(record, 'views') or 0)
+    else:
+        for field in ('views', 'likes'):
+            value = clean_count(record, field)
+            if value is not None:
+                cleaned[field] = value
+
+    return cleaned
+
+
+def clean_text(record, field, max_length=None):
+    value = record.get(field)
+    if value is not None and not isinstance(value, (six.string_types, six.binary_type)):
+        raise InvalidRecord("The %s must be a string, not %r." % (field, value))
+
+    value = force_text(value or '').strip()
+    if max_length is not None and len(value) > max_length:
+        raise InvalidRecord("The %s is longer than %d characters." % (field, max_length))
+    return value
+
+
+def clean_count(record, field):
+    value = record.get(field)
+    if value is None or value == '':
+        return None
+
+    try:
+        # Floats are refused rather than truncated, and so are booleans, which int() would take for 0 and 1
+        if isinstance(value, (bool, float)):
+            raise ValueError
+        count = int(value)
+    except (TypeError, ValueError):
+        raise InvalidRecord("The %s must be a whole number, not %r." % (field, value))
+
+    if count < 0:
+        raise InvalidRecord("The %s cannot be negative." % field)
+    return count
+
+
+@transaction.atomic
+def load_batch(records, stats):
+    """
+    Write one batch of records, as returned by clean_record(), and return the ids of the categories that were created
+    or had pages added/changed.
+    """
+    stats.rows += len(records)
+
+    category_fields = {}
+    page_fields = {}
+    for record in records:
+        name = record['category']
+        category_fields.setdefault(name, {})
+
+        if 'title' in record:
+            page_fields[(name, record['title'])] = {'url': record['url'], 'views': record['views']}
+        else:
+            for field in ('views', 'likes'):
+                if field in record:
+                    category_fields[name][field] = record[field]
+
+    category_ids, new_category_ids = load_categories(category_fields, stats)
+    return new_category_ids | load_pages(page_fields, category_ids, stats)
+
+
+def load_categories(category_fields, stats):
+    """
+    Create the categories that don't exist yet and update the counters of those that do.
+    Returns a dict mapping every category name in the batch to its id, and the set of ids of the new categories.
+    """
+    category_ids = dict(Category.objects.filter(name__in=list(category_fields)).values_list('name', 'id'))
+
+    # The slug is computed here the same way Category.save() does it, since bulk_create() doesn't call save()
+    new_categories = [Category(name=name, slug=slugify(name), **fields)
+                      for name, fields in category_fields.items() if name not in category_ids]
+    new_names = [category.name for category in new_categories]
+
+    for name, fields in category_fields.items():
+        if fields and name in category_ids:
+            Category.objects.filter(pk=category_ids[name]).update(modified=timezone.now(), **fields)
+
+    if not new_categories:
+        return category_ids, set()
+
+    Category.objects.bulk_create(new_categories)
+    stats.categories_created += len(new_categories)
+
+    # bulk_create() doesn't hand back primary keys on every database, so look them up again
+    new_ids = dict(Category.objects.filter(name__in=new_names).values_list('name', 'id'))
+    category_ids.update(new_ids)
+
+    # Loaded categories are roots, whose path is made of their own id only (see rango/paths.py): one UPDATE sets those
+    # of a whole chunk
+    for chunk in chunked(sorted(new_ids.values()), PATH_UPDATE_CHUNK_SIZE):
+        Category.objects.filter(pk__in=chunk).update(path=Case(
+            *[When(pk=category_id, then=Value(path_segment(category_id))) for category_id in chunk],
+            output_field=CharField()))
+
+    return category_ids, set(new_ids.values())
+
+
+def load_pages(page_fields, category_ids, stats):
+    """
+    Create the new pages and update the url/views of existing ones that differ.
+    Returns the ids of the categories that had pages created or updated.
+    """
+    if not page_fields:
+        return set()
+
+    existing = {}
+    for chunk in chunked(page_fields, PAGE_LOOKUP_CHUNK_SIZE):
+        rows = Page.objects.filter(category__in=set(category_ids[name] for name, title in chunk),
+                                   title__in=set(title for name, title in chunk))
+        for pk, category_id, title, url, views in rows.values_list('id', 'category', 'title', 'url', 'views'):
+            existing[(category_id, title)] = (pk, url, views)
+
+    changed_category_ids = set()
+    new_pages = []
+    for (name, title), fields in page_fields.items():
+        category_id = category_ids[name]
+        current = existing.get((category_id, title))
+
+        if current is None:
+            new_pages.append(Page(category_id=category_id, title=title, canonical_url_hash=url_hash(fields['url']),
+                                  **fields))
+            changed_category_ids.add(category_id)
+        elif (current[1], current[2]) != (fields['url'], fields['views']):
+            # Django has no bulk update, but inside the batch's transaction these are cheap single-row UPDATEs
+            Page.objects.filter(pk=current[0]).update(modified=timezone.now(),
+                                                      canonical_url_hash=url_hash(fields['url']), **fields)
+            stats.pages_updated += 1
+            changed_category_ids.add(category_id)
+
+    if new_pages:
+        Page.objects.bulk_create(new_pages)
+        stats.pages_created += len(new_pages)
+
+    return changed_category_ids
+
+
+def add_pages(category_id, pages):
+    """
+    Add pages, given as dicts of Page fields, to a category with a single bulk_create inside one transaction.
+    Unlike load_records(), this never updates existing pages: it is meant for a batch of links entered by a user.
+    Returns the number of pages added.
+    """
+    if not pages:
+        return 0
+
+    with transaction.atomic():
+        Page.objects.bulk_create([Page(category_id=category_id, canonical_url_hash=url_hash(fields['url']), **fields)
+                                  for fields in pages])
+
+    pages_bulk_changed.send(sender=Page, category_ids={category_id})
+    return len(pages)
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rango.linkcheck import check_pages, get_concurrency, get_timeout, pages_due
+from rango.models import Page
+
+
+class Command(BaseCommand):
+    help = ("Check the URLs of the pages that haven't been checked within RANGO_LINK_CHECK_MAX_AGE seconds, and "
+            "record their status, latency, final URL and title. Meant to be run periodically, e.g. from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Check every page, however recently it was checked.")
+        parser.add_argument('--concurrency', type=int, default=get_concurrency(),
+                            help="Number of URLs checked at the same time (default: %d)." % get_concurrency())
+        parser.add_argument('--timeout', type=float, default=get_timeout(),
+                            help="Seconds to wait for each server (default: %s)." % get_timeout())
+
+    def handle(self, *args, **options):
+        pages = Page.objects.all() if options['all'] else pages_due()
+
+        started = time.time()
+        checked, broken = check_pages(pages, concurrency=options['concurrency'], timeout=options['timeout'])
+
+        self.stdout.write("Checked %d pages in %.1fs: %d broken." % (checked, time.time() - started, broken))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from rango.trending import compact_activity
+
+
+class Command(BaseCommand):
+    help = ("Roll hourly view and like buckets older than RANGO_TRENDING_HOURLY_RETENTION hours up into daily buckets, "
+            "and delete daily buckets older than RANGO_TRENDING_DAILY_RETENTION days.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rolled up %d hourly buckets." % compact_activity())
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from rango.trending import compute_trending
+
+
+class Command(BaseCommand):
+    help = ("Score pages and categories by their recent, time-decayed views and likes, and replace the trending "
+            "rankings shown on the index and category pages.")
+
+    def handle(self, *args, **options):
+        pages, categories = compute_trending()
+        self.stdout.write("Ranked %d pages and %d categories." % (pages, categories))
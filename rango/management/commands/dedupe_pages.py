@@ -0,0 +1,80 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from rango.chunks import CHUNK_SIZE, chunked
+from rango.models import Page
+from rango.signals import pages_bulk_changed
+
+# Pages are looked up and deleted with __in, see rango/chunks.py
+DEFAULT_BATCH_SIZE = CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = ("Merge the pages whose URLs point to the same place (see rango/urlcanon.py), a batch of URLs per "
+            "transaction: the page added first is kept, with the views of the others added to its own, and the "
+            "others are deleted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Number of duplicated URLs merged per transaction (default: %d)."
+                                 % DEFAULT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many pages would be merged.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        duplicated = (Page.objects.values_list('canonical_url_hash').annotate(n=Count('id')).filter(n__gt=1)
+                      .order_by('canonical_url_hash'))
+        last_hash = ''
+        urls = deleted = 0
+
+        while True:
+            batch = [digest for digest, n in duplicated.filter(canonical_url_hash__gt=last_hash)[:batch_size]]
+            if not batch:
+                break
+            last_hash = batch[-1]
+            urls += len(batch)
+            deleted += self.merge(batch, options['dry_run'])
+
+        self.stdout.write("%s %d duplicate pages of %d URLs." % ("Would merge" if options['dry_run'] else "Merged",
+                                                                 deleted, urls))
+
+    def merge(self, hashes, dry_run):
+        """
+        Merge the pages of each of the given URL hashes into the first one. Returns the number of pages deleted.
+        """
+        keepers = {}
+        extra_views = defaultdict(int)
+        duplicate_ids = []
+        for page_id, digest, views in Page.objects.filter(canonical_url_hash__in=hashes).order_by('id').values_list(
+                'id', 'canonical_url_hash', 'views'):
+            if digest not in keepers:
+                keepers[digest] = page_id
+            else:
+                extra_views[keepers[digest]] += views
+                duplicate_ids.append(page_id)
+
+        if dry_run:
+            return len(duplicate_ids)
+
+        # Keepers that gained the same number of views share one UPDATE, as with the buffered counters
+        by_amount = defaultdict(list)
+        for page_id, amount in extra_views.items():
+            by_amount[amount].append(page_id)
+
+        now = timezone.now()
+        with transaction.atomic():
+            for amount, page_ids in by_amount.items():
+                if amount:
+                    Page.objects.filter(pk__in=page_ids).update(views=F('views') + amount, modified=now)
+            # The collector sends post_delete for every page, so the receivers keep page counts and the search index
+            # right
+            for chunk in chunked(duplicate_ids):
+                Page.objects.filter(pk__in=chunk).delete()
+
+        category_ids = set(Page.objects.filter(pk__in=list(keepers.values())).values_list('category', flat=True))
+        pages_bulk_changed.send(sender=Page, category_ids=category_ids)
+        return len(duplicate_ids)
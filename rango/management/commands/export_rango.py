@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rango.export import ENCODERS, EXPORTS, export, export_until, parse_watermark
+
+
+class Command(BaseCommand):
+    help = ("Export categories or pages as CSV or JSON Lines, optionally gzipped, reading them a chunk at a time. "
+            "With --since, only the rows modified after that watermark are exported; the watermark to pass next "
+            "time is printed to standard error.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS), help="What to export.")
+        parser.add_argument('--format', choices=sorted(ENCODERS), default='csv', help="Output format (default: csv).")
+        parser.add_argument('--since', help="Only export the rows modified after this ISO 8601 date and time, "
+                                            "e.g. the watermark printed by the previous export.")
+        parser.add_argument('--gzip', action='store_true', help="Compress the output with gzip.")
+        parser.add_argument('--output', default='-', help="File to write to, or - for standard output (the default).")
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_watermark(options['since']) if options['since'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        until = export_until()
+        path = options['output']
+        stream = getattr(sys.stdout, 'buffer', sys.stdout) if path == '-' else open(path, 'wb')
+        try:
+            for string in export(options['name'], options['format'], since, until, options['gzip']):
+                stream.write(string)
+        finally:
+            if path == '-':
+                stream.flush()
+            else:
+                stream.close()
+
+        self.stderr.write("Exported %s modified up to %s; pass --since %s to export the next changes."
+                          % (options['name'], until.isoformat(), until.isoformat()))
@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import six
+
+from rango.loader import DEFAULT_BATCH_SIZE, InvalidRecord, load_records
+
+
+class Position(object):
+    """
+    The line of the input the reader is at, for error messages.
+    """
+    line_number = 0
+
+
+def read_jsonl(stream, position):
+    for line_number, line in enumerate(stream, 1):
+        position.line_number = line_number
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise CommandError("Line %d is not valid JSON: %s" % (line_number, e))
+
+
+def open_input(path, file_format):
+    if path == '-':
+        return sys.stdin
+    if file_format == 'csv' and six.PY2:
+        # The Python 2 csv module only reads byte strings; the loader decodes the values
+        return open(path, 'rb')
+    return io.open(path, encoding='utf-8', newline='')
+
+
+def read_csv(stream, position):
+    # Columns: category, title, url, views, likes - only category is required
+    reader = csv.DictReader(stream)
+    for row in reader:
+        position.line_number = reader.line_num
+        yield row
+
+
+class Command(BaseCommand):
+    help = ("Load categories and pages from a JSON Lines or CSV file, in batches. "
+            "Existing categories (by name) and pages (by category and title) are updated rather than duplicated.")
+
+    readers = {'jsonl': read_jsonl, 'csv': read_csv}
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to load, or - to read from standard input.")
+        parser.add_argument('--format', choices=sorted(self.readers),
+                            help="Input format. Guessed from the file extension when not given.")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Number of records written per transaction (default: %d)." % DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format not in self.readers:
+            raise CommandError("Cannot tell the format of %s, please pass --format." % path)
+
+        stream = open_input(path, file_format)
+        position = Position()
+        try:
+            stats = load_records(self.readers[file_format](stream, position), batch_size=options['batch_size'],
+                                 progress=self.report_progress if options['verbosity'] > 1 else None)
+        except InvalidRecord as e:
+            # The loader checks each record as soon as it is read, so the reader is still on its line
+            raise CommandError("Line %d: %s Only the batches of %d records completed before it were loaded." % (
+                position.line_number, e, options['batch_size']))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write("Loaded %d rows in %.1fs (%.0f rows/sec): %d categories created, %d pages created, "
+                          "%d pages updated." % (stats.rows, stats.elapsed, stats.rows_per_second,
+                                                 stats.categories_created, stats.pages_created, stats.pages_updated))
+
+    def report_progress(self, stats):
+        self.stdout.write("%d rows, %.0f rows/sec" % (stats.rows, stats.rows_per_second))
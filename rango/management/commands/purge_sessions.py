@@ -0,0 +1,31 @@
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rango.chunks import CHUNK_SIZE
+
+# Each chunk is deleted with session_key__in, see rango/chunks.py
+DEFAULT_CHUNK_SIZE = CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = ("Delete expired sessions from the database a chunk at a time, so that no single DELETE holds locks on "
+            "the whole session table. Meant to be run periodically, e.g. from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Number of sessions deleted per statement (default: %d)." % DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        deleted = 0
+
+        while True:
+            keys = list(Session.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)
+                        [:options['chunk_size']])
+            if not keys:
+                break
+            Session.objects.filter(session_key__in=keys).delete()
+            deleted += len(keys)
+
+        self.stdout.write("Deleted %d expired sessions." % deleted)
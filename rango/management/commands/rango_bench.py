@@ -0,0 +1,43 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from rango import benchmark
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the rango views against a synthetic dataset in a throwaway test database and report "
+            "throughput, latency percentiles and query counts as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=50, help="Number of categories to create.")
+        parser.add_argument('--pages', type=int, default=1000, help="Number of pages to create.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Threads driving the WSGI application.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of standard output.")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the test database between runs.")
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            # The WSGI threads open connections of their own, which can't see a private in-memory database
+            test_settings['NAME'] = os.path.join(tempfile.gettempdir(), 'rango_bench.sqlite3')
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            with override_settings(ALLOWED_HOSTS=['*']):
+                report = benchmark.run(options['categories'], options['pages'], options['requests'],
+                                       options['concurrency'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
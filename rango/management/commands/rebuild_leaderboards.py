@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from rango.leaderboard import rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the most liked categories / most viewed pages leaderboards from the database. "
+            "Run it periodically to reconcile any updates that raced between processes. This needs a cache shared by "
+            "every process: with a local one, the server's copies are rebuilt after RANGO_LEADERBOARD_TIMEOUT instead.")
+
+    def handle(self, *args, **options):
+        rebuild_leaderboards()
+        self.stdout.write("Rebuilt the leaderboards.")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from rango.search import get_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of pages from scratch."
+
+    def handle(self, *args, **options):
+        index = get_search_index()
+        index.rebuild()
+        self.stdout.write("Rebuilt the %s." % index.__class__.__name__)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from rango.counters import recount_category_pages
+from rango.models import Category
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored page_count of every category from the Page table."
+
+    def handle(self, *args, **options):
+        recount_category_pages()
+        self.stdout.write("Recounted pages for %d categories." % Category.objects.count())
@@ -0,0 +1,61 @@
+from django.utils import timezone
+
+from rango.counters import record_unique_visitor
+
+VISIT_COOKIE_NAME = 'visits'
+VISIT_COOKIE_SALT = 'rango.visits'
+VISIT_COOKIE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+class VisitTrackerMiddleware(object):
+    """
+    Count on how many different days each visitor has come to the site.
+
+    The count lives in a signed cookie holding "<visits>/<date of last visit>", so nothing is written to the database
+    on a visit, and the cookie itself is only re-sent on the first page view of a new day. That page view also
+    counts the visitor towards the day's unique visitors (see DailyVisitors), through the buffered counters.
+
+    Only successful GETs answered with HTML count as page views, like the index and about pages that counted visits
+    before: API calls, form posts, redirects and files neither count a visit nor get a cookie, which would keep
+    their responses from being cached downstream.
+
+    The count is available to views as request.visits.
+    """
+
+    def process_request(self, request):
+        today = timezone.localtime(timezone.now()).date()
+        visits, last_visit = self.read_cookie(request)
+
+        if last_visit != today.isoformat():
+            # Counted once the response turns out to be a page view
+            visits += 1
+            request.visit_cookie = '%d/%s' % (visits, today.isoformat())
+            request.visit_date = today
+
+        request.visits = visits
+
+    def process_response(self, request, response):
+        visit_cookie = getattr(request, 'visit_cookie', None)
+        if visit_cookie and self.is_page_view(request, response):
+            record_unique_visitor(request.visit_date)
+            response.set_signed_cookie(VISIT_COOKIE_NAME, visit_cookie, salt=VISIT_COOKIE_SALT,
+                                       max_age=VISIT_COOKIE_MAX_AGE, httponly=True)
+        return response
+
+    @staticmethod
+    def is_page_view(request, response):
+        return (request.method == 'GET' and response.status_code == 200 and not response.streaming and
+                response.get('Content-Type', '').startswith('text/html'))
+
+    @staticmethod
+    def read_cookie(request):
+        """
+        Return the (visits, last visit date string) stored in the cookie, or (0, None) for a new visitor.
+        A cookie that was tampered with fails the signature check and counts as no cookie at all.
+        """
+        value = request.get_signed_cookie(VISIT_COOKIE_NAME, default=None, salt=VISIT_COOKIE_SALT)
+        try:
+            visits, last_visit = value.split('/')
+            return int(visits), last_visit
+        except (AttributeError, ValueError):
+            return 0, None
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 14:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_pages(apps, schema_editor):
+    Category = apps.get_model('rango', 'Category')
+    Page = apps.get_model('rango', 'Page')
+
+    for category_id, page_count in Page.objects.values_list('category').annotate(n=Count('id')).order_by():
+        Category.objects.filter(pk=category_id).update(page_count=page_count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0007_userprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='page_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_pages, migrations.RunPython.noop),
+    ]
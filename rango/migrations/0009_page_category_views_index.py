@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 14:49
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0008_category_page_count'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='page',
+            index_together=set([('category', 'views', 'id')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 14:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0009_page_category_views_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyVisitors',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('visitors', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily visitors',
+            },
+        ),
+    ]
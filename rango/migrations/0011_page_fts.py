@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    """
+    Create and fill the FTS5 table behind rango.search.FTSIndex, when the database is an SQLite built with FTS5.
+    Elsewhere rango.search falls back to its in-memory index.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        if 'ENABLE_FTS5' not in [row[0] for row in cursor.fetchall()]:
+            return
+
+        cursor.execute("CREATE VIRTUAL TABLE rango_page_fts USING fts5(title, url, category)")
+        cursor.execute("INSERT INTO rango_page_fts (rowid, title, url, category) "
+                       "SELECT p.id, p.title, p.url, c.name FROM rango_page p "
+                       "INNER JOIN rango_category c ON c.id = p.category_id")
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS rango_page_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0010_dailyvisitors'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 14:57
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0011_page_fts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='likes',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='page',
+            name='views',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+    ]
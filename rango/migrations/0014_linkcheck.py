@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 15:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0013_userprofile_picture_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LinkCheck',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ok', models.BooleanField(db_index=True, default=False)),
+                ('status', models.IntegerField(blank=True, null=True)),
+                ('latency', models.IntegerField(blank=True, null=True)),
+                ('final_url', models.URLField(blank=True, max_length=2000)),
+                ('title', models.CharField(blank=True, max_length=128)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('checked_at', models.DateTimeField(db_index=True)),
+                ('page', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='link_check', to='rango.Page')),
+            ],
+        ),
+    ]
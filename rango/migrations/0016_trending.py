@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 15:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0015_categoryslughistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(choices=[('page_views', 'Page views'), ('category_views', 'Category views'), ('category_likes', 'Category likes')], max_length=16)),
+                ('object_id', models.IntegerField()),
+                ('resolution', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingCategory',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='rango.Category')),
+                ('score', models.FloatField(db_index=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Trending categories',
+            },
+        ),
+        migrations.CreateModel(
+            name='TrendingPage',
+            fields=[
+                ('page', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='rango.Page')),
+                ('score', models.FloatField(db_index=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trending_pages', to='rango.Category')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='activitybucket',
+            unique_together=set([('subject', 'resolution', 'start', 'object_id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='trendingpage',
+            index_together=set([('category', 'score')]),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from rango.chunks import CHUNK_SIZE
+from rango.urlcanon import url_hash
+
+BATCH_SIZE = CHUNK_SIZE
+
+
+def hash_urls(apps, schema_editor):
+    Page = apps.get_model('rango', 'Page')
+
+    last_id = 0
+    while True:
+        batch = list(Page.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'url')[:BATCH_SIZE])
+        for page_id, url in batch:
+            Page.objects.filter(pk=page_id).update(canonical_url_hash=url_hash(url))
+        if len(batch) < BATCH_SIZE:
+            return
+        last_id = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0017_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='canonical_url_hash',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=40),
+            preserve_default=False,
+        ),
+        migrations.RunPython(hash_urls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 17:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from rango.chunks import CHUNK_SIZE
+from rango.paths import path_segment
+
+BATCH_SIZE = CHUNK_SIZE
+
+
+def set_paths(apps, schema_editor):
+    # Every existing category starts out as a root
+    Category = apps.get_model('rango', 'Category')
+
+    last_id = 0
+    while True:
+        batch = list(Category.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+        for category_id in batch:
+            Category.objects.filter(pk=category_id).update(path=path_segment(category_id))
+        if len(batch) < BATCH_SIZE:
+            return
+        last_id = batch[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0018_page_canonical_url_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='rango.Category'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_paths, migrations.RunPython.noop),
+    ]
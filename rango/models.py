@@ -1,22 +1,80 @@
 from __future__ import unicode_literals
 
+import json
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F, Max, Value
+from django.db.models.functions import Concat, Substr
 from django.template.defaultfilters import slugify
 from constants import FieldConstants
+from rango.paths import MAX_DEPTH, descendants_filter, path_depth, path_segment
+from rango.urlcanon import url_hash
+
+
+def loaded_counters(instance, counters):
+    # Read from __dict__, so that counters left out with only() or defer() aren't fetched just to be remembered
+    return dict((field, instance.__dict__.get(field)) for field in counters)
+
+
+def without_stale_counters(instance, kwargs, maintained=(), counters=()):
+    """
+    The save() keyword arguments that keep a full save of an existing row from writing back the counters the instance
+    holds, which are incremented behind its back with F() expressions (see rango/counters.py and rango/signals.py):
+    the maintained fields are never written, the counters only when they were changed on the instance, e.g. in the
+    admin. Saves that insert or already name their update_fields are left alone.
+    """
+    if instance._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields') is not None:
+        return kwargs
+
+    unchanged = set(field for field, value in instance._loaded_counters.items()
+                    if instance.__dict__.get(field) == value)
+    skipped = set(maintained) | unchanged
+    kwargs = dict(kwargs)
+    # Fields left out with only() or defer() aren't written either, as save() would do on its own
+    kwargs['update_fields'] = [field.name for field in instance._meta.concrete_fields
+                               if not field.primary_key and field.attname in instance.__dict__ and
+                               field.name not in skipped]
+    return kwargs
 
 
 class Category(models.Model):
     name = models.CharField(max_length=FieldConstants.name_max_length, unique=True)
     views = models.IntegerField(default=0)
-    likes = models.IntegerField(default=0)
+    likes = models.IntegerField(default=0, db_index=True)
     slug = models.SlugField(unique=True)
+    # Number of pages in the category, kept up to date by the Page signal receivers in rango/signals.py so that
+    # listings don't have to COUNT them. Run `python manage.py recount_pages` to rebuild it from scratch.
+    page_count = models.IntegerField(default=0, editable=False)
+    # When the row last changed, counters included - the watermark of incremental exports (see rango/export.py)
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+    # Categories nest; path and depth locate the category in the tree (see rango/paths.py) and are kept up to date by
+    # save(). Code creating categories with bulk_create() has to set their paths afterwards (see rango/loader.py).
+    parent = models.ForeignKey('self', null=True, blank=True, related_name='children')
+    path = models.CharField(max_length=255, db_index=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     """
     We could have added the unique constraint earlier but if we performed the migration and set everything to be an
     emtpy string by default, it would have raised an error as the unique constraint would have been violated
     We could have deleted the database and then recreated everything - but that's not always desirable
     """
 
+    # Counters written with F() expressions: page_count only ever that way, views and likes from the admin too
+    MAINTAINED_COUNTERS = ('page_count', )
+    COUNTERS = ('views', 'likes')
+
+    def __init__(self, *args, **kwargs):
+        super(Category, self).__init__(*args, **kwargs)
+        # Remember the name and slug the category was loaded with, so that a rename can be detected when it is saved
+        self._loaded_name = self.name
+        self._loaded_slug = self.slug
+        # Likewise for its place in the tree, so that a move can be detected
+        self._loaded_parent_id = self.parent_id
+        self._loaded_path = self.path
+        # And for the counters, so that saving it doesn't undo the increments made since it was loaded
+        self._loaded_counters = loaded_counters(self, self.COUNTERS)
+
     # We defined the slug field that we will use with function slugify to replace whitespace with hyphens
     # Eg - 'how do i create a slug in django' turns into 'how-do-i-create-a-slug-in-django'
 
@@ -24,9 +82,72 @@ class Category(models.Model):
         """
         We override the save method of the Category model so that it calls the slugify method and updates the slug field
         Note that everytime the category name is updated, the slug will also change.
+        The slug is left alone when the name hasn't changed since the category was loaded.
+        The old slug keeps working after a rename, see CategorySlugHistory.
+        """
+        if self.pk is None or not self.slug or self.name != self._loaded_name:
+            self.slug = slugify(self.name)
+
+        kwargs = without_stale_counters(self, kwargs, self.MAINTAINED_COUNTERS, self.COUNTERS)
+
+        if self.pk is not None and self.path and self.parent_id == self._loaded_parent_id:
+            super(Category, self).save(*args, **kwargs)
+            return
+
+        # A new category, or one moved to another parent: its path is its parent's followed by its own id
+        parent_path = self.parent.path if self.parent_id else ''
+        with transaction.atomic():
+            if self.pk is None:
+                self.check_move(parent_path)
+                # The id is only known once the row is inserted, see _save_table()
+                super(Category, self).save(*args, **kwargs)
+                return
+
+            old_path = self.path
+            self.check_move(parent_path, old_path)
+            self.path = parent_path + path_segment(self.pk)
+            self.depth = path_depth(self.path)
+
+            if old_path and old_path != self.path:
+                # The whole subtree moves along, with a single UPDATE swapping the start of the paths. It goes first,
+                # so that the post_save receivers find the subtree in its new place.
+                Category.objects.filter(**descendants_filter(old_path)).update(
+                    path=Concat(Value(self.path), Substr('path', len(old_path) + 1), output_field=models.CharField()),
+                    depth=F('depth') + (self.depth - path_depth(old_path)))
+            super(Category, self).save(*args, **kwargs)
+
+    def _save_table(self, *args, **kwargs):
+        updated = super(Category, self)._save_table(*args, **kwargs)
+        if not updated and not self.path:
+            # A new category: write its path as soon as its id is known, within the transaction of the insert and
+            # before post_save is sent, so that the receivers find it in its place
+            self.path = (self.parent.path if self.parent_id else '') + path_segment(self.pk)
+            self.depth = path_depth(self.path)
+            Category.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+        return updated
+
+    def check_move(self, parent_path, old_path=''):
         """
-        self.slug = slugify(self.name)
-        super(Category, self).save(*args, **kwargs)
+        Raise ValueError unless the category fits under the category at parent_path, along with its subtree when it
+        already has one at old_path.
+        """
+        levels_below = 0
+        if old_path:
+            if parent_path.startswith(old_path):
+                raise ValueError("A category cannot be moved under itself or one of its subcategories.")
+            deepest = Category.objects.filter(**descendants_filter(old_path)).aggregate(depth=Max('depth'))['depth']
+            if deepest is not None:
+                levels_below = deepest - path_depth(old_path)
+
+        if path_depth(parent_path) + 1 + levels_below > MAX_DEPTH:
+            raise ValueError("Categories cannot be nested more than %d levels deep." % (MAX_DEPTH + 1))
+
+    def clean(self):
+        if self.parent_id is not None and self.parent_id != self._loaded_parent_id:
+            try:
+                self.check_move(self.parent.path, self._loaded_path)
+            except ValueError as e:
+                raise ValidationError({'parent': str(e)})
 
     """
     Now that the model has been updated, the changes must be propagated to the database.
@@ -54,11 +175,55 @@ class Category(models.Model):
         return self.name
 
 
+class CategorySlugHistory(models.Model):
+    """
+    A slug a category went by before it was renamed. Requests for it are redirected to the category's current slug,
+    so that links and bookmarks to the old URL keep working. Recorded by the Category signal receivers in
+    rango/signals.py.
+    """
+    slug = models.SlugField(unique=True)
+    category = models.ForeignKey(Category, related_name='slug_history')
+    renamed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'Category slug history'
+
+    def __str__(self):
+        return self.slug
+
+    def __unicode__(self):
+        return self.slug
+
+
 class Page(models.Model):
     category = models.ForeignKey(Category)
     title = models.CharField(max_length=FieldConstants.title_max_length)
     url = models.URLField()
-    views = models.IntegerField(default=0)
+    views = models.IntegerField(default=0, db_index=True)
+    # When the row last changed, counters included - the watermark of incremental exports (see rango/export.py)
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+    # SHA-1 of the canonical form of the URL (see rango/urlcanon.py), to find pages pointing to the same place.
+    # Set by save(); code writing pages with bulk_create() or update() has to set it too.
+    canonical_url_hash = models.CharField(max_length=40, db_index=True, editable=False)
+
+    # Written with F() expressions by rango/counters.py, and from the admin
+    COUNTERS = ('views', )
+
+    def __init__(self, *args, **kwargs):
+        super(Page, self).__init__(*args, **kwargs)
+        # Remember which category the page was loaded with, so that a move to another category can be detected
+        # when the page is saved
+        self._loaded_category_id = self.category_id
+        # And its views, so that saving it doesn't undo the views counted since it was loaded
+        self._loaded_counters = loaded_counters(self, self.COUNTERS)
+
+    def save(self, *args, **kwargs):
+        self.canonical_url_hash = url_hash(self.url)
+        super(Page, self).save(*args, **without_stale_counters(self, kwargs, counters=self.COUNTERS))
+
+    class Meta:
+        # Backs the most-viewed-first keyset pagination of a category's pages in rango/pagination.py
+        index_together = [('category', 'views', 'id')]
 
     def __str__(self):
         return self.title
@@ -88,10 +253,141 @@ class UserProfile(models.Model):
     # ~/PycharmProjectvs/tango_with_django_project/media/profile_images/
     picture = models.ImageField(upload_to='profile_images', blank=True)
 
+    # Downsized copies of the picture, as a JSON object of variant name to file name, e.g. {"thumb": "..."}.
+    # They are rendered off the request by rango/images.py; use the profile_image template filter to pick one.
+    picture_variants = models.TextField(blank=True, editable=False)
+
+    def __init__(self, *args, **kwargs):
+        super(UserProfile, self).__init__(*args, **kwargs)
+        # Remember the picture the profile was loaded with, so that a new upload can be detected when it is saved
+        self._loaded_picture = self.picture.name
+
+    def save(self, *args, **kwargs):
+        if self.picture.name != self._loaded_picture:
+            # The variants belong to the previous picture; new ones are on their way (see rango/signals.py)
+            self.picture_variants = ''
+        super(UserProfile, self).save(*args, **kwargs)
+
+    def get_picture_variants(self):
+        return json.loads(self.picture_variants) if self.picture_variants else {}
+
     # Override the __str__() method to return out something meaningful!
     # For Python 2.7.x, define __unicode__ too
     def __str__(self):
         return self.user.username
 
     def __unicode__(self):
-        return self.user.username
\ No newline at end of file
+        return self.user.username
+
+
+class DailyVisitors(models.Model):
+    """
+    Number of distinct visitors seen on each day, written in batches by rango/counters.py.
+    """
+    date = models.DateField(unique=True)
+    visitors = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Daily visitors'
+
+    def __str__(self):
+        return str(self.date)
+
+    def __unicode__(self):
+        return unicode(self.date)
+
+
+class LinkCheck(models.Model):
+    """
+    Outcome of the latest check of a page's URL, written in batches by rango/linkcheck.py (see the check_links
+    command).
+    """
+    page = models.OneToOneField(Page, related_name='link_check')
+    # True when the URL (after following redirects) answered with a 2xx status
+    ok = models.BooleanField(default=False, db_index=True)
+    # HTTP status of the final response; empty when no response came back at all (see error)
+    status = models.IntegerField(null=True, blank=True)
+    # Time taken to get the response, in milliseconds
+    latency = models.IntegerField(null=True, blank=True)
+    final_url = models.URLField(max_length=2000, blank=True)
+    title = models.CharField(max_length=FieldConstants.title_max_length, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    checked_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.page.url
+
+    def __unicode__(self):
+        return self.page.url
+
+
+class ActivityBucket(models.Model):
+    """
+    Number of views or likes an object received within an hour or a day, written in batches by rango/counters.py
+    into hourly buckets. The compact_activity command rolls old hourly buckets up into daily ones, and the
+    compute_trending command ranks pages and categories from them (see rango/trending.py).
+    """
+    PAGE_VIEWS = 'page_views'
+    CATEGORY_VIEWS = 'category_views'
+    CATEGORY_LIKES = 'category_likes'
+    SUBJECT_CHOICES = [
+        (PAGE_VIEWS, 'Page views'),
+        (CATEGORY_VIEWS, 'Category views'),
+        (CATEGORY_LIKES, 'Category likes'),
+    ]
+
+    HOUR = 'hour'
+    DAY = 'day'
+    RESOLUTION_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day')]
+
+    subject = models.CharField(max_length=16, choices=SUBJECT_CHOICES)
+    # The id of the Page or Category, depending on the subject
+    object_id = models.IntegerField()
+    resolution = models.CharField(max_length=4, choices=RESOLUTION_CHOICES)
+    start = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('subject', 'resolution', 'start', 'object_id')]
+
+    def __str__(self):
+        return '%s of %s %d from %s' % (self.get_resolution_display(), self.subject, self.object_id, self.start)
+
+    def __unicode__(self):
+        return '%s of %s %d from %s' % (self.get_resolution_display(), self.subject, self.object_id, self.start)
+
+
+class TrendingPage(models.Model):
+    """
+    Time-decayed popularity of a page, materialized by the compute_trending command.
+    """
+    page = models.OneToOneField(Page, primary_key=True, related_name='trending')
+    # Copied from the page, so that the pages trending within a category can be read off one index
+    category = models.ForeignKey(Category, related_name='trending_pages')
+    score = models.FloatField(db_index=True)
+
+    class Meta:
+        index_together = [('category', 'score')]
+
+    def __str__(self):
+        return '%s: %.2f' % (self.page_id, self.score)
+
+    def __unicode__(self):
+        return '%s: %.2f' % (self.page_id, self.score)
+
+
+class TrendingCategory(models.Model):
+    """
+    Time-decayed popularity of a category, materialized by the compute_trending command.
+    """
+    category = models.OneToOneField(Category, primary_key=True, related_name='trending')
+    score = models.FloatField(db_index=True)
+
+    class Meta:
+        verbose_name_plural = 'Trending categories'
+
+    def __str__(self):
+        return '%s: %.2f' % (self.category_id, self.score)
+
+    def __unicode__(self):
+        return '%s: %.2f' % (self.category_id, self.score)
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.db.models import Q
+
+
+def get_page_size():
+    return getattr(settings, 'RANGO_PAGES_PER_PAGE', 20)
+
+
+def parse_cursor(cursor):
+    """
+    A cursor is the "<views>.<id>" pair of the last page shown. Returns None for a missing or mangled cursor,
+    which simply starts the listing from the top.
+    """
+    try:
+        views, pk = cursor.split('.')
+        return int(views), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def make_cursor(page):
+    # Pages read with .values() come as dicts
+    if isinstance(page, dict):
+        return '%d.%d' % (page['views'], page['id'])
+    return '%d.%d' % (page.views, page.id)
+
+
+def paginate_pages(queryset, cursor=None, page_size=None):
+    """
+    Keyset pagination over pages ordered by most viewed first.
+
+    Rather than an OFFSET, which makes the database walk over every page it skips, we continue right after the
+    (views, id) of the last page shown; with the (category, views, id) index this costs the same however deep into
+    the category the user is. Returns the list of pages and the cursor for the next batch, or None on the last batch.
+    """
+    page_size = page_size or get_page_size()
+    queryset = queryset.order_by('-views', 'id')
+
+    position = parse_cursor(cursor)
+    if position is not None:
+        views, pk = position
+        queryset = queryset.filter(Q(views__lt=views) | Q(views=views, id__gt=pk))
+
+    # Fetch one extra row to find out whether there is anything after this batch
+    pages = list(queryset[:page_size + 1])
+    if len(pages) > page_size:
+        pages = pages[:page_size]
+        return pages, make_cursor(pages[-1])
+
+    return pages, None
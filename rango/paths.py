@@ -0,0 +1,54 @@
+"""
+Materialized paths of categories.
+
+Categories form a tree through Category.parent. Each category also stores its path: the ids of its ancestors and its
+own, root first, each written as PATH_STEP hex digits. Since every path starts with the paths of its ancestors:
+
+- the subtree of a category is one range of the indexed path column, from its path up to its path followed by
+  PATH_END, which sorts after every hex digit - a plain range scan on any database, unlike LIKE 'prefix%'
+- the ids and paths of its ancestors can be read off its path without a query, e.g. for breadcrumbs
+
+Category.save() maintains path and depth, and rewrites the paths of the whole subtree when a category is moved.
+"""
+PATH_STEP = 8
+PATH_END = '~'
+
+# Category.path is a 255 character column
+MAX_DEPTH = 255 // PATH_STEP - 1
+
+
+def path_segment(category_id):
+    return '%0*x' % (PATH_STEP, category_id)
+
+
+def path_ids(path):
+    """
+    The ids of the categories along path, root first, ending with the category the path belongs to.
+    """
+    return [int(path[start:start + PATH_STEP], 16) for start in range(0, len(path or ''), PATH_STEP)]
+
+
+def ancestor_paths(path):
+    """
+    The paths of the ancestors of the category at path, root first.
+    """
+    return [path[:end] for end in range(PATH_STEP, len(path or ''), PATH_STEP)]
+
+
+def path_depth(path):
+    return len(path) // PATH_STEP - 1
+
+
+def subtree_filter(path, field='path'):
+    """
+    Lookups matching the category at path and all of its descendants, e.g.
+    Page.objects.filter(**subtree_filter(category.path, 'category__path')) for the pages of a subtree.
+    """
+    return {field + '__gte': path, field + '__lt': path + PATH_END}
+
+
+def descendants_filter(path, field='path'):
+    """
+    Like subtree_filter(), without the category at path itself.
+    """
+    return {field + '__gt': path, field + '__lt': path + PATH_END}
@@ -0,0 +1,199 @@
+"""
+Opt-in request profiling.
+
+With RANGO_PROFILING = True, ProfilingMiddleware records for every request the wall time, the number of SQL queries
+and the time spent in them, the time spent rendering templates, and the cache hits and misses of rango's own caches,
+grouped by view. The latest RANGO_PROFILING_SAMPLES requests per view are kept in memory and summarised as
+percentiles at /rango/_stats/ (staff only).
+
+RANGO_QUERY_BUDGETS maps view names (e.g. 'rango:index') to the most queries a request to that view may issue. Going
+over budget logs a warning, or raises QueryBudgetExceeded when RANGO_QUERY_BUDGET_STRICT is set, which makes any test
+exercising the view fail on an N+1 regression.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestProfile(object):
+    def __init__(self):
+        self.view_name = None
+        self.started = time.time()
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.query_marks = {}
+
+
+def current_profile():
+    return getattr(_local, 'profile', None)
+
+
+def record_cache_lookup(hit):
+    profile = current_profile()
+    if profile is not None:
+        if hit:
+            profile.cache_hits += 1
+        else:
+            profile.cache_misses += 1
+
+
+_template_timer_installed = False
+_install_lock = threading.Lock()
+
+
+def install_template_timer():
+    """
+    Wrap Template.render so that the outermost template rendered during a profiled request is timed.
+    Nested renders (extends, include, inclusion tags) are part of the outermost one and not counted again.
+    """
+    global _template_timer_installed
+    with _install_lock:
+        if _template_timer_installed:
+            return
+
+        from django.template.base import Template
+        original_render = Template.render
+
+        def timed_render(self, context):
+            profile = current_profile()
+            if profile is None:
+                return original_render(self, context)
+
+            profile.template_depth += 1
+            started = time.time()
+            try:
+                return original_render(self, context)
+            finally:
+                profile.template_depth -= 1
+                if not profile.template_depth:
+                    profile.template_time += time.time() - started
+
+        Template.render = timed_render
+        _template_timer_installed = True
+
+
+class ViewStats(object):
+    def __init__(self, samples):
+        self.count = 0
+        self.samples = deque(maxlen=samples)
+
+    def add(self, sample):
+        self.count += 1
+        self.samples.append(sample)
+
+
+class StatsRegistry(object):
+    fields = ('wall_ms', 'queries', 'sql_ms', 'template_ms', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def add(self, view_name, sample):
+        with self._lock:
+            if view_name not in self._views:
+                self._views[view_name] = ViewStats(getattr(settings, 'RANGO_PROFILING_SAMPLES', 1000))
+            self._views[view_name].add(sample)
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def summary(self):
+        """
+        Return {view name: {'requests': n, <field>: {'p50': .., 'p95': .., 'p99': .., 'max': ..}}} over the samples
+        kept for each view.
+        """
+        with self._lock:
+            views = dict((name, (stats.count, list(stats.samples))) for name, stats in self._views.items())
+
+        summary = {}
+        for name, (count, samples) in views.items():
+            summary[name] = {'requests': count}
+            for position, field in enumerate(self.fields):
+                values = sorted(sample[position] for sample in samples)
+                summary[name][field] = dict(('p%d' % p, percentile(values, p)) for p in (50, 95, 99))
+                summary[name][field]['max'] = values[-1]
+        return summary
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile
+    index = max(int(round(p / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[index]
+
+
+stats = StatsRegistry()
+
+
+class ProfilingMiddleware(object):
+    """
+    Put this first in MIDDLEWARE_CLASSES, so that the time spent in the other middleware is included.
+    """
+
+    def process_request(self, request):
+        if not getattr(settings, 'RANGO_PROFILING', False):
+            return
+
+        install_template_timer()
+        profile = RequestProfile()
+        for connection in connections.all():
+            # Make the connection log its queries (and their durations) even with DEBUG off
+            profile.query_marks[connection.alias] = (connection.force_debug_cursor, len(connection.queries_log))
+            connection.force_debug_cursor = True
+
+        request.rango_profile = _local.profile = profile
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, 'rango_profile', None)
+        if profile is not None:
+            profile.view_name = request.resolver_match.view_name
+
+    def process_response(self, request, response):
+        profile = getattr(request, 'rango_profile', None)
+        if profile is None:
+            return response
+
+        _local.profile = None
+        query_count = 0
+        sql_time = 0.0
+        for connection in connections.all():
+            if connection.alias not in profile.query_marks:
+                continue
+            force_debug_cursor, mark = profile.query_marks[connection.alias]
+            connection.force_debug_cursor = force_debug_cursor
+            queries = list(connection.queries_log)[mark:]
+            query_count += len(queries)
+            sql_time += sum(float(query['time']) for query in queries)
+
+        view_name = profile.view_name or request.path
+        stats.add(view_name, ((time.time() - profile.started) * 1000, query_count, sql_time * 1000,
+                              profile.template_time * 1000, profile.cache_hits, profile.cache_misses))
+
+        self.check_query_budget(view_name, query_count)
+        return response
+
+    @staticmethod
+    def check_query_budget(view_name, query_count):
+        budget = getattr(settings, 'RANGO_QUERY_BUDGETS', {}).get(view_name)
+        if budget is None or query_count <= budget:
+            return
+
+        message = "%s issued %d queries, over its budget of %d" % (view_name, query_count, budget)
+        if getattr(settings, 'RANGO_QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,188 @@
+"""
+Rate limiting of the views that write.
+
+RANGO_RATE_LIMITS maps view names (e.g. 'rango:add_page') to a (burst, seconds) pair: each client may POST to the view
+burst times in a row, and earns the right to one more request every seconds / burst seconds after that - a token
+bucket holding up to burst tokens. Clients are told apart by user when logged in, by IP address (REMOTE_ADDR, which
+the proxy in front of the application has to set to the client's address) otherwise. A request finding the bucket
+empty gets a 429 response, with a Retry-After header saying when the next token is due.
+
+Safe (e.g. GET) requests and views without a limit only cost RateLimitMiddleware a method check and a dict lookup.
+
+The buckets are kept in the store named by RANGO_RATE_LIMIT_STORE:
+
+- 'local' (LocalStore) keeps them in the process, spread over lock-protected shards so concurrent requests rarely
+  wait on each other. Each process counts on its own, so a client may get up to one burst per process.
+- 'cache' (CacheStore) keeps them in the shared cache, so that every process counts together. Reading and writing a
+  bucket are two cache round-trips and aren't atomic: concurrent requests of one client may both get the same token.
+
+Any other value is taken as the dotted path of a class with the same take() method.
+
+The number of allowed and limited requests per view is shown to staff at /rango/_stats/.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+BUCKET_KEY = 'rango:ratelimit:%s'
+
+
+def get_limits():
+    return getattr(settings, 'RANGO_RATE_LIMITS', {})
+
+
+def take_token(bucket, now, burst, rate):
+    """
+    Take a token from bucket, a (tokens, updated at) pair or None for a full one, refilled at rate tokens per second.
+    Returns the new state of the bucket and how many seconds to wait for a token - 0 when one was taken.
+    """
+    if bucket is None:
+        tokens = float(burst)
+    else:
+        tokens = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+def seconds_to_full(bucket, burst, rate):
+    return (burst - bucket[0]) / rate
+
+
+class LocalStore(object):
+    """
+    Token buckets kept in the process, in SHARDS dicts with a lock each.
+    """
+    SHARDS = 64
+
+    def __init__(self):
+        self._shards = [(threading.Lock(), {}) for _ in range(self.SHARDS)]
+
+    def take(self, key, burst, rate, now=None):
+        now = now or time.time()
+        lock, buckets = self._shards[hash(key) % self.SHARDS]
+        with lock:
+            bucket, wait = take_token(buckets.get(key), now, burst, rate)
+            buckets[key] = bucket + (now + seconds_to_full(bucket, burst, rate), )
+            if len(buckets) > getattr(settings, 'RANGO_RATE_LIMIT_LOCAL_MAX_KEYS', 100000) // self.SHARDS:
+                self._prune(buckets, now)
+        return wait
+
+    @staticmethod
+    def _prune(buckets, now):
+        # A bucket that has filled up again is the same as no bucket at all
+        for key in [key for key, bucket in buckets.items() if bucket[2] <= now]:
+            del buckets[key]
+
+    def clear(self):
+        for lock, buckets in self._shards:
+            with lock:
+                buckets.clear()
+
+
+class CacheStore(object):
+    """
+    Token buckets kept in the shared cache, each expiring once it would have filled up again.
+    """
+
+    def take(self, key, burst, rate, now=None):
+        now = now or time.time()
+        cache_key = BUCKET_KEY % key
+        bucket, wait = take_token(cache.get(cache_key), now, burst, rate)
+        cache.set(cache_key, bucket, int(math.ceil(seconds_to_full(bucket, burst, rate))) + 1)
+        return wait
+
+    def clear(self):
+        # Buckets expire on their own; there is no listing them
+        pass
+
+
+STORES = {
+    'local': LocalStore,
+    'cache': CacheStore,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                name = getattr(settings, 'RANGO_RATE_LIMIT_STORE', 'local')
+                _store = (STORES.get(name) or import_string(name))()
+    return _store
+
+
+class RateLimitStats(object):
+    """
+    Number of allowed and limited requests per rate-limited view, since the process started or the last reset().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: [0, 0])
+
+    def add(self, view_name, limited):
+        with self._lock:
+            self._counts[view_name][1 if limited else 0] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def summary(self):
+        with self._lock:
+            return dict((name, {'allowed': allowed, 'limited': limited})
+                        for name, (allowed, limited) in self._counts.items())
+
+
+stats = RateLimitStats()
+
+
+def client_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated():
+        return 'user:%s' % user.pk
+    return 'ip:%s' % request.META.get('REMOTE_ADDR', '')
+
+
+def too_many_requests(wait):
+    seconds = int(math.ceil(wait))
+    response = HttpResponse("Too many requests, please try again in %d seconds." % seconds, status=429,
+                            content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(seconds)
+    return response
+
+
+class RateLimitMiddleware(object):
+    """
+    Enforce RANGO_RATE_LIMITS. Put it after AuthenticationMiddleware, so that logged-in users are told apart by user.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in SAFE_METHODS:
+            return None
+
+        view_name = request.resolver_match.view_name
+        limit = get_limits().get(view_name)
+        if limit is None:
+            return None
+
+        burst, seconds = limit
+        wait = get_store().take('%s:%s' % (view_name, client_key(request)), burst, float(burst) / seconds)
+        stats.add(view_name, limited=bool(wait))
+        if wait:
+            return too_many_requests(wait)
+        return None
@@ -0,0 +1,74 @@
+"""
+Whole-response caching for anonymous visitors.
+
+Logged-in users see a different navigation bar in base.html, so only requests without a session cookie are served
+from (and stored in) the cache. Visitors without a session never cause a session lookup either, which means a cache
+hit doesn't touch the database at all.
+
+Each cached view declares the version groups its output depends on (see rango/versions.py); the signal receivers in
+rango/signals.py bump those groups when a Category or Page changes.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from rango.profiling import record_cache_lookup
+from rango.versions import bump_versions, get_versions
+
+RESPONSE_KEY = 'rango:response:%s:%s'
+
+# Bumped when every cached response is stale, e.g. because the category sidebar shown on every page changed
+ALL_RESPONSES = 'responses'
+
+
+def is_cacheable_request(request):
+    return request.method in ('GET', 'HEAD') and settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+
+def cache_anonymous_response(*groups):
+    """
+    Cache a view's response for anonymous visitors, keyed by the full path.
+
+    groups are version group names the response depends on, formatted with the view's keyword arguments, e.g.
+    'category:{category_name_slug}'.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable_request(request):
+                return view(request, *args, **kwargs)
+
+            names = [ALL_RESPONSES] + [group.format(**kwargs) for group in groups]
+            path_hash = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+            key = RESPONSE_KEY % (path_hash, '.'.join(get_versions(names)))
+
+            cached = cache.get(key)
+            record_cache_lookup(cached is not None)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = view(request, *args, **kwargs)
+
+            # Responses that set cookies or embed a CSRF token belong to one visitor only
+            if (response.status_code == 200 and not response.streaming and not response.cookies and
+                    not request.META.get('CSRF_COOKIE_USED')):
+                cache.set(key, (response.content, response['Content-Type']),
+                          getattr(settings, 'RANGO_RESPONSE_CACHE_TIMEOUT', 600))
+
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_responses(category_slugs=(), everything=False):
+    """
+    Drop the cached index page along with the pages of the given categories, or every cached response.
+    """
+    if everything:
+        bump_versions([ALL_RESPONSES])
+    else:
+        bump_versions(['index'] + ['category:%s' % slug for slug in category_slugs if slug])
@@ -0,0 +1,199 @@
+"""
+Full-text search over pages.
+
+Pages are matched on their title, URL and category name. Two interchangeable indexes do the matching:
+
+- FTSIndex, an SQLite FTS5 table (created by migration 0011 when SQLite supports it) ranked with bm25()
+- InvertedIndex, a pure-Python inverted index built in memory on first use, for any other database
+
+Both are kept up to date by the Page/Category signal receivers in rango/signals.py. The index only returns the best
+RANGO_SEARCH_MAX_RESULTS candidates by text relevance; those are then re-ranked with their view counts, so a popular
+page beats an equally relevant obscure one.
+"""
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+
+from rango.chunks import chunked
+from rango.models import Page
+
+FTS_TABLE = 'rango_page_fts'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Relative weight of a term found in the page title, URL or category name. FTS5's bm25() takes them in column order.
+TITLE_WEIGHT = 3.0
+URL_WEIGHT = 1.0
+CATEGORY_WEIGHT = 2.0
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+class FTSIndex(object):
+    rank = 'bm25(%s, %s, %s, %s)' % (FTS_TABLE, TITLE_WEIGHT, URL_WEIGHT, CATEGORY_WEIGHT)
+    select_pages = ("SELECT p.id, p.title, p.url, c.name FROM rango_page p "
+                    "INNER JOIN rango_category c ON c.id = p.category_id")
+
+    def candidates(self, terms, limit):
+        # Every term is quoted so that user input is never read as FTS5 query syntax; the terms are ANDed together
+        match = ' '.join('"%s"' % term.replace('"', '""') for term in terms)
+        with connection.cursor() as cursor:
+            # bm25() is lower for better matches, so flip its sign to get a relevance
+            cursor.execute("SELECT rowid, -%s FROM %s WHERE %s MATCH %%s ORDER BY %s LIMIT %%s"
+                           % (self.rank, FTS_TABLE, FTS_TABLE, self.rank), [match, limit])
+            return cursor.fetchall()
+
+    def index_page(self, page_id, title, url, category_id, category_name):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM %s WHERE rowid = %%s" % FTS_TABLE, [page_id])
+            cursor.execute("INSERT INTO %s (rowid, title, url, category) VALUES (%%s, %%s, %%s, %%s)" % FTS_TABLE,
+                           [page_id, title, url, category_name])
+
+    def remove_page(self, page_id):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM %s WHERE rowid = %%s" % FTS_TABLE, [page_id])
+
+    def reindex_categories(self, category_ids):
+        with connection.cursor() as cursor:
+            for chunk in chunked(category_ids):
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute("DELETE FROM %s WHERE rowid IN (SELECT id FROM rango_page WHERE category_id IN (%s))"
+                               % (FTS_TABLE, placeholders), chunk)
+                cursor.execute("INSERT INTO %s (rowid, title, url, category) %s WHERE p.category_id IN (%s)"
+                               % (FTS_TABLE, self.select_pages, placeholders), chunk)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM %s" % FTS_TABLE)
+            cursor.execute("INSERT INTO %s (rowid, title, url, category) %s" % (FTS_TABLE, self.select_pages))
+
+
+class InvertedIndex(object):
+    """
+    Maps every term to the pages containing it, with the term's weighted frequency in each page.
+    The index is built from the database on the first search; until then there is nothing to keep up to date.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._postings = defaultdict(dict)
+        self._page_terms = {}
+        self._category_terms = {}
+
+    def candidates(self, terms, limit):
+        with self._lock:
+            if not self._built:
+                self.rebuild()
+
+            postings = [self._postings.get(term) for term in set(terms)]
+            if not all(postings):
+                return []
+
+            # Intersect starting from the rarest term, which keeps the candidate set small from the outset
+            postings.sort(key=len)
+            page_count = len(self._page_terms)
+            weights = [(posting, math.log(1.0 + float(page_count) / len(posting))) for posting in postings]
+            matches = [(page_id, sum(posting[page_id] * idf for posting, idf in weights))
+                       for page_id in postings[0] if all(page_id in posting for posting in postings[1:])]
+
+        return heapq.nlargest(limit, matches, key=lambda match: match[1])
+
+    def index_page(self, page_id, title, url, category_id, category_name):
+        with self._lock:
+            if not self._built:
+                return
+            self._remove(page_id)
+            self._add(page_id, title, url, category_id, category_name)
+
+    def remove_page(self, page_id):
+        with self._lock:
+            if self._built:
+                self._remove(page_id)
+
+    def reindex_categories(self, category_ids):
+        with self._lock:
+            if not self._built:
+                return
+            pages = Page.objects.filter(category__in=list(category_ids))
+            for page_id, title, url, category_id, category_name in pages.values_list(
+                    'id', 'title', 'url', 'category', 'category__name').iterator():
+                self._remove(page_id)
+                self._add(page_id, title, url, category_id, category_name)
+
+    def rebuild(self):
+        with self._lock:
+            self._postings.clear()
+            self._page_terms.clear()
+            self._category_terms.clear()
+            for page_id, title, url, category_id, category_name in Page.objects.values_list(
+                    'id', 'title', 'url', 'category', 'category__name').iterator():
+                self._add(page_id, title, url, category_id, category_name)
+            self._built = True
+
+    def _add(self, page_id, title, url, category_id, category_name):
+        terms = Counter()
+        for token in tokenize(title):
+            terms[token] += TITLE_WEIGHT
+        for token in tokenize(url):
+            terms[token] += URL_WEIGHT
+        # Category terms are shared by all the pages of a category; the latest name wins
+        self._category_terms[category_id] = Counter(dict((token, CATEGORY_WEIGHT) for token in tokenize(category_name)))
+        terms.update(self._category_terms[category_id])
+
+        for term, weight in terms.items():
+            self._postings[term][page_id] = weight
+        self._page_terms[page_id] = terms
+
+    def _remove(self, page_id):
+        for term in self._page_terms.pop(page_id, ()):
+            posting = self._postings[term]
+            posting.pop(page_id, None)
+            if not posting:
+                del self._postings[term]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+                    _index = FTSIndex()
+                else:
+                    _index = InvertedIndex()
+    return _index
+
+
+def search_pages(query):
+    """
+    Return the pages matching every term of the query, best first, as dicts with the page's id, title, url and views,
+    its category's name and slug, and the blended score.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return []
+
+    relevance = dict(get_search_index().candidates(terms, getattr(settings, 'RANGO_SEARCH_MAX_RESULTS', 200)))
+    if not relevance:
+        return []
+
+    views_weight = getattr(settings, 'RANGO_SEARCH_VIEWS_WEIGHT', 0.1)
+    results = list(Page.objects.filter(pk__in=list(relevance)).values(
+        'id', 'title', 'url', 'views', 'category__name', 'category__slug'))
+    for result in results:
+        result['score'] = relevance[result['id']] * (1.0 + views_weight * math.log1p(max(result['views'], 0)))
+
+    results.sort(key=lambda result: result['score'], reverse=True)
+    return results
@@ -0,0 +1,121 @@
+"""
+The category sidebar.
+
+With thousands of categories the sidebar can't list them all, so it only expands the branch of the active category:
+the root categories, the children of each ancestor of the active category, and the children of the active category
+itself. The children of each category are cached as a list of pre-rendered entries, per parent, so showing a branch
+costs a single cache round-trip - the ids of the categories along the branch are read off the active category's path
+(see rango/paths.py). The lists are keyed by the sidebar version, which the signal receivers in rango/signals.py bump
+whenever categories are created, renamed, moved or deleted.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.template.loader import get_template
+
+from rango.models import Category
+from rango.paths import path_ids
+from rango.profiling import record_cache_lookup
+from rango.versions import bump_versions, get_versions
+
+CHILDREN_KEY = 'rango:sidebar:%s:%s'
+
+# Part of the key of the sidebar fragments cached by base.html
+SIDEBAR_VERSION = 'sidebar'
+
+# html and active_html are the pre-rendered link to the category in its plain and highlighted form. Highlighting is
+# left to the caller, so a single cached copy serves every page regardless of which category is active.
+SidebarEntry = namedtuple('SidebarEntry', ['id', 'slug', 'name', 'path', 'child_count', 'html', 'active_html'])
+
+Branch = namedtuple('Branch', ['ancestors', 'children'])
+
+
+def get_cache_timeout():
+    return getattr(settings, 'RANGO_SIDEBAR_CACHE_TIMEOUT', 300)
+
+
+def children_key(version, parent_id):
+    return CHILDREN_KEY % (version, parent_id or 'root')
+
+
+def get_children(parent_ids):
+    """
+    Dict of parent id (None for the root categories) -> the SidebarEntry of each of its children, in order, for the
+    given parents. The lists missing from the cache are built with a single query.
+    """
+    version = get_sidebar_version()
+    keys = dict((children_key(version, parent_id), parent_id) for parent_id in parent_ids)
+    found = cache.get_many(list(keys))
+    for key in keys:
+        record_cache_lookup(key in found)
+
+    children = dict((keys[key], entries) for key, entries in found.items())
+    missing = [parent_id for parent_id in keys.values() if parent_id not in children]
+    if missing:
+        built = build_children(missing)
+        cache.set_many(dict((children_key(version, parent_id), built[parent_id]) for parent_id in missing),
+                       get_cache_timeout())
+        children.update(built)
+
+    return children
+
+
+def build_children(parent_ids):
+    item_template = get_template('rango/cats_item.html')
+    children = dict((parent_id, []) for parent_id in parent_ids)
+
+    parents = Q(parent__in=[parent_id for parent_id in parent_ids if parent_id is not None])
+    if None in children:
+        parents |= Q(parent__isnull=True)
+
+    rows = (Category.objects.filter(parents).order_by('id').values_list('id', 'slug', 'name', 'path', 'parent')
+            .annotate(child_count=Count('children')))
+    for category_id, slug, name, path, parent_id, child_count in rows:
+        context = {'slug': slug, 'name': name, 'child_count': child_count}
+        html = item_template.render(dict(context, active=False))
+        active_html = item_template.render(dict(context, active=True))
+        children[parent_id].append(SidebarEntry(category_id, slug, name, path, child_count, html, active_html))
+
+    return children
+
+
+def get_category_sidebar(active_path=None):
+    """
+    The sidebar for a page showing the category at active_path (or no category), as a nested list of
+    {'html': ..., 'children': [...]} dicts: children is None for the categories outside the active branch.
+    """
+    branch = [None] + path_ids(active_path)
+    children = get_children(branch)
+    active_id = branch[-1]
+
+    def entries(parent_id):
+        return [{'html': entry.active_html if entry.id == active_id else entry.html,
+                 'children': entries(entry.id) if entry.id in children else None}
+                for entry in children[parent_id]]
+
+    return entries(None)
+
+
+def get_branch(path):
+    """
+    The SidebarEntry of each ancestor of the category at path, root first, and of each of its children - with the
+    same cache lookup as the sidebar, so usually no query at all.
+    """
+    branch = [None] + path_ids(path)
+    children = get_children(branch)
+
+    ancestors = []
+    for parent_id, category_id in zip(branch[:-2], branch[1:-1]):
+        ancestors.extend(entry for entry in children[parent_id] if entry.id == category_id)
+
+    return Branch(ancestors, children[branch[-1]])
+
+
+def get_sidebar_version():
+    return get_versions([SIDEBAR_VERSION])[0]
+
+
+def invalidate_category_sidebar():
+    bump_versions([SIDEBAR_VERSION])
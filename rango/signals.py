@@ -0,0 +1,230 @@
+from django.contrib.auth.models import User
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from rango import leaderboard
+from rango.api import bump_api_versions
+from rango.auth_backends import forget_user
+from rango.counters import counters_flushed, recount_category_pages
+from rango.db_router import check_connections, mark_checked
+from rango.hierarchy import ancestor_slugs, invalidate_subtree_totals, subtree_slugs
+from rango.images import pipeline
+from rango.models import Category, CategorySlugHistory, Page, UserProfile, loaded_counters
+from rango.response_cache import purge_responses
+from rango.search import get_search_index
+from rango.sidebar import invalidate_category_sidebar
+from rango.slugs import forget_slugs
+from rango.trending import invalidate_trending
+
+# Sent after categories or pages were written with bulk_create() or update(), which don't send post_save, with the ids
+# of the categories that were created or had pages added or changed
+pages_bulk_changed = Signal(providing_args=['category_ids'])
+
+
+def get_page_category(page, category_id):
+    """
+    (slug, name, path) of the given category of a page, without a query when the page already holds that category.
+    Returns (None, None, None) when the category is gone.
+    """
+    if Page.category.is_cached(page) and page.category_id == category_id:
+        return page.category.slug, page.category.name, page.category.path
+    return Category.objects.filter(pk=category_id).values_list('slug', 'name', 'path').first() or (None, None, None)
+
+
+def get_branch_slugs(slug, path):
+    """
+    The slug of a category followed by those of its ancestors, whose subtree listings show its pages too.
+    """
+    return [slug] + ancestor_slugs(path) if slug else []
+
+
+def get_category_slugs(category):
+    """
+    The current slug of a category along with the ones it went by before being renamed.
+    """
+    return [category.slug] + list(category.slug_history.values_list('slug', flat=True))
+
+
+def record_slug_change(category, old_slug):
+    # Keep the old URL working, and let the new slug take over from any category that went by it before
+    CategorySlugHistory.objects.filter(slug=category.slug).delete()
+    CategorySlugHistory.objects.update_or_create(slug=old_slug, defaults={'category': category})
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    renamed = not created and (instance.name != instance._loaded_name or instance.slug != instance._loaded_slug)
+    moved = not created and instance.path != instance._loaded_path
+
+    if created:
+        # The slug may have been resolved to a category that went by it before
+        CategorySlugHistory.objects.filter(slug=instance.slug).delete()
+        forget_slugs([instance.slug])
+    elif renamed:
+        if instance.slug != instance._loaded_slug:
+            record_slug_change(instance, instance._loaded_slug)
+        forget_slugs(get_category_slugs(instance))
+    if moved:
+        # The cached refs of the whole subtree hold its old paths
+        forget_slugs(subtree_slugs(instance.path))
+
+    if created or moved:
+        invalidate_subtree_totals()
+
+    if created or renamed or moved:
+        # A new, renamed or moved category changes the sidebar rendered on every page
+        invalidate_category_sidebar()
+        purge_responses(everything=True)
+        bump_api_versions(everything=True)
+        if not created:
+            # The category name is part of what its pages are found by
+            get_search_index().reindex_categories([instance.id])
+    else:
+        purge_responses([instance.slug])
+        bump_api_versions([instance.slug])
+
+    instance._loaded_name = instance.name
+    instance._loaded_slug = instance.slug
+    instance._loaded_parent_id = instance.parent_id
+    instance._loaded_path = instance.path
+    instance._loaded_counters = loaded_counters(instance, Category.COUNTERS)
+    leaderboard.invalidate_categories()
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    # The slug history goes along with the category, so this is the last chance to find out its old slugs
+    forget_slugs(get_category_slugs(instance))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    invalidate_category_sidebar()
+    invalidate_subtree_totals()
+    purge_responses(everything=True)
+    bump_api_versions(everything=True)
+    leaderboard.invalidate_categories()
+    leaderboard.invalidate_pages()
+    invalidate_trending()
+
+
+@receiver(post_save, sender=Page)
+def page_saved(sender, instance, created, **kwargs):
+    slug, name, path = get_page_category(instance, instance.category_id)
+    changed_slugs = get_branch_slugs(slug, path)
+    leaderboard.invalidate_pages()
+
+    if created or instance.category_id != instance._loaded_category_id:
+        invalidate_subtree_totals()
+
+    if created:
+        Category.objects.filter(pk=instance.category_id).update(page_count=F('page_count') + 1,
+                                                                modified=timezone.now())
+    elif instance.category_id != instance._loaded_category_id:
+        Category.objects.filter(pk=instance._loaded_category_id).update(page_count=F('page_count') - 1,
+                                                                        modified=timezone.now())
+        Category.objects.filter(pk=instance.category_id).update(page_count=F('page_count') + 1,
+                                                                modified=timezone.now())
+        old_slug, old_name, old_path = get_page_category(instance, instance._loaded_category_id)
+        changed_slugs.extend(get_branch_slugs(old_slug, old_path))
+
+    instance._loaded_category_id = instance.category_id
+    instance._loaded_counters = loaded_counters(instance, Page.COUNTERS)
+    purge_responses(changed_slugs)
+    bump_api_versions(changed_slugs)
+    get_search_index().index_page(instance.id, instance.title, instance.url, instance.category_id, name)
+
+
+@receiver(post_delete, sender=Page)
+def page_deleted(sender, instance, **kwargs):
+    Category.objects.filter(pk=instance.category_id).update(page_count=F('page_count') - 1, modified=timezone.now())
+    slug, name, path = get_page_category(instance, instance.category_id)
+    purge_responses(get_branch_slugs(slug, path))
+    bump_api_versions([slug])
+    invalidate_subtree_totals()
+    get_search_index().remove_page(instance.id)
+    leaderboard.invalidate_pages()
+    invalidate_trending()
+
+
+@receiver(pages_bulk_changed)
+def pages_changed_in_bulk(sender, category_ids, **kwargs):
+    if not category_ids:
+        return
+
+    recount_category_pages(category_ids)
+    # New categories may be among them, so refresh the sidebar and everything showing it
+    invalidate_category_sidebar()
+    invalidate_subtree_totals()
+    purge_responses(everything=True)
+    bump_api_versions(everything=True)
+    get_search_index().reindex_categories(category_ids)
+    leaderboard.invalidate_categories()
+    leaderboard.invalidate_pages()
+
+
+@receiver(counters_flushed)
+def counters_written(sender, increments, **kwargs):
+    page_ids = set()
+    category_ids = set()
+    category_slugs = set()
+    for model, field, lookup, key in increments:
+        if (model, field, lookup) == (Page, 'views', 'pk'):
+            page_ids.add(key)
+        elif (model, field, lookup) == (Category, 'likes', 'pk'):
+            category_ids.add(key)
+        elif (model, lookup) == (Category, 'slug'):
+            category_slugs.add(key)
+
+    changed_category_ids = set(category_ids)
+    if page_ids:
+        changed_category_ids.update(leaderboard.update_pages(page_ids))
+    if category_ids:
+        leaderboard.update_categories(category_ids)
+
+    # Counts shown by the API changed; the HTML responses are allowed to lag (see RANGO_RESPONSE_CACHE_TIMEOUT)
+    if changed_category_ids:
+        category_slugs.update(Category.objects.filter(pk__in=changed_category_ids).values_list('slug', flat=True))
+    if category_slugs:
+        bump_api_versions(category_slugs)
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_saved(sender, instance, **kwargs):
+    if instance.picture and instance.picture.name != instance._loaded_picture:
+        # Process the picture once it is committed, so that the worker thread can see it
+        profile_id = instance.id
+        transaction.on_commit(lambda: pipeline.submit(profile_id))
+
+    instance._loaded_picture = instance.picture.name
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # The user is cached for rango.auth_backends.CachedModelBackend
+    forget_user(instance.id)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def profile_changed(sender, instance, **kwargs):
+    # The profile is cached along with its user
+    forget_user(instance.user_id)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    # A new connection is known to work
+    mark_checked(connection)
+
+
+@receiver(request_started)
+def health_check_connections(sender, **kwargs):
+    # Persistent connections may have been dropped by the database server while they sat idle
+    check_connections()
@@ -0,0 +1,114 @@
+"""
+Resolution of category slugs, as found in URLs, to categories.
+
+Category pages look their category up by slug on every request. The id, name, slug and path of each category are
+cached in two tiers: a small LRU dictionary inside the process, checked first, and the shared cache. The signal
+receivers in rango/signals.py drop the entries of a category when it is created, renamed, moved or deleted. Other
+processes notice within RANGO_SLUG_CACHE_LOCAL_TIMEOUT seconds, when their local entries expire.
+
+Slugs a category went by before being renamed (see CategorySlugHistory) resolve to the category as it is now, so the
+caller can redirect from the old slug to the current one.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from rango.models import Category, CategorySlugHistory
+
+SLUG_KEY = 'rango:category-ref:%s'
+
+# Stands in for a model instance in templates and views that only need these fields
+CategoryRef = namedtuple('CategoryRef', ['id', 'name', 'slug', 'path'])
+
+
+def get_local_size():
+    return getattr(settings, 'RANGO_SLUG_CACHE_SIZE', 1000)
+
+
+def get_local_timeout():
+    return getattr(settings, 'RANGO_SLUG_CACHE_LOCAL_TIMEOUT', 30)
+
+
+class LocalCache(object):
+    """
+    Thread-safe, size-bounded LRU mapping whose entries expire after a while.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                return None
+            # Move it back to the most recently used end
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + get_local_timeout(), value)
+            while len(self._entries) > get_local_size():
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_cache = LocalCache()
+
+
+def query_category(slug):
+    row = Category.objects.filter(slug=slug).values_list('id', 'name', 'slug', 'path').first()
+    if row is None:
+        row = CategorySlugHistory.objects.filter(slug=slug).values_list(
+            'category__id', 'category__name', 'category__slug', 'category__path').first()
+    return CategoryRef(*row) if row else None
+
+
+def resolve_category(slug):
+    """
+    The CategoryRef of the category that goes, or used to go, by slug; None if there is no such category.
+    When the slug is an old one, the returned ref's slug differs from it.
+    """
+    ref = local_cache.get(slug)
+    if ref is not None:
+        return ref
+
+    key = SLUG_KEY % slug
+    row = cache.get(key)
+    if row is not None:
+        ref = CategoryRef(*row)
+    else:
+        ref = query_category(slug)
+        if ref is None:
+            # Unknown slugs aren't cached: there is no telling how many there are
+            return None
+        cache.set(key, tuple(ref), None)
+
+    local_cache.set(slug, ref)
+    return ref
+
+
+def forget_slugs(slugs):
+    """
+    Drop the cached resolution of the given slugs, in this process and in the shared cache.
+    """
+    slugs = [slug for slug in slugs if slug]
+    local_cache.delete_many(slugs)
+    cache.delete_many([SLUG_KEY % slug for slug in slugs])
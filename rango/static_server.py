@@ -0,0 +1,124 @@
+import json
+import mimetypes
+import os
+from collections import namedtuple
+from wsgiref.util import FileWrapper
+
+from django.conf import settings
+
+# Fingerprinted names change whenever their content does, so they can be cached for good
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+BLOCK_SIZE = 64 * 1024
+
+# Precompressed variants written by rango.storage, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+Variant = namedtuple('Variant', ['path', 'headers'])
+
+
+class StaticFile(object):
+    """
+    A collected static file, together with the precompressed copies of it found on disk. The response headers of
+    every variant are worked out once, when the server starts up.
+    """
+
+    def __init__(self, path, immutable):
+        content_type, _ = mimetypes.guess_type(path)
+        cache_control = IMMUTABLE_CACHE_CONTROL if immutable else DEFAULT_CACHE_CONTROL
+        self.variants = {}
+
+        for encoding, suffix in (('identity', ''),) + ENCODINGS:
+            if not os.path.isfile(path + suffix):
+                continue
+
+            stat = os.stat(path + suffix)
+            headers = [
+                ('Content-Type', content_type or 'application/octet-stream'),
+                ('Content-Length', str(stat.st_size)),
+                ('Cache-Control', cache_control),
+                ('ETag', '"%x-%x%s"' % (int(stat.st_mtime), stat.st_size, suffix.replace('.', '-'))),
+            ]
+            if encoding != 'identity':
+                headers.append(('Content-Encoding', encoding))
+            self.variants[encoding] = Variant(path + suffix, headers)
+
+        if len(self.variants) > 1:
+            for variant in self.variants.values():
+                variant.headers.append(('Vary', 'Accept-Encoding'))
+
+    def get_variant(self, accept_encoding):
+        accepted = [value.split(';')[0].strip() for value in accept_encoding.split(',')]
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                return self.variants[encoding]
+        return self.variants['identity']
+
+
+class StaticFilesWSGIMiddleware(object):
+    """
+    WSGI middleware serving the files collected into STATIC_ROOT ahead of Django, which doesn't serve static files
+    outside of DEBUG.
+
+    STATIC_ROOT is scanned once, on start up, so serving a file never goes further than a dictionary lookup: a
+    precompressed copy is picked from the request's Accept-Encoding, conditional requests are answered with a 304,
+    and the names fingerprinted by collectstatic (listed in its manifest) are sent with a far-future Cache-Control.
+    Every other request goes through to the wrapped application. Run collectstatic again, and restart, after
+    changing the static files.
+    """
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = root or settings.STATIC_ROOT
+        self.prefix = prefix or settings.STATIC_URL
+        self.files = self.scan() if self.root and os.path.isdir(self.root) else {}
+
+    def scan(self):
+        immutable = set(self.load_manifest().values())
+        files = {}
+
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                files[name] = StaticFile(path, name in immutable)
+
+        return files
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.root, 'staticfiles.json')) as manifest:
+                return json.load(manifest).get('paths', {})
+        except (IOError, ValueError):
+            return {}
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        static_file = None
+
+        if path.startswith(self.prefix) and environ['REQUEST_METHOD'] in ('GET', 'HEAD'):
+            static_file = self.files.get(path[len(self.prefix):])
+
+        if static_file is None:
+            return self.application(environ, start_response)
+
+        return self.serve(static_file, environ, start_response)
+
+    def serve(self, static_file, environ, start_response):
+        variant = static_file.get_variant(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        etag = dict(variant.headers)['ETag']
+
+        if etag in [value.strip() for value in environ.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+            start_response('304 Not Modified', [header for header in variant.headers
+                                                 if header[0] not in ('Content-Type', 'Content-Length')])
+            return []
+
+        start_response('200 OK', variant.headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+
+        file_wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+        return file_wrapper(open(variant.path, 'rb'), BLOCK_SIZE)
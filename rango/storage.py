@@ -0,0 +1,67 @@
+import gzip
+import io
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Static files storage that, on top of fingerprinting every file with its content hash (see
+    ManifestStaticFilesStorage), writes a gzip-compressed copy next to each compressible file - plus a brotli one when
+    the brotli package is installed - for rango.static_server to hand out to clients that accept them.
+    """
+    compressible_extensions = ('.css', '.js', '.json', '.map', '.svg', '.html', '.txt', '.xml', '.ico', '.ttf', '.otf',
+                               '.eot')
+
+    # A compressed copy that doesn't save at least 5% isn't worth the client's decompression
+    max_compressed_ratio = 0.95
+
+    def stored_name(self, name):
+        try:
+            return super(CompressedManifestStaticFilesStorage, self).stored_name(name)
+        except ValueError:
+            # The file hasn't been collected. That is expected while developing or running the tests, where it is
+            # referred to by its plain name, but anywhere else a page would link to a file that isn't there.
+            if getattr(settings, 'RANGO_STATIC_MANIFEST_STRICT', not settings.DEBUG):
+                raise
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        for post_processed in super(CompressedManifestStaticFilesStorage, self).post_process(paths, dry_run,
+                                                                                             **options):
+            yield post_processed
+
+        if dry_run:
+            return
+
+        # Both the fingerprinted copies and the originals can be requested
+        for name in set(paths) | set(self.hashed_files.values()):
+            if os.path.splitext(name)[1].lower() in self.compressible_extensions and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as original:
+            content = original.read()
+
+        compressed = io.BytesIO()
+        # A fixed mtime keeps the output identical from one collectstatic run to the next
+        with gzip.GzipFile(filename='', mode='wb', fileobj=compressed, compresslevel=9, mtime=0) as gzip_file:
+            gzip_file.write(content)
+        self.save_compressed(name + '.gz', content, compressed.getvalue())
+
+        if brotli is not None:
+            self.save_compressed(name + '.br', content, brotli.compress(content))
+
+    def save_compressed(self, name, content, compressed):
+        if self.exists(name):
+            self.delete(name)
+        if len(compressed) <= len(content) * self.max_compressed_ratio:
+            self._save(name, ContentFile(compressed))
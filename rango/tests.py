@@ -1,3 +1,1368 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.checks import run_checks
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models.signals import post_save
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.six import StringIO
+from django.utils.six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from PIL import Image
+
+from rango import counters, db_router, search
+from rango.auth_backends import USER_KEY, get_user_cache
+from rango.benchmark import BENCH_USERNAME, seed
+from rango.counters import (
+    CounterBuffer, flush_counters, like_category, track_category_view, track_page_view, write_increments,
+)
+from rango.db_router import PIN_COOKIE_NAME, check_connections, mark_checked
+from rango.export import export, export_until
+from rango.images import process_picture, process_profile
+from rango.leaderboard import top_pages
+from rango.linkcheck import check_pages, check_url, pages_due
+from rango.loader import InvalidRecord, clean_record, load_records
+from rango.middleware import VISIT_COOKIE_NAME
+from rango.models import (
+    ActivityBucket, Category, CategorySlugHistory, DailyVisitors, LinkCheck, Page, TrendingPage, UserProfile,
+)
+from rango.pagination import make_cursor, paginate_pages, parse_cursor
+from rango.paths import path_segment
+from rango.profiling import QueryBudgetExceeded
+from rango.ratelimit import LocalStore, get_store
+from rango.response_cache import cache_anonymous_response, purge_responses
+from rango.search import FTS_TABLE, FTSIndex, InvertedIndex, search_pages
+from rango.sidebar import get_category_sidebar
+from rango.slugs import local_cache, resolve_category
+from rango.static_server import IMMUTABLE_CACHE_CONTROL, StaticFilesWSGIMiddleware
+from rango.storage import CompressedManifestStaticFilesStorage
+from rango.trending import compact_activity, compute_trending, hour_start, trending_categories, trending_pages
+from rango.urlcanon import canonical_url, url_hash
+
+
+class RangoTestCase(TestCase):
+    def setUp(self):
+        # The caches outlive the test transactions
+        cache.clear()
+        local_cache.clear()
+
+    def tearDown(self):
+        # So do the buffered counters: write them out while the test's transaction can still roll them back
+        flush_counters()
+
+    def add_page(self, category, title, url=None):
+        return Page.objects.create(category=category, title=title, url=url or 'http://example.com/%s/' % title)
+
+
+class PageCountTests(RangoTestCase):
+    def test_page_count_follows_pages(self):
+        python = Category.objects.create(name='Python')
+        django = Category.objects.create(name='Django')
+        page = self.add_page(python, 'tutorial')
+        self.add_page(python, 'docs')
+        self.assertEqual(Category.objects.get(pk=python.pk).page_count, 2)
+
+        page.category = django
+        page.save()
+        self.assertEqual(Category.objects.get(pk=python.pk).page_count, 1)
+        self.assertEqual(Category.objects.get(pk=django.pk).page_count, 1)
+
+        page.delete()
+        self.assertEqual(Category.objects.get(pk=django.pk).page_count, 0)
+
+    def test_saving_a_stale_category_keeps_its_counters(self):
+        python = Category.objects.create(name='Python')
+        stale = Category.objects.get(pk=python.pk)
+        self.add_page(python, 'tutorial')
+        like_category(python.pk)
+        flush_counters()
+
+        stale.name = 'Python 3'
+        stale.save()
+
+        category = Category.objects.get(pk=python.pk)
+        self.assertEqual(category.name, 'Python 3')
+        self.assertEqual(category.page_count, 1)
+        self.assertEqual(category.likes, 1)
+
+    def test_counters_changed_on_the_instance_are_saved(self):
+        python = Category.objects.create(name='Python')
+        stale = Category.objects.get(pk=python.pk)
+        like_category(python.pk)
+        flush_counters()
+
+        stale.likes = 10
+        stale.save()
+        self.assertEqual(Category.objects.get(pk=python.pk).likes, 10)
+
+    def test_saving_a_stale_page_keeps_its_views(self):
+        page = self.add_page(Category.objects.create(name='Python'), 'tutorial')
+        stale = Page.objects.get(pk=page.pk)
+        track_page_view(page.pk)
+        flush_counters()
+
+        stale.title = 'The tutorial'
+        stale.save()
+        self.assertEqual(Page.objects.get(pk=page.pk).views, 1)
+
+
+class VisitTrackerTests(RangoTestCase):
+    def visitors_today(self):
+        flush_counters()
+        return sum(DailyVisitors.objects.values_list('visitors', flat=True))
+
+    def test_first_page_view_of_the_day_counts(self):
+        response = self.client.get('/rango/')
+        self.assertIn(VISIT_COOKIE_NAME, response.cookies)
+        self.assertEqual(self.visitors_today(), 1)
+
+        # The cookie is only sent again the next day
+        response = self.client.get('/rango/about/')
+        self.assertNotIn(VISIT_COOKIE_NAME, response.cookies)
+        self.assertEqual(self.visitors_today(), 1)
+
+    def test_api_calls_are_not_visits(self):
+        for _ in range(10):
+            response = self.client.get('/rango/api/categories/')
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(VISIT_COOKIE_NAME, response.cookies)
+        self.assertEqual(self.visitors_today(), 0)
+
+    def test_redirects_and_posts_are_not_visits(self):
+        response = self.client.get('/rango/goto/')
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn(VISIT_COOKIE_NAME, response.cookies)
+
+        response = self.client.post('/rango/search/', {'q': 'python'})
+        self.assertNotIn(VISIT_COOKIE_NAME, response.cookies)
+        self.assertEqual(self.visitors_today(), 0)
+
+
+class LoaderTests(RangoTestCase):
+    def setUp(self):
+        super(LoaderTests, self).setUp()
+        self.records = [
+            {'category': 'Python', 'views': 128, 'likes': 64},
+            {'category': 'Python', 'title': 'Official Python Tutorial', 'url': 'http://docs.python.org/2/tutorial/',
+             'views': 15},
+            {'category': 'Django', 'title': 'Django Rocks', 'url': 'http://www.djangorocks.com/'},
+        ]
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_loading_twice_updates_instead_of_duplicating(self):
+        load_records(self.records)
+        self.records[1]['views'] = 16
+        stats = load_records(self.records)
+
+        self.assertEqual((stats.categories_created, stats.pages_created, stats.pages_updated), (0, 0, 1))
+        python = Category.objects.get(name='Python')
+        self.assertEqual((python.views, python.likes, python.page_count), (128, 64, 1))
+        self.assertEqual(Page.objects.get(title='Official Python Tutorial').views, 16)
+        self.assertEqual(Category.objects.get(name='Django').page_count, 1)
+
+    def test_large_batches_stay_within_the_parameter_limit(self):
+        # One page in each of 600 categories: a single lookup would take 1200 parameters
+        records = [{'category': 'Category %d' % number, 'title': 'Page %d' % number,
+                    'url': 'http://example.com/%d/' % number} for number in range(600)]
+        load_records(records, batch_size=600)
+        with CaptureQueriesContext(connection) as queries:
+            stats = load_records(records, batch_size=600)
+
+        lookups = [query['sql'] for query in queries.captured_queries if '"rango_page"."title" IN' in query['sql']]
+        self.assertEqual(len(lookups), 3)
+        self.assertEqual((stats.categories_created, stats.pages_created, stats.pages_updated), (0, 0, 0))
+        self.assertEqual(Page.objects.count(), 600)
+
+    def test_invalid_records_are_refused(self):
+        for record in [{'title': 'No category'}, {'category': ' '}, {'category': 'Python', 'views': 'many'},
+                       {'category': 'Python', 'likes': 1.5}, {'category': 'Python', 'views': -1},
+                       {'category': ['Python']}, {'category': 'x' * 129}, 'Python']:
+            with self.assertRaises(InvalidRecord):
+                clean_record(record)
+
+    def test_command_reports_the_line_of_an_invalid_record(self):
+        path = self.write('rango.jsonl', '{"category": "Python"}\n\n{"title": "No category"}\n')
+        with self.assertRaisesRegexp(CommandError, r'^Line 3: The category is missing\.'):
+            call_command('load_rango', path, stdout=StringIO())
+
+        path = self.write('rango.csv', 'category,title,url,views\nPython,Tutorial,http://python.org/,lots\n')
+        with self.assertRaisesRegexp(CommandError, r'^Line 2: The views must be a whole number'):
+            call_command('load_rango', path, stdout=StringIO())
+
+    def test_command_loads_the_batches_before_an_invalid_record(self):
+        path = self.write('rango.jsonl', '{"category": "Python"}\n{"category": "Django"}\n{"category": 1}\n')
+        with self.assertRaises(CommandError):
+            call_command('load_rango', path, batch_size=1, stdout=StringIO())
+        self.assertEqual(sorted(Category.objects.values_list('name', flat=True)), ['Django', 'Python'])
+
+
+@override_settings(RANGO_PROFILING=True, RANGO_QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(RangoTestCase):
+    def setUp(self):
+        super(QueryBudgetTests, self).setUp()
+        python = Category.objects.create(name='Python')
+        for number in range(10):
+            self.add_page(python, 'page-%d' % number)
+
+    def test_views_stay_within_their_budgets(self):
+        # With the budgets of settings.py, as any N+1 query would break them
+        for path in ['/rango/', '/rango/about/', '/rango/category/python/', '/rango/search/?q=page',
+                     '/rango/api/categories/', '/rango/api/categories/python/', '/rango/api/pages/top/']:
+            self.assertEqual(self.client.get(path).status_code, 200)
+
+    def test_going_over_budget_fails_the_request(self):
+        with override_settings(RANGO_QUERY_BUDGETS={'rango:show_category': 0}):
+            with self.assertRaisesRegexp(QueryBudgetExceeded, r'^rango:show_category issued \d+ queries'):
+                self.client.get('/rango/category/python/')
+
+
+class LeaderboardTests(RangoTestCase):
+    def test_flushed_views_reorder_the_top_pages(self):
+        python = Category.objects.create(name='Python')
+        tutorial = self.add_page(python, 'tutorial')
+        docs = self.add_page(python, 'docs')
+        self.assertEqual([page['id'] for page in top_pages()], [tutorial.id, docs.id])
+
+        track_page_view(docs.id)
+        flush_counters()
+        self.assertEqual([(page['id'], page['views']) for page in top_pages()], [(docs.id, 1), (tutorial.id, 0)])
+
+    @override_settings(RANGO_LEADERBOARD_TIMEOUT=1)
+    def test_changes_made_by_other_processes_show_up_once_the_leaderboard_expires(self):
+        python = Category.objects.create(name='Python')
+        tutorial = self.add_page(python, 'tutorial')
+        docs = self.add_page(python, 'docs')
+        self.assertEqual([page['id'] for page in top_pages()], [tutorial.id, docs.id])
+
+        # An UPDATE sends no signal, just like a flush in another process doesn't reach this one's cache
+        Page.objects.filter(pk=docs.pk).update(views=10)
+        self.assertEqual([page['id'] for page in top_pages()], [tutorial.id, docs.id])
+
+        time.sleep(1.1)
+        self.assertEqual([page['id'] for page in top_pages()], [docs.id, tutorial.id])
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves /ok/ (a page titled "Stand-in"), /missing/ (404), /moved/ (a redirect to /ok/) and /local/ (a redirect to
+    a local file), counting the requests.
+    """
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path == '/ok/':
+            body = b'<html><head><title>Stand-in</title></head></html>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/moved/':
+            self.send_response(302)
+            self.send_header('Location', '/ok/')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/local/':
+            self.send_response(302)
+            self.send_header('Location', 'file:///etc/passwd')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+
+class LinkCheckTests(RangoTestCase):
+    def setUp(self):
+        super(LinkCheckTests, self).setUp()
+        StandInHandler.requests = []
+        server = HTTPServer(('127.0.0.1', 0), StandInHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+
+        python = Category.objects.create(name='Python')
+        self.pages = dict((name, self.add_page(python, name, self.base_url + path)) for name, path in [
+            ('ok', '/ok/'), ('ok again', '/ok/'), ('missing', '/missing/'), ('moved', '/moved/')])
+
+    def test_results_are_recorded(self):
+        # Batches of two pages, so that the two pages of /ok/ are read in different batches
+        self.assertEqual(check_pages(concurrency=2, timeout=5, batch_size=2), (4, 1))
+
+        results = dict((check.page.title, check) for check in LinkCheck.objects.select_related('page'))
+        self.assertEqual((results['ok'].ok, results['ok'].status, results['ok'].title), (True, 200, 'Stand-in'))
+        self.assertEqual(results['ok again'].status, 200)
+        self.assertEqual((results['missing'].ok, results['missing'].status), (False, 404))
+        self.assertEqual((results['moved'].ok, results['moved'].final_url), (True, self.base_url + '/ok/'))
+
+        # A URL shared by several pages is fetched once
+        self.assertEqual(sorted(StandInHandler.requests), ['/missing/', '/moved/', '/ok/', '/ok/'])
+
+    def test_only_web_urls_are_fetched(self):
+        for url in ['file:///etc/passwd', 'ftp://127.0.0.1/', 'javascript:alert(1)', '/ok/', 'www.example.com']:
+            result = check_url(url, timeout=5)
+            self.assertEqual((result.ok, result.status), (False, None))
+            self.assertEqual(result.error, "Only http and https URLs are checked")
+
+        result = check_url(self.base_url + '/local/', timeout=5)
+        self.assertEqual((result.ok, result.status, result.final_url), (False, 302, 'file:///etc/passwd'))
+        self.assertEqual(StandInHandler.requests, ['/local/'])
+
+    def test_recently_checked_pages_are_not_due(self):
+        check_pages(timeout=5)
+        self.assertFalse(pages_due().exists())
+        self.assertEqual(pages_due(max_age=0).count(), len(self.pages))
+
+
+class ReplicaPinningTests(RangoTestCase):
+    def test_only_writes_pin_the_client_to_the_primary(self):
+        User.objects.create_user('curator', password='curator')
+        self.client.login(username='curator', password='curator')
+
+        response = self.client.get('/rango/add_category/')
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
+
+        response = self.client.post('/rango/add_category/', {'name': 'Python', 'views': 0, 'likes': 0})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+
+
+SHARED_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'rango'},
+    'sessions': {'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache', 'LOCATION': '127.0.0.1:11211'},
+}
+
+
+class SessionTests(RangoTestCase):
+    def setUp(self):
+        super(SessionTests, self).setUp()
+        self.user = User.objects.create_user('curator', password='curator')
+        self.client.login(username='curator', password='curator')
+
+    def client_sharing_the_session(self):
+        # Stands for another process, serving the same browser
+        client = Client()
+        client.cookies = self.client.cookies
+        return client
+
+    def test_logging_out_ends_the_session_everywhere(self):
+        other = self.client_sharing_the_session()
+        self.assertEqual(other.get('/rango/restricted/').status_code, 200)
+
+        self.client.logout()
+        self.assertEqual(other.get('/rango/restricted/').status_code, 302)
+
+    def test_password_changes_are_seen_right_away(self):
+        self.assertEqual(self.client.get('/rango/restricted/').status_code, 200)
+
+        # Changed from elsewhere, without this process hearing of it
+        user = User(pk=self.user.pk)
+        user.set_password('changed')
+        User.objects.filter(pk=self.user.pk).update(password=user.password)
+        self.assertEqual(self.client.get('/rango/restricted/').status_code, 302)
+
+    def test_per_process_caches_are_refused_for_sessions_and_users(self):
+        with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+                               AUTHENTICATION_BACKENDS=['rango.auth_backends.CachedModelBackend']):
+            self.assertEqual(sorted(error.id for error in run_checks()), ['rango.E001', 'rango.E002'])
+
+            with override_settings(CACHES=SHARED_CACHES, SESSION_CACHE_ALIAS='sessions'):
+                self.assertEqual([error.id for error in run_checks() if error.id.startswith('rango.')], [])
+
+    @override_settings(AUTHENTICATION_BACKENDS=['rango.auth_backends.CachedModelBackend'])
+    def test_cached_users_are_dropped_when_saved(self):
+        # The session remembers the backend the user logged in with
+        self.client.login(username='curator', password='curator')
+        self.client.get('/rango/restricted/')
+        self.assertIsNotNone(get_user_cache().get(USER_KEY % self.user.pk))
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(get_user_cache().get(USER_KEY % self.user.pk))
+
+
+class DuplicatePageTests(RangoTestCase):
+    def setUp(self):
+        super(DuplicatePageTests, self).setUp()
+        User.objects.create_user('curator', password='curator')
+        self.client.login(username='curator', password='curator')
+        self.python = Category.objects.create(name='Python')
+        self.tutorial = self.add_page(self.python, 'tutorial', 'http://docs.python.org/2/tutorial/')
+
+    def test_urls_pointing_to_the_same_place_share_a_hash(self):
+        self.assertEqual(canonical_url('HTTP://Docs.Python.org:80/2/tutorial/?utm_source=x&b=2&a=1#intro'),
+                         'http://docs.python.org/2/tutorial?a=1&b=2')
+        self.assertEqual(url_hash('http://docs.python.org/2/tutorial'), self.tutorial.canonical_url_hash)
+        self.assertNotEqual(url_hash('https://docs.python.org/3/tutorial/'), self.tutorial.canonical_url_hash)
+
+    def test_adding_a_duplicate_page_is_refused(self):
+        response = self.client.post('/rango/category/python/add_page/', {
+            'title': 'again', 'url': 'docs.python.org/2/tutorial?utm_medium=email', 'views': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'already been added to the Python category')
+        self.assertEqual(Page.objects.count(), 1)
+
+    def test_duplicates_within_a_bulk_add_are_refused(self):
+        response = self.client.post('/rango/category/python/add_pages/', json.dumps([
+            {'title': 'one', 'url': 'http://example.com/a'}, {'title': 'two', 'url': 'http://EXAMPLE.com/a/'}]),
+            content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(json.loads(response.content.decode('utf-8'))['errors']), ['1'])
+
+    def test_dedupe_merges_the_views_into_the_first_page(self):
+        Page.objects.filter(pk=self.tutorial.pk).update(views=5)
+        # Added behind the duplicate check's back, as a bulk load would
+        duplicate = self.add_page(self.python, 'duplicate', 'http://docs.python.org/2/tutorial')
+        Page.objects.filter(pk=duplicate.pk).update(views=3)
+
+        call_command('dedupe_pages', stdout=StringIO())
+        self.assertEqual(list(Page.objects.values_list('id', 'views')), [(self.tutorial.pk, 8)])
+        self.assertEqual(Category.objects.get(pk=self.python.pk).page_count, 1)
+
+
+class CategoryTreeTests(RangoTestCase):
+    def setUp(self):
+        super(CategoryTreeTests, self).setUp()
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django', parent=self.python)
+        self.orm = Category.objects.create(name='ORM', parent=self.django)
+        self.java = Category.objects.create(name='Java')
+
+    def test_new_categories_have_their_path_when_post_save_is_sent(self):
+        paths = []
+
+        def saved(sender, instance, created, **kwargs):
+            paths.append(Category.objects.get(pk=instance.pk).path if created else None)
+        post_save.connect(saved, sender=Category)
+        self.addCleanup(post_save.disconnect, saved, sender=Category)
+
+        forms = Category.objects.create(name='Forms', parent=self.django)
+        self.assertEqual(paths, [self.django.path + path_segment(forms.pk)])
+        self.assertEqual((forms.path, forms.depth), (paths[0], 2))
+
+    def test_moving_a_category_moves_its_subtree(self):
+        self.django.parent = self.java
+        self.django.save()
+
+        orm = Category.objects.get(pk=self.orm.pk)
+        self.assertEqual(orm.path, path_segment(self.java.pk) + path_segment(self.django.pk) + path_segment(orm.pk))
+        self.assertEqual(orm.depth, 2)
+
+    def test_a_category_cannot_be_moved_under_itself(self):
+        django = Category.objects.get(pk=self.django.pk)
+        django.parent = self.orm
+        self.assertRaises(ValueError, django.save)
+
+    def test_subtree_listing_includes_the_pages_of_subcategories(self):
+        self.add_page(self.python, 'tutorial')
+        self.add_page(self.orm, 'querysets')
+        self.add_page(self.java, 'jvm')
+
+        response = self.client.get('/rango/category/python/')
+        self.assertEqual([page.title for page in response.context['pages']], ['tutorial'])
+        response = self.client.get('/rango/category/python/?subtree=1')
+        self.assertEqual(sorted(page.title for page in response.context['pages']), ['querysets', 'tutorial'])
+
+    def test_sidebar_only_expands_the_active_branch(self):
+        def expanded(entries):
+            return [entry['children'] is not None for entry in entries]
+
+        sidebar = get_category_sidebar(self.django.path)
+        # Python (expanded down to Django, whose children are shown too), then Java
+        self.assertEqual(expanded(sidebar), [True, False])
+        self.assertEqual(expanded(sidebar[0]['children']), [True])
+        self.assertEqual(expanded(sidebar[0]['children'][0]['children']), [False])
+
+        self.assertEqual(expanded(get_category_sidebar()), [False, False])
+
+    def test_loaded_categories_get_their_paths_with_one_update(self):
+        records = [{'category': 'Loaded %d' % number} for number in range(20)]
+        with CaptureQueriesContext(connection) as queries:
+            load_records(records)
+
+        updates = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE "rango_category" SET "path"')]
+        self.assertEqual(len(updates), 1)
+        for category in Category.objects.filter(name__startswith='Loaded '):
+            self.assertEqual((category.path, category.depth), (path_segment(category.pk), 0))
+
+
+@override_settings(RANGO_RATE_LIMITS={'rango:add_category': (3, 60)})
+class RateLimitTests(RangoTestCase):
+    def setUp(self):
+        super(RateLimitTests, self).setUp()
+        get_store().clear()
+        self.addCleanup(get_store().clear)
+        User.objects.create_user('curator', password='curator')
+        self.client.login(username='curator', password='curator')
+
+    def add_category(self, client, name):
+        return client.post('/rango/add_category/', {'name': name, 'views': 0, 'likes': 0})
+
+    def test_posts_over_the_burst_are_refused(self):
+        for number in range(3):
+            self.assertEqual(self.add_category(self.client, 'Category %d' % number).status_code, 302)
+
+        response = self.add_category(self.client, 'One too many')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+        self.assertFalse(Category.objects.filter(name='One too many').exists())
+
+        # Reading is never limited
+        self.assertEqual(self.client.get('/rango/add_category/').status_code, 200)
+
+    def test_clients_are_limited_separately(self):
+        for number in range(3):
+            self.add_category(self.client, 'Category %d' % number)
+
+        User.objects.create_user('other', password='other')
+        other = Client()
+        other.login(username='other', password='other')
+        self.assertEqual(self.add_category(other, 'Other category').status_code, 302)
+
+    def test_tokens_are_earned_back_over_time(self):
+        store = LocalStore()
+        self.assertEqual([store.take('key', 2, 0.5, now=100) for _ in range(2)], [0, 0])
+        self.assertEqual(store.take('key', 2, 0.5, now=100), 2)
+        self.assertEqual(store.take('key', 2, 0.5, now=102), 0)
+
+
+class SidebarTests(RangoTestCase):
+    def sidebar_html(self):
+        return ''.join(entry['html'] for entry in get_category_sidebar())
+
+    def test_sidebar_is_served_from_the_cache(self):
+        Category.objects.create(name='Python')
+        self.sidebar_html()
+        with self.assertNumQueries(0):
+            self.assertIn('Python', self.sidebar_html())
+
+    def test_category_changes_refresh_the_sidebar(self):
+        python = Category.objects.create(name='Python')
+        self.assertIn('Python', self.sidebar_html())
+
+        Category.objects.create(name='Django')
+        self.assertIn('Django', self.sidebar_html())
+
+        python.name = 'Python 3'
+        python.save()
+        self.assertIn('Python 3', self.sidebar_html())
+
+        python.delete()
+        self.assertNotIn('Python', self.sidebar_html())
+
+    def test_counter_changes_keep_the_cached_sidebar(self):
+        python = Category.objects.create(name='Python')
+        self.sidebar_html()
+        like_category(python.pk)
+        flush_counters()
+        with self.assertNumQueries(0):
+            self.sidebar_html()
+
+
+class CounterTests(RangoTestCase):
+    def setUp(self):
+        super(CounterTests, self).setUp()
+        python = Category.objects.create(name='Python')
+        self.pages = [self.add_page(python, 'page-%d' % number) for number in range(3)]
+
+    def views(self):
+        return [Page.objects.get(pk=page.pk).views for page in self.pages]
+
+    def test_rows_with_the_same_increment_share_an_update(self):
+        pending = {(Page, 'views', 'pk', self.pages[0].pk): 1, (Page, 'views', 'pk', self.pages[1].pk): 1,
+                   (Page, 'views', 'pk', self.pages[2].pk): 2}
+        with CaptureQueriesContext(connection) as queries:
+            write_increments(pending)
+
+        updates = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE "rango_page"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(self.views(), [1, 1, 2])
+
+    @override_settings(RANGO_COUNTER_FLUSH_THRESHOLD=3, RANGO_COUNTER_FLUSH_INTERVAL=3600)
+    def test_increments_are_buffered_until_the_threshold(self):
+        buffer = CounterBuffer()
+        buffer.add(Page, 'views', self.pages[0].pk)
+        buffer.add(Page, 'views', self.pages[0].pk)
+        self.assertEqual(self.views(), [0, 0, 0])
+
+        buffer.add(Page, 'views', self.pages[1].pk)
+        self.assertEqual(self.views(), [2, 1, 0])
+
+    def test_a_failed_flush_keeps_its_increments(self):
+        def fail(pending):
+            raise RuntimeError("The database is away")
+
+        buffer = CounterBuffer()
+        buffer.add(Page, 'views', self.pages[0].pk)
+        counters.write_increments = fail
+        try:
+            buffer.flush()
+        finally:
+            counters.write_increments = write_increments
+        self.assertEqual(self.views(), [0, 0, 0])
+
+        buffer.flush()
+        self.assertEqual(self.views(), [1, 0, 0])
+
+    def test_goto_counts_the_click_and_redirects(self):
+        response = self.client.get('/rango/goto/', {'page_id': self.pages[1].pk})
+        self.assertRedirects(response, self.pages[1].url, fetch_redirect_response=False)
+        flush_counters()
+        self.assertEqual(self.views(), [0, 1, 0])
+
+        self.assertRedirects(self.client.get('/rango/goto/', {'page_id': 'nope'}), '/rango/')
+
+
+class PaginationTests(RangoTestCase):
+    def setUp(self):
+        super(PaginationTests, self).setUp()
+        self.python = Category.objects.create(name='Python')
+        # Ties on views are broken by id
+        for number, views in enumerate([5, 3, 3, 3, 1, 0, 0]):
+            page = self.add_page(self.python, 'page-%d' % number)
+            Page.objects.filter(pk=page.pk).update(views=views)
+
+    def test_batches_cover_every_page_once_most_viewed_first(self):
+        seen, cursor = [], None
+        while True:
+            pages, cursor = paginate_pages(Page.objects.filter(category=self.python), cursor, page_size=2)
+            seen.extend(pages)
+            if cursor is None:
+                break
+
+        expected = list(Page.objects.filter(category=self.python).order_by('-views', 'id'))
+        self.assertEqual(seen, expected)
+
+    def test_cursor_round_trip(self):
+        page = Page.objects.filter(category=self.python).order_by('id')[1]
+        self.assertEqual(parse_cursor(make_cursor(page)), (3, page.id))
+        self.assertEqual(make_cursor({'views': 3, 'id': page.id}), make_cursor(page))
+
+    def test_malformed_cursor_starts_from_the_top(self):
+        for cursor in [None, '', 'abc', '3', '3.x', '1.2.3']:
+            self.assertIsNone(parse_cursor(cursor))
+            pages, _ = paginate_pages(Page.objects.filter(category=self.python), cursor, page_size=2)
+            self.assertEqual([page.views for page in pages], [5, 3])
+
+    def test_category_view_with_a_malformed_after(self):
+        response = self.client.get('/rango/category/python/', {'after': "1' OR 1=1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['pages'][0].views, 5)
+        self.assertFalse(response.context['is_first_batch'])
+
+
+class ResponseCacheTests(RangoTestCase):
+    def setUp(self):
+        super(ResponseCacheTests, self).setUp()
+        self.factory = RequestFactory()
+        self.calls = []
+
+    def make_view(self, *groups, **cookies):
+        @cache_anonymous_response(*groups)
+        def view(request, category_name_slug=None):
+            self.calls.append(request.path)
+            response = HttpResponse('call %d' % len(self.calls), content_type='text/plain')
+            for name, value in cookies.items():
+                response.set_cookie(name, value)
+            return response
+        return view
+
+    def test_anonymous_responses_are_served_from_the_cache(self):
+        view = self.make_view()
+        first = view(self.factory.get('/rango/about/'))
+        second = view(self.factory.get('/rango/about/'))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], 'text/plain')
+
+        # The query string is part of the key
+        view(self.factory.get('/rango/about/', {'q': 'python'}))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_requests_with_a_session_bypass_the_cache(self):
+        view = self.make_view()
+        request = self.factory.get('/rango/about/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = 'abc'
+        view(request)
+        view(request)
+        view(self.factory.post('/rango/about/'))
+        self.assertEqual(len(self.calls), 3)
+
+    def test_responses_setting_cookies_are_not_stored(self):
+        view = self.make_view(pinned='1')
+        view(self.factory.get('/rango/about/'))
+        view(self.factory.get('/rango/about/'))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_purging_a_category_leaves_the_others_cached(self):
+        view = self.make_view('category:{category_name_slug}')
+        view(self.factory.get('/rango/category/python/'), category_name_slug='python')
+        view(self.factory.get('/rango/category/django/'), category_name_slug='django')
+
+        purge_responses(['python'])
+        view(self.factory.get('/rango/category/python/'), category_name_slug='python')
+        view(self.factory.get('/rango/category/django/'), category_name_slug='django')
+        self.assertEqual(self.calls, ['/rango/category/python/', '/rango/category/django/', '/rango/category/python/'])
+
+        purge_responses(everything=True)
+        view(self.factory.get('/rango/category/django/'), category_name_slug='django')
+        self.assertEqual(len(self.calls), 4)
+
+    def test_a_new_page_purges_its_category(self):
+        python = Category.objects.create(name='Python')
+        self.assertNotContains(self.client.get('/rango/category/python/'), 'Official Tutorial')
+
+        self.add_page(python, 'Official Tutorial')
+        self.assertContains(self.client.get('/rango/category/python/'), 'Official Tutorial')
+
+
+class SearchTestsMixin(object):
+    def setUp(self):
+        super(SearchTestsMixin, self).setUp()
+        previous = search._index
+        search._index = self.make_index()
+        self.addCleanup(setattr, search, '_index', previous)
+
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+        self.add_page(self.python, 'Official Python Tutorial', 'http://docs.python.org/2/tutorial/')
+        self.add_page(self.django, 'Beginner Guide', 'http://example.com/python/guide/')
+        self.add_page(self.django, 'Django Rocks', 'http://www.djangorocks.com/')
+
+    def titles(self, query):
+        return [result['title'] for result in search_pages(query)]
+
+    def test_title_matches_rank_above_url_matches(self):
+        self.assertEqual(self.titles('python'), ['Official Python Tutorial', 'Beginner Guide'])
+        self.assertEqual(self.titles('PYTHON tutorial'), ['Official Python Tutorial'])
+        self.assertEqual(self.titles('python rocks'), [])
+
+    def test_views_break_ties_in_relevance(self):
+        first = self.add_page(self.python, 'Tango with Django', 'http://example.com/a/')
+        second = self.add_page(self.django, 'Tango with Django', 'http://example.com/b/')
+        Page.objects.filter(pk=second.pk).update(views=100)
+
+        self.assertEqual([result['id'] for result in search_pages('tango')], [second.id, first.id])
+
+    def test_quotes_and_operators_are_plain_text(self):
+        for query in ['"python', 'python"', '"python"', 'python*', '(python', '-python', 'python^', "python'"]:
+            self.assertEqual(self.titles(query), ['Official Python Tutorial', 'Beginner Guide'])
+        for query in ['python OR rocks', 'NEAR(python tutorial)', 'python AND NOT django', 'title:python']:
+            self.assertEqual(self.titles(query), [])
+        self.assertEqual(self.titles('"" * ()'), [])
+
+    def test_index_follows_changes(self):
+        self.titles('python')
+        self.django.name = 'Web'
+        self.django.save()
+        self.assertEqual(set(self.titles('web')), {'Beginner Guide', 'Django Rocks'})
+
+        Page.objects.get(title='Beginner Guide').delete()
+        self.assertEqual(self.titles('python'), ['Official Python Tutorial'])
+
+    def test_search_view(self):
+        response = self.client.get('/rango/search/', {'q': 'python', 'page': 'x'})
+        self.assertEqual([result['title'] for result in response.context['results']],
+                         ['Official Python Tutorial', 'Beginner Guide'])
+
+
+class FTSIndexTests(SearchTestsMixin, RangoTestCase):
+    def make_index(self):
+        # Migration 0011 only creates the table when SQLite is built with FTS5
+        if connection.vendor != 'sqlite' or FTS_TABLE not in connection.introspection.table_names():
+            self.skipTest("The database has no FTS5 table")
+        return FTSIndex()
+
+
+class InvertedIndexTests(SearchTestsMixin, RangoTestCase):
+    def make_index(self):
+        return InvertedIndex()
+
+
+class BenchmarkTests(RangoTestCase):
+    def test_seeding_a_kept_database_again(self):
+        seed(3, 10)
+        # What rango_bench --keepdb does on its second run
+        report = seed(3, 10)
+
+        self.assertEqual(report['pages'], 10)
+        self.assertEqual((Category.objects.count(), Page.objects.count()), (3, 10))
+        self.assertTrue(User.objects.get(username=BENCH_USERNAME).is_superuser)
+
+
+@override_settings(RANGO_PROFILE_IMAGE_VARIANTS={'thumb': 64, 'small': 160})
+class ImageTests(RangoTestCase):
+    def setUp(self):
+        super(ImageTests, self).setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        media = override_settings(MEDIA_ROOT=directory)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def upload(self, image, image_format, **options):
+        output = io.BytesIO()
+        image.save(output, image_format, **options)
+        return default_storage.save('profile_images/upload.%s' % image_format.lower(), ContentFile(output.getvalue()))
+
+    def open(self, name):
+        with default_storage.open(name) as f:
+            image = Image.open(io.BytesIO(f.read()))
+            image.load()
+        return image
+
+    def upload_photo(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotated 90 degrees
+        exif[0x010f] = 'Camera maker'
+        return self.upload(Image.new('RGB', (300, 200), 'red'), 'JPEG', exif=exif.tobytes())
+
+    def test_metadata_is_stripped_and_the_orientation_applied(self):
+        original, variants = process_picture(self.upload_photo())
+
+        image = self.open(original)
+        self.assertTrue(original.endswith('.jpg'))
+        self.assertNotIn('exif', image.info)
+        self.assertEqual(image.size, (200, 300))
+
+        self.assertEqual(sorted(variants), ['small', 'thumb'])
+        for variant, size in [('thumb', 64), ('small', 160)]:
+            image = self.open(variants[variant])
+            self.assertEqual(max(image.size), size)
+            self.assertNotIn('exif', image.info)
+            self.assertGreater(image.size[1], image.size[0])
+
+    def test_files_are_named_after_their_content(self):
+        first = process_picture(self.upload_photo())
+        self.assertEqual(process_picture(self.upload_photo()), first)
+
+    def test_transparent_pictures_are_kept_as_png(self):
+        original, _ = process_picture(self.upload(Image.new('RGBA', (100, 100), (0, 0, 255, 128)), 'PNG'))
+        self.assertTrue(original.endswith('.png'))
+        self.assertEqual(self.open(original).mode, 'RGBA')
+
+    def test_processed_picture_replaces_the_upload(self):
+        uploaded = self.upload_photo()
+        # Outside a test, saving the profile hands it to rango.images.pipeline once the transaction commits
+        profile = UserProfile.objects.create(user=User.objects.create_user('leifos'), picture=uploaded)
+        process_profile(profile.id)
+
+        profile = UserProfile.objects.get(pk=profile.pk)
+        self.assertNotEqual(profile.picture.name, uploaded)
+        self.assertEqual(sorted(profile.get_picture_variants()), ['small', 'thumb'])
+        self.assertFalse(default_storage.exists(uploaded))
+        self.assertTrue(default_storage.exists(profile.get_picture_variants()['thumb']))
+
+
+class StaticFilesTests(RangoTestCase):
+    def setUp(self):
+        super(StaticFilesTests, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def test_uncollected_files_are_only_allowed_when_not_strict(self):
+        storage = CompressedManifestStaticFilesStorage(location=self.root)
+        with self.settings(RANGO_STATIC_MANIFEST_STRICT=False):
+            self.assertEqual(storage.stored_name('css/missing.css'), 'css/missing.css')
+        with self.settings(RANGO_STATIC_MANIFEST_STRICT=True):
+            with self.assertRaises(ValueError):
+                storage.stored_name('css/missing.css')
+
+    def test_only_worthwhile_compressed_copies_are_written(self):
+        storage = CompressedManifestStaticFilesStorage(location=self.root)
+        self.write('big.css', b'body { color: red; }\n' * 100)
+        self.write('tiny.css', b'a{}')
+        storage.compress('big.css')
+        storage.compress('tiny.css')
+
+        with gzip.open(os.path.join(self.root, 'big.css.gz')) as f:
+            self.assertEqual(f.read(), b'body { color: red; }\n' * 100)
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'tiny.css.gz')))
+
+    def serve(self, path, method='GET', **headers):
+        def application(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'application']
+
+        response = {}
+
+        def start_response(status, headers):
+            response.update(status=status, headers=dict(headers))
+
+        environ = dict(('HTTP_%s' % name, value) for name, value in headers.items())
+        environ.update(PATH_INFO=path, REQUEST_METHOD=method)
+        body = StaticFilesWSGIMiddleware(application, self.root, '/static/')(environ, start_response)
+        response['body'] = b''.join(body)
+        if hasattr(body, 'close'):
+            body.close()
+        return response
+
+    def collect(self):
+        self.write('css/app.css', b'plain')
+        self.write('css/app.0123456789ab.css', b'identity')
+        self.write('css/app.0123456789ab.css.gz', b'gzipped')
+        self.write('css/app.0123456789ab.css.br', b'brotli')
+        self.write('staticfiles.json', json.dumps({'paths': {'css/app.css': 'css/app.0123456789ab.css'}}))
+
+    def test_precompressed_copies_are_negotiated(self):
+        self.collect()
+        for accept_encoding, body, encoding in [('gzip, deflate, br', b'brotli', 'br'),
+                                                ('gzip;q=1.0, identity', b'gzipped', 'gzip'),
+                                                ('', b'identity', None)]:
+            response = self.serve('/static/css/app.0123456789ab.css', ACCEPT_ENCODING=accept_encoding)
+            self.assertEqual(response['status'], '200 OK')
+            self.assertEqual(response['body'], body)
+            self.assertEqual(response['headers'].get('Content-Encoding'), encoding)
+            self.assertEqual(response['headers']['Content-Length'], str(len(body)))
+            self.assertEqual(response['headers']['Content-Type'], 'text/css')
+            self.assertEqual(response['headers']['Vary'], 'Accept-Encoding')
+
+    def test_only_fingerprinted_names_are_cached_for_good(self):
+        self.collect()
+        self.assertEqual(self.serve('/static/css/app.0123456789ab.css')['headers']['Cache-Control'],
+                         IMMUTABLE_CACHE_CONTROL)
+        plain = self.serve('/static/css/app.css')
+        self.assertEqual(plain['body'], b'plain')
+        self.assertNotEqual(plain['headers']['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertNotIn('Vary', plain['headers'])
+
+    def test_conditional_requests(self):
+        self.collect()
+        etag = self.serve('/static/css/app.0123456789ab.css', ACCEPT_ENCODING='gzip')['headers']['ETag']
+
+        response = self.serve('/static/css/app.0123456789ab.css', ACCEPT_ENCODING='gzip', IF_NONE_MATCH=etag)
+        self.assertEqual((response['status'], response['body']), ('304 Not Modified', b''))
+        self.assertNotIn('Content-Length', response['headers'])
+        self.assertEqual(response['headers']['ETag'], etag)
+
+        # Each encoding has an ETag of its own
+        response = self.serve('/static/css/app.0123456789ab.css', ACCEPT_ENCODING='br', IF_NONE_MATCH=etag)
+        self.assertEqual((response['status'], response['body']), ('200 OK', b'brotli'))
+
+    def test_other_requests_go_through_to_the_application(self):
+        self.collect()
+        self.assertEqual(self.serve('/static/css/app.0123456789ab.css', method='HEAD')['body'], b'')
+        for path, method in [('/static/css/app.0123456789ab.css', 'POST'), ('/static/css/missing.css', 'GET'),
+                             ('/static/staticfiles.json.gz', 'GET'), ('/rango/', 'GET')]:
+            self.assertEqual(self.serve(path, method=method)['body'], b'application')
+
+
+class StandInConnection(object):
+    def __init__(self, usable=True, opened=True, in_atomic_block=False):
+        self.connection = object() if opened else None
+        self.in_atomic_block = in_atomic_block
+        self.usable = usable
+        self.pings = 0
+        self.closed = False
+
+    def is_usable(self):
+        self.pings += 1
+        return self.usable
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionHealthTests(RangoTestCase):
+    def check(self, *stand_ins):
+        class Connections(object):
+            def all(self):
+                return list(stand_ins)
+
+        previous = db_router.connections
+        db_router.connections = Connections()
+        try:
+            check_connections()
+        finally:
+            db_router.connections = previous
+
+    def idle(self, seconds, **kwargs):
+        stand_in = StandInConnection(**kwargs)
+        stand_in.rango_checked_at = time.time() - seconds
+        return stand_in
+
+    @override_settings(RANGO_DB_HEALTH_CHECK_IDLE=30)
+    def test_only_idle_connections_are_pinged(self):
+        busy, idle = self.idle(5), self.idle(60)
+        self.check(busy, idle)
+        self.assertEqual((busy.pings, idle.pings), (0, 1))
+
+        # The ping counts as a check
+        self.check(busy, idle)
+        self.assertEqual((busy.pings, idle.pings), (0, 1))
+
+    @override_settings(RANGO_DB_HEALTH_CHECK_IDLE=30)
+    def test_dropped_connections_are_closed(self):
+        dropped = self.idle(60, usable=False)
+        self.check(dropped)
+        self.assertTrue(dropped.closed)
+
+    @override_settings(RANGO_DB_HEALTH_CHECK_IDLE=30)
+    def test_closed_connections_and_transactions_are_left_alone(self):
+        closed, in_transaction = self.idle(60, opened=False), self.idle(60, in_atomic_block=True)
+        self.check(closed, in_transaction)
+        self.assertEqual((closed.pings, in_transaction.pings), (0, 0))
+
+    def test_new_connections_count_as_checked(self):
+        stand_in = StandInConnection()
+        mark_checked(stand_in)
+        self.check(stand_in)
+        self.assertEqual(stand_in.pings, 0)
+        self.assertLess(time.time() - connection.rango_checked_at, 3600)
+
+
+class APITests(RangoTestCase):
+    def setUp(self):
+        super(APITests, self).setUp()
+        self.python = Category.objects.create(name='Python', likes=3)
+        self.django = Category.objects.create(name='Django')
+        for number in range(3):
+            self.add_page(self.python, 'page-%d' % number)
+
+    def get_json(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            return json.loads(b''.join(response.streaming_content).decode('utf-8'))
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_unchanged_responses_are_not_modified(self):
+        etag = self.client.get('/rango/api/categories/')['ETag']
+        response = self.client.get('/rango/api/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Category.objects.create(name='Flask')
+        response = self.client.get('/rango/api/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_only_the_changed_category_gets_a_new_etag(self):
+        python_etag = self.client.get('/rango/api/categories/python/')['ETag']
+        django_etag = self.client.get('/rango/api/categories/django/')['ETag']
+
+        self.add_page(self.django, 'Django Rocks')
+        self.assertEqual(self.client.get('/rango/api/categories/python/', HTTP_IF_NONE_MATCH=python_etag).status_code,
+                         304)
+        self.assertEqual(self.client.get('/rango/api/categories/django/', HTTP_IF_NONE_MATCH=django_etag).status_code,
+                         200)
+
+    def test_flushed_views_change_the_top_pages(self):
+        etag = self.client.get('/rango/api/pages/top/')['ETag']
+        track_page_view(Page.objects.get(title='page-2').id)
+        flush_counters()
+
+        response = self.client.get('/rango/api/pages/top/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['pages'][0]['title'], 'page-2')
+
+    def test_fields_narrow_the_rows(self):
+        rows = self.get_json('/rango/api/categories/', fields='slug,likes,password')
+        self.assertEqual(rows, [{'slug': 'python', 'likes': 3}, {'slug': 'django', 'likes': 0}])
+
+        # Nothing the endpoint knows about means every field
+        rows = self.get_json('/rango/api/categories/', fields='password')
+        self.assertEqual(sorted(rows[0]), ['id', 'likes', 'name', 'page_count', 'slug', 'views'])
+
+        detail = self.get_json('/rango/api/categories/python/', fields='name,title')
+        self.assertEqual(detail['category'], {'name': 'Python'})
+        self.assertEqual(detail['pages'][0], {'title': 'page-0'})
+
+    @override_settings(RANGO_PAGES_PER_PAGE=2)
+    def test_category_pages_come_in_batches(self):
+        detail = self.get_json('/rango/api/categories/python/', fields='title')
+        self.assertEqual([page['title'] for page in detail['pages']], ['page-0', 'page-1'])
+
+        detail = self.get_json(detail['next'])
+        self.assertEqual((detail['pages'], detail['next']), ([{'title': 'page-2'}], None))
+
+        response = self.client.get('/rango/api/categories/flask/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.post('/rango/api/categories/').status_code, 405)
+
+
+class SlugHistoryTests(RangoTestCase):
+    def setUp(self):
+        super(SlugHistoryTests, self).setUp()
+        self.category = Category.objects.create(name='Python')
+        self.add_page(self.category, 'Official Tutorial')
+        # Resolved and cached under its first slug
+        self.assertEqual(self.client.get('/rango/category/python/').status_code, 200)
+
+    def rename(self, name):
+        self.category.name = name
+        self.category.save()
+
+    def test_old_slugs_redirect_for_good(self):
+        self.rename('Python Programming')
+
+        response = self.client.get('/rango/category/python/')
+        self.assertRedirects(response, '/rango/category/python-programming/', status_code=301)
+        self.assertContains(self.client.get('/rango/category/python-programming/'), 'Official Tutorial')
+
+        # Every slug it went by leads to the current one
+        self.rename('Python 3')
+        self.assertRedirects(self.client.get('/rango/category/python/'), '/rango/category/python-3/',
+                             status_code=301)
+        self.assertRedirects(self.client.get('/rango/category/python-programming/'), '/rango/category/python-3/',
+                             status_code=301)
+
+    def test_a_slug_taken_over_by_a_new_category(self):
+        self.rename('Python Programming')
+        python = Category.objects.create(name='Python')
+
+        self.assertEqual(resolve_category('python').id, python.id)
+        self.assertFalse(CategorySlugHistory.objects.filter(slug='python').exists())
+        self.assertEqual(self.client.get('/rango/category/python/').status_code, 200)
+
+    def test_renaming_back(self):
+        self.rename('Python Programming')
+        self.rename('Python')
+
+        self.assertEqual(self.client.get('/rango/category/python/').status_code, 200)
+        self.assertRedirects(self.client.get('/rango/category/python-programming/'), '/rango/category/python/',
+                             status_code=301)
+        self.assertEqual(resolve_category('nothing'), None)
+
+
+class FragmentCacheTests(RangoTestCase):
+    def setUp(self):
+        super(FragmentCacheTests, self).setUp()
+        Category.objects.create(name='Python')
+        Category.objects.create(name='Django')
+        User.objects.create_user('curator', password='curator')
+        # Logged-in requests skip the response cache, so every one of them renders base.html
+        self.logged_in = Client()
+        self.logged_in.login(username='curator', password='curator')
+
+    def active_category(self, response):
+        match = re.search(r'<strong>\s*<a href="/rango/category/([\w-]+)/">', response.content.decode('utf-8'))
+        return match and match.group(1)
+
+    def test_navigation_is_cached_per_login_state(self):
+        self.assertContains(self.client.get('/rango/about/'), 'Sign Up')
+        self.assertIsNotNone(cache.get(make_template_fragment_key('rango_nav', [False])))
+
+        response = self.logged_in.get('/rango/about/')
+        self.assertContains(response, 'Logout')
+        self.assertNotContains(response, 'Sign Up')
+        self.assertIsNotNone(cache.get(make_template_fragment_key('rango_nav', [True])))
+
+    def test_sidebar_is_cached_per_active_category(self):
+        self.assertEqual(self.active_category(self.logged_in.get('/rango/category/python/')), 'python')
+        self.assertEqual(self.active_category(self.logged_in.get('/rango/category/django/')), 'django')
+        self.assertEqual(self.active_category(self.logged_in.get('/rango/about/')), None)
+        self.assertEqual(self.active_category(self.logged_in.get('/rango/category/python/')), 'python')
+
+    def test_category_changes_start_new_sidebar_fragments(self):
+        self.assertNotContains(self.logged_in.get('/rango/category/python/'), 'Flask')
+        Category.objects.create(name='Flask')
+        self.assertContains(self.logged_in.get('/rango/category/python/'), 'Flask')
+
+    @override_settings(RANGO_FRAGMENT_CACHE_TIMEOUT=0)
+    def test_fragments_are_not_kept_without_a_timeout(self):
+        self.client.get('/rango/about/')
+        self.assertIsNone(cache.get(make_template_fragment_key('rango_nav', [False])))
+
+
+class TrendingTests(RangoTestCase):
+    now = datetime(2026, 10, 18, 12, 30, tzinfo=timezone.utc)
+
+    def setUp(self):
+        super(TrendingTests, self).setUp()
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+        self.pages = [self.add_page(self.python, 'page-%d' % number) for number in range(3)]
+
+    def bucket(self, subject, object_id, start, count, resolution=ActivityBucket.HOUR):
+        return ActivityBucket.objects.create(subject=subject, object_id=object_id, resolution=resolution,
+                                             start=start, count=count)
+
+    def counts(self, **filters):
+        return sorted(ActivityBucket.objects.filter(**filters).values_list('subject', 'object_id', 'resolution',
+                                                                           'start', 'count'))
+
+    def test_flushed_counters_land_in_the_current_hour(self):
+        for page_id in [self.pages[0].id, self.pages[0].id, self.pages[1].id]:
+            track_page_view(page_id)
+        track_category_view('python')
+        track_category_view('no-such-category')
+        like_category(self.django.id)
+        flush_counters()
+        track_page_view(self.pages[0].id)
+        flush_counters()
+
+        hour = hour_start(timezone.now())
+        self.assertEqual(self.counts(), sorted([
+            (ActivityBucket.PAGE_VIEWS, self.pages[0].id, ActivityBucket.HOUR, hour, 3),
+            (ActivityBucket.PAGE_VIEWS, self.pages[1].id, ActivityBucket.HOUR, hour, 1),
+            (ActivityBucket.CATEGORY_VIEWS, self.python.id, ActivityBucket.HOUR, hour, 1),
+            (ActivityBucket.CATEGORY_LIKES, self.django.id, ActivityBucket.HOUR, hour, 1),
+        ]))
+
+    @override_settings(RANGO_TRENDING_HOURLY_RETENTION=48, RANGO_TRENDING_DAILY_RETENTION=90)
+    def test_old_hours_are_rolled_up_into_days(self):
+        page_id = self.pages[0].id
+        day = datetime(2026, 10, 15, tzinfo=timezone.utc)
+        self.bucket(ActivityBucket.PAGE_VIEWS, page_id, day + timedelta(hours=3), 2)
+        self.bucket(ActivityBucket.PAGE_VIEWS, page_id, day + timedelta(hours=15), 3)
+        self.bucket(ActivityBucket.CATEGORY_LIKES, self.python.id, day + timedelta(hours=15), 1)
+        # The day of the cutoff (48 hours ago) is kept whole, hour by hour
+        kept = self.bucket(ActivityBucket.PAGE_VIEWS, page_id, day + timedelta(days=1, hours=20), 4)
+        self.bucket(ActivityBucket.PAGE_VIEWS, page_id, day - timedelta(days=100), 7, ActivityBucket.DAY)
+
+        self.assertEqual(compact_activity(self.now), 3)
+        self.assertEqual(self.counts(resolution=ActivityBucket.DAY), sorted([
+            (ActivityBucket.PAGE_VIEWS, page_id, ActivityBucket.DAY, day, 5),
+            (ActivityBucket.CATEGORY_LIKES, self.python.id, ActivityBucket.DAY, day, 1),
+        ]))
+        self.assertEqual(list(ActivityBucket.objects.filter(resolution=ActivityBucket.HOUR)), [kept])
+
+        self.assertEqual(compact_activity(self.now), 0)
+        self.assertEqual(ActivityBucket.objects.count(), 3)
+
+    @override_settings(RANGO_TRENDING_HALF_LIFE=24, RANGO_TRENDING_WINDOW=7, RANGO_TRENDING_LIKE_WEIGHT=5)
+    def test_older_activity_counts_for_less(self):
+        hour = hour_start(self.now)
+        recent, older, stale = self.pages
+        # Ages are taken from the middle of the bucket, so the current hour's counts in full
+        self.bucket(ActivityBucket.PAGE_VIEWS, recent.id, hour, 10)
+        # Two half-lives ago
+        self.bucket(ActivityBucket.PAGE_VIEWS, older.id, hour - timedelta(hours=48), 30)
+        # Outside the window, and a page that has been deleted since
+        self.bucket(ActivityBucket.PAGE_VIEWS, stale.id, hour - timedelta(days=8), 1000, ActivityBucket.DAY)
+        self.bucket(ActivityBucket.PAGE_VIEWS, stale.id + 1000, hour, 1000)
+        # A like weighs as much as five views
+        self.bucket(ActivityBucket.CATEGORY_LIKES, self.django.id, hour, 2)
+        self.bucket(ActivityBucket.CATEGORY_VIEWS, self.python.id, hour, 8)
+
+        self.assertEqual(compute_trending(self.now), (2, 2))
+        scores = dict(TrendingPage.objects.values_list('page', 'score'))
+        self.assertAlmostEqual(scores[recent.id], 10)
+        self.assertAlmostEqual(scores[older.id], 7.5)
+        self.assertEqual([page['id'] for page in trending_pages()], [recent.id, older.id])
+        self.assertEqual([page['id'] for page in trending_pages(self.django.id)], [])
+        self.assertEqual([category['id'] for category in trending_categories()], [self.django.id, self.python.id])
+
+    @override_settings(RANGO_TRENDING_CACHE_TIMEOUT=1)
+    def test_rankings_computed_by_another_process_show_up_once_the_cache_expires(self):
+        self.assertEqual(trending_pages(), [])
+
+        # What compute_trending run from cron leaves behind, without reaching this process's cache
+        TrendingPage.objects.create(page=self.pages[2], category=self.python, score=1.0)
+        self.assertEqual(trending_pages(), [])
+
+        time.sleep(1.1)
+        self.assertEqual([page['id'] for page in trending_pages()], [self.pages[2].id])
+
+
+class ExportTests(RangoTestCase):
+    def setUp(self):
+        super(ExportTests, self).setUp()
+        self.python = Category.objects.create(name='Python', likes=3)
+        self.cafe = Category.objects.create(name=u'Caf\xe9', parent=self.python)
+        self.hour_ago = timezone.now() - timedelta(hours=1)
+        Category.objects.update(modified=self.hour_ago)
+
+    def read(self, *args, **kwargs):
+        return b''.join(export(*args, **kwargs))
+
+    def test_csv(self):
+        rows = list(csv.reader(io.BytesIO(self.read('categories', 'csv', chunk_size=1))))
+        self.assertEqual(rows[0], ['id', 'name', 'slug', 'parent_id', 'views', 'likes', 'page_count', 'modified'])
+        self.assertEqual([row[:6] for row in rows[1:]], [
+            [str(self.python.id), 'Python', 'python', '', '0', '3'],
+            [str(self.cafe.id), u'Caf\xe9'.encode('utf-8'), 'cafe', str(self.python.id), '0', '0'],
+        ])
+        self.assertEqual(rows[1][7], self.hour_ago.isoformat())
+
+    def test_jsonl_and_gzip(self):
+        lines = self.read('categories', 'jsonl').splitlines()
+        self.assertEqual([json.loads(line.decode('utf-8'))['name'] for line in lines], ['Python', u'Caf\xe9'])
+
+        compressed = self.read('categories', 'jsonl', compress=True)
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(compressed)).read(), self.read('categories', 'jsonl'))
+
+    @override_settings(RANGO_EXPORT_GRACE=60)
+    def test_consecutive_exports_cover_every_change_once(self):
+        now = timezone.now()
+        until = export_until(now)
+        self.assertEqual(until, now - timedelta(seconds=60))
+
+        # Written by a transaction that was still open when the export started
+        Category.objects.filter(pk=self.cafe.pk).update(modified=now - timedelta(seconds=10))
+        first = self.read('categories', 'jsonl', since=now - timedelta(hours=2), until=until)
+        self.assertEqual([json.loads(line.decode('utf-8'))['id'] for line in first.splitlines()], [self.python.id])
+
+        second = self.read('categories', 'jsonl', since=until, until=export_until(now + timedelta(minutes=5)))
+        self.assertEqual([json.loads(line.decode('utf-8'))['id'] for line in second.splitlines()], [self.cafe.id])
+
+    def test_export_view(self):
+        User.objects.create_user('analyst', password='analyst', is_staff=True)
+        self.client.login(username='analyst', password='analyst')
+
+        response = self.client.get('/rango/_export/pages/', {'format': 'jsonl', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.jsonl.gz"'))
+        watermark = parse_datetime(response['X-Rango-Watermark'])
+        self.assertLess(watermark, timezone.now() - timedelta(seconds=30))
+
+        response = self.client.get('/rango/_export/categories/', {'since': self.hour_ago.isoformat()})
+        self.assertEqual(b''.join(response.streaming_content).count(b'\n'), 1)
+
+        self.assertEqual(self.client.get('/rango/_export/pages/', {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/rango/_export/pages/', {'since': 'yesterday'}).status_code, 400)
+
+        self.client.logout()
+        self.assertEqual(self.client.get('/rango/_export/pages/').status_code, 302)
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'categories.csv.gz')
+        stderr = StringIO()
+        call_command('export_rango', 'categories', '--gzip', '--output', path, stderr=stderr)
+
+        with gzip.open(path) as f:
+            self.assertEqual(len(f.read().splitlines()), 3)
+        self.assertIn('pass --since', stderr.getvalue())
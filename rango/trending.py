@@ -0,0 +1,256 @@
+"""
+Trending pages and categories.
+
+All-time totals like Page.views never let go of whatever was popular once, so alongside them we keep views and likes
+per hour, in ActivityBucket rows:
+
+- record_activity() adds the increments of each counter flush (see rango/counters.py) to the buckets of the current
+  hour, with one UPDATE per distinct increment, so counting stays a dictionary update however many views come in
+- compact_activity() rolls the hourly buckets older than RANGO_TRENDING_HOURLY_RETENTION hours up into daily ones, and
+  drops daily buckets older than RANGO_TRENDING_DAILY_RETENTION days; run it periodically (`compact_activity`)
+- compute_trending() scores every page and category from the last RANGO_TRENDING_WINDOW days of buckets, each bucket
+  counting half as much for every RANGO_TRENDING_HALF_LIFE hours of age, and replaces the TrendingPage and
+  TrendingCategory rows with the result; run it periodically too (`compute_trending`)
+
+The index and category pages read the top of those tables through trending_pages() and trending_categories(), which
+cache them for RANGO_TRENDING_CACHE_TIMEOUT seconds. compute_trending() drops the cached copies, but it usually runs
+in a process of its own, whose local cache the server doesn't see: the timeout is what brings the new rankings there.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from rango.chunks import CHUNK_SIZE, chunked
+from rango.models import ActivityBucket, Category, Page, TrendingCategory, TrendingPage
+from rango.response_cache import purge_responses
+from rango.versions import bump_versions, get_versions
+
+TRENDING_KEY = 'rango:trending:%s:%s'
+TRENDING_VERSION = 'trending'
+
+PAGE_FIELDS = ('id', 'title', 'url', 'views', 'category_id')
+CATEGORY_FIELDS = ('id', 'name', 'slug', 'likes')
+
+# (model, counter field) -> bucket subject
+SUBJECTS = {
+    (Page, 'views'): ActivityBucket.PAGE_VIEWS,
+    (Category, 'views'): ActivityBucket.CATEGORY_VIEWS,
+    (Category, 'likes'): ActivityBucket.CATEGORY_LIKES,
+}
+
+
+def get_half_life():
+    return getattr(settings, 'RANGO_TRENDING_HALF_LIFE', 24)
+
+
+def get_window():
+    return getattr(settings, 'RANGO_TRENDING_WINDOW', 7)
+
+
+def get_like_weight():
+    return getattr(settings, 'RANGO_TRENDING_LIKE_WEIGHT', 5)
+
+
+def get_hourly_retention():
+    return getattr(settings, 'RANGO_TRENDING_HOURLY_RETENTION', 48)
+
+
+def get_daily_retention():
+    return getattr(settings, 'RANGO_TRENDING_DAILY_RETENTION', 90)
+
+
+def get_trending_size():
+    return getattr(settings, 'RANGO_LEADERBOARD_SIZE', 5)
+
+
+def get_cache_timeout():
+    return getattr(settings, 'RANGO_TRENDING_CACHE_TIMEOUT', 300)
+
+
+def hour_start(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def record_activity(pending):
+    """
+    Add a counter flush - a dict of (model, field, lookup, key) -> amount - to the current hour's buckets.
+    Meant to run inside the flush's transaction.
+    """
+    amounts = defaultdict(int)
+    slugs = defaultdict(int)
+    for (model, field, lookup, key), amount in pending.items():
+        subject = SUBJECTS.get((model, field))
+        if subject is None or not amount:
+            continue
+        if lookup == 'slug':
+            slugs[(subject, key)] += amount
+        else:
+            amounts[(subject, key)] += amount
+
+    if slugs:
+        # Category views are counted by slug, buckets are kept by id
+        ids = dict(Category.objects.filter(slug__in=set(slug for subject, slug in slugs)).values_list('slug', 'id'))
+        for (subject, slug), amount in slugs.items():
+            if slug in ids:
+                amounts[(subject, ids[slug])] += amount
+
+    add_to_buckets(amounts, ActivityBucket.HOUR, hour_start(timezone.now()))
+
+
+def add_to_buckets(amounts, resolution, start):
+    """
+    Add amounts, a dict of (subject, object id) -> amount, to the buckets of the given resolution and start, creating
+    the missing ones.
+    """
+    by_subject = defaultdict(dict)
+    for (subject, object_id), amount in amounts.items():
+        by_subject[subject][object_id] = amount
+
+    for subject, object_amounts in by_subject.items():
+        buckets = ActivityBucket.objects.filter(subject=subject, resolution=resolution, start=start)
+
+        for chunk in chunked(object_amounts):
+            existing = set(buckets.filter(object_id__in=chunk).values_list('object_id', flat=True))
+            missing = [ActivityBucket(subject=subject, object_id=object_id, resolution=resolution, start=start)
+                       for object_id in chunk if object_id not in existing]
+            if missing:
+                try:
+                    with transaction.atomic():
+                        ActivityBucket.objects.bulk_create(missing)
+                except IntegrityError:
+                    # Another process created some of them first; the UPDATEs below count into theirs
+                    pass
+
+            by_amount = defaultdict(list)
+            for object_id in chunk:
+                by_amount[object_amounts[object_id]].append(object_id)
+            for amount, object_ids in by_amount.items():
+                buckets.filter(object_id__in=object_ids).update(count=F('count') + amount)
+
+
+def compact_activity(now=None):
+    """
+    Roll the hourly buckets that are past their retention up into daily buckets, one day at a time, and drop the
+    daily buckets that are past theirs. Returns the number of hourly buckets rolled up.
+    """
+    now = now or timezone.now()
+    # Only whole days are rolled up, so that a day never ends up with both hourly and daily buckets
+    cutoff = day_start(now - timedelta(hours=get_hourly_retention()))
+    hourly = ActivityBucket.objects.filter(resolution=ActivityBucket.HOUR)
+    rolled_up = 0
+
+    oldest = hourly.filter(start__lt=cutoff).order_by('start').values_list('start', flat=True).first()
+    day = day_start(oldest) if oldest else cutoff
+    while day < cutoff:
+        next_day = day + timedelta(days=1)
+        with transaction.atomic():
+            day_buckets = hourly.filter(start__gte=day, start__lt=next_day)
+            totals = day_buckets.values_list('subject', 'object_id').annotate(total=Sum('count')).order_by()
+            add_to_buckets(dict(((subject, object_id), total) for subject, object_id, total in totals),
+                           ActivityBucket.DAY, day)
+            rolled_up += day_buckets.count()
+            day_buckets.delete()
+        day = next_day
+
+    ActivityBucket.objects.filter(resolution=ActivityBucket.DAY,
+                                  start__lt=day_start(now - timedelta(days=get_daily_retention()))).delete()
+    return rolled_up
+
+
+def decayed_scores(subject, now):
+    """
+    Dict of object id -> sum of its bucket counts over the trending window, each weighted by exp(-decay * age), the
+    age being taken from the middle of the bucket.
+    """
+    decay = math.log(2) / get_half_life()
+    buckets = ActivityBucket.objects.filter(subject=subject, start__gte=now - timedelta(days=get_window()))
+
+    scores = defaultdict(float)
+    for object_id, resolution, start, count in buckets.values_list(
+            'object_id', 'resolution', 'start', 'count').iterator():
+        middle = start + (timedelta(minutes=30) if resolution == ActivityBucket.HOUR else timedelta(hours=12))
+        age = max((now - middle).total_seconds() / 3600.0, 0.0)
+        scores[object_id] += count * math.exp(-decay * age)
+    return scores
+
+
+def compute_trending(now=None):
+    """
+    Rebuild the TrendingPage and TrendingCategory tables from the activity buckets.
+    Returns the number of trending pages and categories.
+    """
+    now = now or timezone.now()
+
+    page_scores = decayed_scores(ActivityBucket.PAGE_VIEWS, now)
+    category_scores = decayed_scores(ActivityBucket.CATEGORY_VIEWS, now)
+    for category_id, score in decayed_scores(ActivityBucket.CATEGORY_LIKES, now).items():
+        category_scores[category_id] += get_like_weight() * score
+
+    # The buckets outlive the pages and categories they count
+    trending_pages = []
+    for chunk in chunked(page_scores):
+        for page_id, category_id in Page.objects.filter(pk__in=chunk).values_list('id', 'category'):
+            trending_pages.append(TrendingPage(page_id=page_id, category_id=category_id, score=page_scores[page_id]))
+
+    trending_categories = []
+    for chunk in chunked(category_scores):
+        for category_id in Category.objects.filter(pk__in=chunk).values_list('id', flat=True):
+            trending_categories.append(TrendingCategory(category_id=category_id, score=category_scores[category_id]))
+
+    with transaction.atomic():
+        TrendingPage.objects.all().delete()
+        TrendingPage.objects.bulk_create(trending_pages, batch_size=CHUNK_SIZE)
+        TrendingCategory.objects.all().delete()
+        TrendingCategory.objects.bulk_create(trending_categories, batch_size=CHUNK_SIZE)
+
+    invalidate_trending()
+    purge_responses(everything=True)
+    return len(trending_pages), len(trending_categories)
+
+
+def invalidate_trending():
+    bump_versions([TRENDING_VERSION])
+
+
+def cached_trending(name, build):
+    key = TRENDING_KEY % (get_versions([TRENDING_VERSION])[0], name)
+    rows = cache.get(key)
+    if rows is None:
+        rows = build()
+        cache.set(key, rows, get_cache_timeout())
+    return rows
+
+
+def trending_pages(category_id=None):
+    """
+    The top trending pages overall, or within the given category, as dicts with their id, title, url, views and
+    category_id, like the leaderboards in rango/leaderboard.py.
+    """
+    def build():
+        pages = Page.objects.filter(trending__isnull=False)
+        if category_id is not None:
+            pages = pages.filter(trending__category=category_id)
+        return list(pages.order_by('-trending__score').values(*PAGE_FIELDS)[:get_trending_size()])
+
+    return cached_trending('pages' if category_id is None else 'pages:%s' % category_id, build)
+
+
+def trending_categories():
+    """
+    The top trending categories, as dicts with their id, name, slug and likes.
+    """
+    def build():
+        return list(Category.objects.filter(trending__isnull=False).order_by('-trending__score')
+                    .values(*CATEGORY_FIELDS)[:get_trending_size()])
+
+    return cached_trending('categories', build)
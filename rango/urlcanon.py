@@ -0,0 +1,55 @@
+"""
+Canonical forms of page URLs, to tell when two pages point to the same place.
+
+canonical_url() rewrites the parts of a URL that don't change where it leads:
+
+- the scheme and host are lowercased, and the port dropped when it is the scheme's default
+- the fragment is dropped, and so are the trailing slashes of the path, an empty path being the same as /
+- tracking parameters (utm_*, fbclid, gclid...) are dropped from the query, and the remaining ones sorted
+
+Each page stores the SHA-1 of the canonical form of its URL in its indexed canonical_url_hash column, which makes
+looking for duplicates a single index lookup, however long the URLs are.
+"""
+import hashlib
+
+from django.utils.six.moves.urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+TRACKING_PARAMS = frozenset(['fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid', '_ga', '_hsenc'])
+TRACKING_PREFIXES = ('utm_', )
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonical_url(url):
+    """
+    The canonical form of url. Query parameters are compared as written, so they are never decoded or re-encoded.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+
+    # netloc is [user[:password]@]host[:port]; only the host and port are normalized
+    userinfo, _, hostport = parts.netloc.rpartition('@')
+    host, colon, port = hostport.rpartition(':') if not hostport.endswith(']') else (hostport, '', '')
+    if not colon or not port.isdigit():
+        host, port = hostport, ''
+    netloc = host.lower() + (':' + port if port and port != DEFAULT_PORTS.get(scheme) else '')
+    if userinfo:
+        netloc = userinfo + '@' + netloc
+
+    path = parts.path.rstrip('/') or '/'
+    query = '&'.join(sorted(param for param in parts.query.split('&')
+                            if param and not is_tracking_param(param.split('=', 1)[0])))
+
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def url_hash(url):
+    """
+    The SHA-1, as 40 hex digits, of the canonical form of url.
+    """
+    return hashlib.sha1(canonical_url(url).encode('utf-8')).hexdigest()
@@ -1,5 +1,5 @@
 from django.conf.urls import url
-from rango import views
+from rango import api, views
 
 app_name = 'rango'
 urlpatterns = [
@@ -10,6 +10,19 @@ urlpatterns = [
     url(r'^category/(?P<category_name_slug>[\w\-]+)/$', views.show_category, name='show_category'),
 
     url(r'^category/(?P<category_name_slug>[\w\-]+)/add_page/$', views.add_page, name='add_page'),
+    url(r'^category/(?P<category_name_slug>[\w\-]+)/add_pages/$', views.add_pages, name='add_pages'),
+
+    url(r'^goto/$', views.track_url, name='goto'),
+
+    url(r'^search/$', views.search, name='search'),
+
+    url(r'^_stats/$', views.profiling_stats, name='profiling_stats'),
+    url(r'^_export/(?P<name>categories|pages)/$', views.export_data, name='export'),
+
+    # Read-only JSON API, see rango/api.py
+    url(r'^api/categories/$', api.category_list, name='api_categories'),
+    url(r'^api/categories/(?P<category_name_slug>[\w\-]+)/$', api.category_detail, name='api_category'),
+    url(r'^api/pages/top/$', api.top_page_list, name='api_top_pages'),
 
     # url(r'^register/$', views.register, name='register'),
 
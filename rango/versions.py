@@ -0,0 +1,40 @@
+"""
+Named version stamps kept in the cache.
+
+Cache entries that depend on some part of the data include the relevant stamps in their key. Bumping a stamp gives
+it a fresh random value, so every entry built against the old value is simply never looked up again and expires on
+its own - no need to track down and delete the individual keys.
+"""
+import uuid
+
+from django.core.cache import cache
+
+VERSION_KEY = 'rango:version:%s'
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def get_versions(names):
+    """
+    Return the current stamps for the given names, in order, with a single cache round-trip.
+    A stamp that is missing (never set, or evicted) is started afresh rather than reset to a fixed value, so an
+    eviction can never bring stale entries back to life.
+    """
+    keys = [VERSION_KEY % name for name in names]
+    found = cache.get_many(keys)
+
+    versions = []
+    for key in keys:
+        if key not in found:
+            # add() leaves the stamp alone if another process started it in the meantime, so read back whichever won
+            cache.add(key, _new_version(), None)
+            found[key] = cache.get(key)
+        versions.append(found[key])
+
+    return versions
+
+
+def bump_versions(names):
+    cache.set_many(dict((VERSION_KEY % name, _new_version()) for name in names), None)
@@ -1,75 +1,123 @@
-from datetime import datetime
+import json
+from functools import wraps
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import render
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.http import require_safe
 from registration.backends.simple.views import RegistrationView
 
-from rango.forms import CategoryForm, PageForm
-from rango.models import Category, Page
-
-
+from rango import profiling, ratelimit
+from rango.counters import track_category_view, track_page_view
+from rango.db_router import replica_reads
+from rango.export import CONTENT_TYPES, ENCODERS, export, export_filename, export_until, parse_watermark
+from rango.forms import CategoryForm, PageForm, PageFormSet, check_duplicate_urls
+from rango.hierarchy import subtree_totals
+from rango.leaderboard import top_categories, top_pages
+from rango.loader import add_pages as insert_pages
+from rango.models import Page
+from rango.pagination import paginate_pages
+from rango.paths import subtree_filter
+from rango.response_cache import cache_anonymous_response
+from rango.search import search_pages
+from rango.sidebar import get_branch
+from rango.slugs import resolve_category
+from rango.trending import trending_categories, trending_pages
+
+
+@cache_anonymous_response('index')
+@replica_reads()
 def index(request):
-    # Query the database for a list of All categories currently stored
-    # Order the categories by number of likes in descending order.
-    # Retrieve the top 5 categories only - or all if less than or equal to 5.
-    # Place the list in our context_dict dictionary that will be passed to the template engine
+    # Fetch the top five categories by number of likes and the top five pages by number of views.
+    # Rather than sorting the whole Category and Page tables on every request, these come from the leaderboards in
+    # rango/leaderboard.py, which are kept up to date as the like and view counters change.
+    # Each entry is a dictionary, e.g. {'id': 1, 'name': 'Python', 'slug': 'python', 'likes': 64}, which the template
+    # uses just like a model instance
 
-    category_list = Category.objects.order_by('-likes')[:5]
-    # The expression above queries the Category model to retrieve top five categories.
-    # It uses order_by() method to sort by the number of likes in descending order.
-    # The - in `-likes` denotes that we would like them in descending order
-    # If we removed the `-` and kept it just `likes` it would return it in ascending order
-    # The [:5] is to return the first five items only (index 0 through 4)
+    category_list = top_categories()
+    pages_list = top_pages()
 
-    pages_list = Page.objects.order_by('-views')[:5]
+    # All-time totals favour whatever has been around longest, so pages are listed by how much they have been viewed
+    # lately instead (see rango/trending.py) - or by their totals until the trending rankings have been computed
+    trending_list = trending_pages()
 
     context_dict = {'categories': category_list,
-                    'pages': pages_list}
-
-    # Call function to handle the site counter related cookies
-    visitor_cookie_handler(request)
-    context_dict['visits'] = request.session['visits']
+                    'trending_categories': trending_categories(),
+                    'pages': trending_list or pages_list,
+                    'pages_trending': bool(trending_list)}
 
-    # Obtain the response object early so we can add cookie information
-    response = render(request, 'rango/index.html', context_dict)
-
-    # Render response back to the user, udpating any cookies that need changed
-    return response
+    # The site visit counter is kept by rango.middleware.VisitTrackerMiddleware, which also covers cached responses
+    return render(request, 'rango/index.html', context_dict)
 
 
+@cache_anonymous_response()
 def about(request):
-    visitor_cookie_handler(request)
     context_dict = dict()
 
     context_dict['boldmessage'] = 'This tutorial has been put together by Deep Sukhwani'
 
-    context_dict['visits'] = request.session['visits']
-
     return render(request, 'rango/about.html', context=context_dict)
 
 
+def count_category_view(view):
+    @wraps(view)
+    def wrapper(request, category_name_slug):
+        response = view(request, category_name_slug=category_name_slug)
+        if response.status_code == 200:
+            track_category_view(category_name_slug)
+        return response
+    return wrapper
+
+
+@count_category_view
+@cache_anonymous_response('category:{category_name_slug}')
+@replica_reads()
 def show_category(request, category_name_slug):
     # Create a context dictionary which we can pass to the template rendering engine
     context_dict = {}
 
-    try:
-        # Can we find a category name slug with the given name?
-        # If we can't, the .get() method raises a DoesNotExist exception.
-        # So the .get() method returns on method instance or raises an exception
-        category = Category.objects.get(slug=category_name_slug)
-
-        # Retrieve all associated pages
-        # Note that filter() will return a list of page objects or an empty list
-        pages = Page.objects.filter(category=category)
+    # Can we find a category name slug with the given name?
+    # The id, name and slug of categories are cached by slug (see rango/slugs.py), so this usually costs no query.
+    # If we can't, we get None.
+    category = resolve_category(category_name_slug)
+
+    if category is not None and category.slug != category_name_slug:
+        # The category has been renamed since - send the visitor (and search engines) to its new address for good
+        return redirect('rango:show_category', category_name_slug=category.slug, permanent=True)
+
+    if category is not None:
+        # Retrieve one batch of the associated pages, most viewed first - those of its subcategories too with
+        # ?subtree=1, which is one range of category paths (see rango/paths.py).
+        # ?after= carries the cursor of the last page of the previous batch
+        subtree = request.GET.get('subtree') == '1'
+        if subtree:
+            pages = Page.objects.filter(**subtree_filter(category.path, 'category__path'))
+        else:
+            pages = Page.objects.filter(category=category.id)
+        pages, next_cursor = paginate_pages(pages, request.GET.get('after'))
 
         # Add our results list to the template context dictionary under name pages
         context_dict['pages'] = pages
-
-        # We also add category object from the database to the context dictionary.
+        context_dict['next_cursor'] = next_cursor
+        context_dict['is_first_batch'] = 'after' not in request.GET
+        context_dict['subtree'] = subtree
+        context_dict['trending_pages'] = trending_pages(category.id)
+
+        # Breadcrumbs and subcategories come from the same cache as the sidebar
+        branch = get_branch(category.path)
+        context_dict['ancestors'] = branch.ancestors
+        context_dict['subcategories'] = branch.children
+        if branch.children:
+            context_dict['subtree_totals'] = subtree_totals(category)
+
+        # We also add the category to the context dictionary.
         # We will use this in the template to verify the category exists
         context_dict['category'] = category
 
-    except Category.DoesNotExist:
+    else:
         # We get here if we didn't find the specified category (i.e. - the category name slug requested was invalid)
         # Don't do anything - the template will display "no category" message for us
 
@@ -80,6 +128,82 @@ def show_category(request, category_name_slug):
     return render(request, 'rango/category.html', context=context_dict)
 
 
+def track_url(request):
+    """
+    Count a click-through on a page and redirect the user to the page's URL.
+    The view is recorded in the in-memory counter buffer, so the redirect never waits on a database write.
+    """
+    page_id = request.GET.get('page_id')
+
+    try:
+        url = Page.objects.values_list('url', flat=True).get(pk=page_id)
+    except (Page.DoesNotExist, ValueError):
+        # Missing or malformed page_id - there is nowhere to send the user but the index page
+        return redirect('rango:index')
+
+    track_page_view(page_id)
+    return redirect(url)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    context_dict = {'query': query, 'results': None}
+
+    if query:
+        paginator = Paginator(search_pages(query), getattr(settings, 'RANGO_SEARCH_RESULTS_PER_PAGE', 10))
+        try:
+            context_dict['results'] = paginator.page(request.GET.get('page'))
+        except PageNotAnInteger:
+            # No (or a garbled) page number - show the best results
+            context_dict['results'] = paginator.page(1)
+        except EmptyPage:
+            # Past the end - show the last page of results
+            context_dict['results'] = paginator.page(paginator.num_pages)
+
+    return render(request, 'rango/search.html', context=context_dict)
+
+
+@staff_member_required
+def profiling_stats(request):
+    """
+    Percentiles of the per-view timings and query counts collected by rango.profiling.ProfilingMiddleware, along with
+    the number of requests rango.ratelimit.RateLimitMiddleware let through or turned away. POST to clear them.
+    """
+    if request.method == 'POST':
+        profiling.stats.reset()
+        ratelimit.stats.reset()
+
+    return JsonResponse({'enabled': getattr(settings, 'RANGO_PROFILING', False),
+                         'views': profiling.stats.summary(),
+                         'rate_limits': ratelimit.stats.summary()})
+
+
+@staff_member_required
+@require_safe
+def export_data(request, name):
+    """
+    Stream categories or pages as ?format=csv (the default) or jsonl, gzipped with ?gzip=1, only those modified after
+    ?since= when given. The X-Rango-Watermark header holds the ?since= of the next incremental export.
+    """
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in ENCODERS:
+        return JsonResponse({'error': 'Unknown format, expected one of: %s.' % ', '.join(sorted(ENCODERS))},
+                            status=400)
+
+    try:
+        since = parse_watermark(request.GET['since']) if request.GET.get('since') else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    compress = request.GET.get('gzip') == '1'
+    until = export_until()
+    response = StreamingHttpResponse(export(name, file_format, since, until, compress),
+                                     content_type='application/gzip' if compress else CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = 'attachment; filename="%s"' % export_filename(name, file_format, compress, until)
+    response['X-Rango-Watermark'] = until.isoformat()
+    return response
+
+
 """
 All view functions defined as part of a Django application must take at least one parameter. This is typically called
 request and provides access to information related to the given HTTP request made by the user.
@@ -90,7 +214,7 @@ That is why our show_category() view was defined as def show_category(request, c
 
 @login_required
 def add_category(request):
-    form = CategoryForm()
+    form = CategoryForm(initial={'parent': request.GET.get('parent')})
 
     # A HTTP POST?
     if request.method == 'POST':
@@ -100,12 +224,16 @@ def add_category(request):
 
         if form.is_valid():
             # Save the new category to the database
-            form.save(commit=True)
+            category = form.save(commit=True)
 
             # Now that the category is saved, we could give a confirmation message
             # But since the most recent category added is on the index page
-            # Then we can direct the user back to the index page
-            return index(request)
+            # Then we can direct the user back to the index page.
+            # Redirecting (rather than rendering the index page here) means a refresh doesn't post the form again
+            if category.parent_id is not None:
+                # A subcategory shows up on its parent's page
+                return redirect('rango:show_category', category_name_slug=category.parent.slug)
+            return redirect('rango:index')
 
         else:
             # The supplied form contained errors
@@ -119,10 +247,11 @@ def add_category(request):
 
 @login_required
 def add_page(request, category_name_slug):
-    try:
-        category = Category.objects.get(slug=category_name_slug)
-    except Category.DoesNotExist:
-        category = None
+    category = resolve_category(category_name_slug)
+
+    if category is not None and category.slug != category_name_slug and request.method == 'GET':
+        # The category has been renamed since
+        return redirect('rango:add_page', category_name_slug=category.slug, permanent=True)
 
     form = PageForm()
 
@@ -134,10 +263,11 @@ def add_page(request, category_name_slug):
         if form.is_valid():
             if category:
                 page = form.save(commit=False)
-                page.category = category
+                page.category_id = category.id
                 page.views = 0
                 page.save()
-            return show_category(request, category_name_slug)
+            # Redirect, so that a refresh of the category page doesn't post the form again
+            return redirect('rango:show_category', category_name_slug=category_name_slug)
         else:
             print form.errors
 
@@ -148,6 +278,57 @@ def add_page(request, category_name_slug):
     return render(request, 'rango/add_page.html', context=context_dict)
 
 
+@login_required
+def add_pages(request, category_name_slug):
+    """
+    Add several pages to a category at once, either from a form with a row per page or from a JSON list of
+    {"title": ..., "url": ...} objects. Unless every page is valid, none is added; otherwise they are all inserted
+    with a single bulk_create.
+    """
+    category = resolve_category(category_name_slug)
+    wants_json = request.META.get('CONTENT_TYPE', '').startswith('application/json')
+
+    if wants_json:
+        if category is None:
+            return JsonResponse({'error': 'No such category.'}, status=404)
+        if request.method != 'POST':
+            return JsonResponse({'error': 'POST a list of pages.'}, status=405)
+        return add_pages_from_json(request, category)
+
+    formset = PageFormSet()
+
+    if category and request.method == 'POST':
+        formset = PageFormSet(request.POST)
+
+        if formset.is_valid():
+            # The rows left blank are skipped
+            insert_pages(category.id, [dict(form.cleaned_data, views=0) for form in formset if form.has_changed()])
+            return redirect('rango:show_category', category_name_slug=category.slug)
+
+    return render(request, 'rango/add_pages.html', context={'formset': formset, 'category': category})
+
+
+def add_pages_from_json(request, category):
+    try:
+        entries = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        return JsonResponse({'error': 'The request body is not valid JSON.'}, status=400)
+
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        return JsonResponse({'error': 'Expected a list of {"title": ..., "url": ...} objects.'}, status=400)
+
+    if len(entries) > PageFormSet.max_num:
+        return JsonResponse({'error': 'At most %d pages can be added at once.' % PageFormSet.max_num}, status=400)
+
+    page_forms = [PageForm(dict(entry, views=0), check_duplicates=False) for entry in entries]
+    check_duplicate_urls([form for form in page_forms if form.is_valid()])
+    errors = dict((index, form.errors) for index, form in enumerate(page_forms) if form.errors)
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    return JsonResponse({'added': insert_pages(category.id, [form.cleaned_data for form in page_forms])}, status=201)
+
+
 # def register(request):
 #     # A boolean value "registered" for telling the template whether the registration was successful.
 #     # Set to False initially. Code changes value to True when the registration succeeds.
@@ -305,57 +486,6 @@ def restricted(request):
 #     return HttpResponseRedirect(reverse('rango:index'))
 
 
-# A helper method
-def get_server_side_cookie(request, cookie, default_val=None):
-    val = request.session.get(cookie)
-
-    if not val:
-        val = default_val
-    return val
-
-
-# Update function definition to use server side storage of user information
-def visitor_cookie_handler(request):
-    """
-    This is not a view since it doesn't return a response.
-    This is simply a helper function that will be called inside index() view
-
-    # Get the number of visits to the site.
-    # We use the COOKIES.get() function to obtain the visits cookie.
-    # If the cookie exists, the value returned is casted to an integer.
-    # If the cookie doesn't exist, then the default value of 1 is used.
-    # We than use last_visit cookie value to see the last visit datetime, if it doesn't exist we return current
-    datetime to current datetime hence set last_visit as current datetime
-    # We use last_visit_time to store last visit time
-    """
-
-    # Cookie values are returned as strings, hence casting it to an integer
-    visits = int(get_server_side_cookie(request, 'visits', '1'))
-
-    # if datetime.now() is datetime.datetime(2017, 1, 26, 8, 23, 12, 849111)
-    # str(datetime.now()) will be 2017-01-26 08:23:12.849111
-    # last_visit_time will be datetime.datetime(2017, 1, 26, 8, 23, 12)
-    last_visit_cookie = get_server_side_cookie(request, 'last_visit', str(datetime.now()))
-    last_visit_time = datetime.strptime(last_visit_cookie[:-7], '%Y-%m-%d %H:%M:%S')
-
-    # If it's been more than a day since the last visit...
-    # For testing purpose, change days to seconds in next line so that the counter updates after every second and you
-    #  do not have to wait for a day to see incrementing value of visits cookie.
-    if (datetime.now() - last_visit_time).days > 0:
-        visits += 1
-
-        # Update the last visit cookie now that we have updated the count
-        request.session['last_visit'] = str(datetime.now())
-    else:
-        visits = 1
-
-        # Set the last visit cookie
-        request.session['last_visit'] = last_visit_cookie
-
-    # Update / set the visits cookie
-    request.session['visits'] = visits
-
-
 # Create a new class that redirects the user to the index page if successful at logging in
 class MyRegistrationView(RegistrationView):
     def get_success_url(self, user=None):
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.9/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -55,30 +56,42 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'rango.profiling.ProfilingMiddleware',
+    'rango.db_router.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
+    'rango.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'rango.middleware.VisitTrackerMiddleware',
 ]
 
 ROOT_URLCONF = 'tango_django_project.urls'
 
+template_loaders = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATE_DIR, ],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Outside of DEBUG, templates are compiled once per process and kept in memory, so template changes need
+            # a restart to show up
+            'loaders': template_loaders if DEBUG else [('django.template.loaders.cached.Loader', template_loaders)],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.media',
+                'rango.context_processors.fragment_cache',
             ],
         },
     },
@@ -94,9 +107,166 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Keep connections open across requests; those the server dropped are replaced at the start of the next
+        # request (see rango.db_router.check_connections)
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Persistent connections that haven't been opened or checked for this many seconds are pinged at the start of a
+# request, and replaced if the database server dropped them. Keep it below the server's idle timeout.
+RANGO_DB_HEALTH_CHECK_IDLE = 30
+
+# Read-only queries of the index and category pages and of the category sidebar may be served by read replicas (see
+# rango/db_router.py). List their aliases in RANGO_READ_REPLICAS, after adding them to DATABASES, e.g.
+#
+#     'replica': {
+#         'ENGINE': 'django.db.backends.sqlite3',
+#         'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+#         'CONN_MAX_AGE': 60,
+#         'TEST': {'MIRROR': 'default'},
+#     },
+#
+# After writing, a client reads from the primary for RANGO_REPLICA_PIN_SECONDS, which should cover the replication lag.
+DATABASE_ROUTERS = ['rango.db_router.ReadReplicaRouter']
+RANGO_READ_REPLICAS = []
+RANGO_REPLICA_PIN_SECONDS = 5
+
+
+# Caching
+# https://docs.djangoproject.com/en/1.9/topics/cache/
+# The local-memory cache lives inside each process, so signal-driven invalidation only reaches the process that saved
+# the model. When running several workers, point this at a shared backend (e.g. memcached) instead.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rango',
+    }
+}
+
+# Sessions are kept in the database. Run `python manage.py purge_sessions` periodically to delete expired sessions.
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
+# With a cache shared by every process, sessions can be read from it (and written through to the database), and the
+# logged-in user and their profile kept in it for RANGO_USER_CACHE_TIMEOUT seconds (see rango/auth_backends.py), so
+# that a request only queries the session and user tables when they aren't cached, e.g.
+#
+#     CACHES['sessions'] = {
+#         'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+#         'LOCATION': '127.0.0.1:11211',
+#     }
+#     SESSION_CACHE_ALIAS = 'sessions'
+#     SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+#     AUTHENTICATION_BACKENDS = ['rango.auth_backends.CachedModelBackend']
+#
+# A local-memory cache would let a session or user outlive a logout, deactivation or password change made through
+# another process, so manage.py refuses to start with one (see rango/checks.py).
+SESSION_CACHE_ALIAS = 'default'
+RANGO_USER_CACHE_TIMEOUT = 300
+
+# How long (in seconds) the rendered sidebar entries of the children of a category are cached before being rebuilt
+RANGO_SIDEBAR_CACHE_TIMEOUT = 300
+
+# How long (in seconds) the totals of a category's subtree (see rango/hierarchy.py) are cached. Adding, moving or
+# removing categories and pages drops them straight away; view counts may lag by up to this long.
+RANGO_SUBTREE_CACHE_TIMEOUT = 300
+
+# How long (in seconds) the fragments of base.html cached with {% cache %} - the navigation links and the sidebar - are
+# kept. The sidebar fragments are keyed by the sidebar's version, so they are dropped as soon as categories change.
+RANGO_FRAGMENT_CACHE_TIMEOUT = 300
+
+# Buffered view and like counters are written to the database once this many increments have been collected, or once
+# this many seconds have passed since the last write, whichever comes first
+RANGO_COUNTER_FLUSH_THRESHOLD = 500
+RANGO_COUNTER_FLUSH_INTERVAL = 10
+
+# Rate limits of the views that write (see rango/ratelimit.py): view name -> (burst, seconds), i.e. at most burst POSTs
+# in a row per user (or IP address, when not logged in), then one more every seconds / burst seconds. The buckets are
+# kept in each process ('local') or in the shared cache ('cache'). The local store holds about
+# RANGO_RATE_LIMIT_LOCAL_MAX_KEYS buckets (one per view and client) before dropping those that have filled up again.
+RANGO_RATE_LIMITS = {
+    'rango:add_category': (10, 60),
+    'rango:add_page': (30, 60),
+    'rango:add_pages': (10, 60),
+    'registration_register': (5, 3600),
+}
+RANGO_RATE_LIMIT_STORE = 'local'
+RANGO_RATE_LIMIT_LOCAL_MAX_KEYS = 100000
+
+# Most pages a curator can add to a category in one go (see the add_pages view)
+RANGO_BULK_ADD_MAX_PAGES = 100
+
+# Category slugs are resolved from the cache (see rango/slugs.py): at most this many are also kept inside each process,
+# for this many seconds - which is how long a rename or deletion may take to be noticed by the other processes
+RANGO_SLUG_CACHE_SIZE = 1000
+RANGO_SLUG_CACHE_LOCAL_TIMEOUT = 30
+
+# Rows read from the database at a time by the streaming exports (see rango/export.py), and how many seconds the end
+# of an export lags behind its start, so that rows written by transactions still open then make it into the next one.
+# Keep it above the duration of the longest write transaction, such as a load_rango batch.
+RANGO_EXPORT_CHUNK_SIZE = 1000
+RANGO_EXPORT_GRACE = 60
+
+# Number of pages listed per batch on a category page
+RANGO_PAGES_PER_PAGE = 20
+
+# Number of entries in the most liked categories / most viewed pages leaderboards shown on the index page, and how long
+# (in seconds) they are cached before being rebuilt. Within a process they are kept current as counters are flushed;
+# with a per-process cache such as the default one, this is how long other processes may show outdated entries.
+RANGO_LEADERBOARD_SIZE = 5
+RANGO_LEADERBOARD_TIMEOUT = 60
+
+# Trending rankings (see rango/trending.py). Views and likes are kept per hour for RANGO_TRENDING_HOURLY_RETENTION
+# hours, then per day for RANGO_TRENDING_DAILY_RETENTION days. Scores cover the last RANGO_TRENDING_WINDOW days, with
+# activity counting half as much for every RANGO_TRENDING_HALF_LIFE hours of age, and a like as much as
+# RANGO_TRENDING_LIKE_WEIGHT views. Run `compact_activity` and `compute_trending` periodically, e.g. hourly. The
+# rankings are cached for RANGO_TRENDING_CACHE_TIMEOUT seconds, which is how long the server may keep showing the
+# previous ones when its cache isn't shared with the process running `compute_trending`.
+RANGO_TRENDING_HOURLY_RETENTION = 48
+RANGO_TRENDING_DAILY_RETENTION = 90
+RANGO_TRENDING_WINDOW = 7
+RANGO_TRENDING_HALF_LIFE = 24
+RANGO_TRENDING_LIKE_WEIGHT = 5
+RANGO_TRENDING_CACHE_TIMEOUT = 300
+
+# How long (in seconds) the index, about and category pages rendered for anonymous visitors are served from the cache.
+# Saving a category or page purges the affected entries straight away; view counts may lag by up to this long.
+RANGO_RESPONSE_CACHE_TIMEOUT = 600
+
+# Search: how many of the best text matches are re-ranked by views, how strongly views count in that ranking, and how
+# many results are listed per page
+RANGO_SEARCH_MAX_RESULTS = 200
+RANGO_SEARCH_VIEWS_WEIGHT = 0.1
+RANGO_SEARCH_RESULTS_PER_PAGE = 10
+
+# Request profiling (see rango/profiling.py). When enabled, per-view timings, query counts and cache hits are collected
+# and shown to staff at /rango/_stats/. A view issuing more queries than its budget logs a warning, or fails the request
+# when RANGO_QUERY_BUDGET_STRICT is set (meant for test runs).
+RANGO_PROFILING = False
+RANGO_PROFILING_SAMPLES = 1000
+RANGO_QUERY_BUDGET_STRICT = False
+RANGO_QUERY_BUDGETS = {
+    'rango:index': 6,
+    'rango:about': 2,
+    'rango:show_category': 5,
+    'rango:add_category': 8,
+    'rango:add_page': 12,
+    'rango:add_pages': 12,
+    'rango:search': 4,
+    'rango:api_categories': 1,
+    'rango:api_category': 2,
+    'rango:api_top_pages': 1,
+}
+
+# Link checking (see rango/linkcheck.py and the check_links command): how many URLs are fetched at the same time, how
+# long (in seconds) to wait for each server, how long a result stays fresh before the URL is checked again, and how
+# many results are written per transaction
+RANGO_LINK_CHECK_CONCURRENCY = 10
+RANGO_LINK_CHECK_TIMEOUT = 10
+RANGO_LINK_CHECK_MAX_AGE = 24 * 60 * 60
+RANGO_LINK_CHECK_BATCH_SIZE = 200
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
@@ -135,9 +305,27 @@ USE_TZ = True
 MEDIA_ROOT = MEDIA_DIR
 MEDIA_URL = '/media/'
 
+# Downsized variants rendered for every uploaded profile picture (largest side, in pixels), and the number of worker
+# threads rendering them
+RANGO_PROFILE_IMAGE_VARIANTS = {
+    'thumb': 64,
+    'small': 160,
+    'medium': 480,
+}
+RANGO_IMAGE_WORKERS = 2
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/1.9/howto/static-files/
 
 STATIC_URL = '/static/'
-STATICFILES_DIRS = [STATIC_DIR, ]
\ No newline at end of file
+STATICFILES_DIRS = [STATIC_DIR, ]
+
+# collectstatic fingerprints each file with its content hash and writes gzip (and, when the brotli package is
+# installed, brotli) copies next to it; outside of DEBUG, tango_django_project.wsgi serves them from STATIC_ROOT
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'rango.storage.CompressedManifestStaticFilesStorage'
+
+# Whether {% static %} refuses files missing from the collectstatic manifest, rather than linking to their plain,
+# unfingerprinted names. Only DEBUG and the test suite, which run without collecting the static files, may fall back.
+RANGO_STATIC_MANIFEST_STRICT = not DEBUG and sys.argv[1:2] != ['test']
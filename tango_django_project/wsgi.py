@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tango_django_project.settings")
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if not settings.DEBUG:
+    # Serve the collected static files, compressed and cached for good when fingerprinted, without going through Django
+    from rango.static_server import StaticFilesWSGIMiddleware  # noqa: E402
+    application = StaticFilesWSGIMiddleware(application)